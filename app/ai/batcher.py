@@ -0,0 +1,123 @@
+"""Micro-batching of zero-shot classification calls to the inference API.
+
+Zero-shot models (``facebook/bart-large-mnli``) accept a list of inputs per
+request, but every ``classify_email`` used to send one HTTP request per
+email. ``MicroBatcher.submit`` queues an item under a group key (endpoint +
+model) and returns a future. A group is sent as one batch when it reaches
+``max_batch`` items or when its oldest item has waited ``max_wait`` seconds;
+the results are fanned back out to the waiting futures in order.
+
+Batches are sent from a small thread pool, so a slow batch does not hold up
+the next one. A send failure fails every future of that batch.
+
+Configuration (environment):
+    HF_BATCH_SIZE      max items per request (default 16; 1 disables batching)
+    HF_BATCH_WAIT_MS   max time an item waits for company (default 10)
+    HF_BATCH_MODELS    comma-separated models that accept batched inputs
+                       (default: every model with "mnli" in its name)
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SendFn = Callable[[Hashable, List[Any]], Sequence[Any]]
+
+
+class MicroBatcher:
+    def __init__(self, send: SendFn, max_batch: int = 16, max_wait: float = 0.01, workers: int = 4) -> None:
+        self.send = send
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait))
+        self.workers = max(1, int(workers))
+        self.batches = 0
+        self.items = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        # (re)built lazily in each process: threads do not survive a fork
+        self._cond = threading.Condition()
+        self._pending: Dict[Hashable, List[Tuple[Any, "Future[Any]"]]] = {}
+        self._deadlines: Dict[Hashable, float] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+
+    def submit(self, key: Hashable, item: Any) -> "Future[Any]":
+        if self._pid != os.getpid():
+            self._reset()
+        future: "Future[Any]" = Future()
+        with self._cond:
+            pending = self._pending.setdefault(key, [])
+            if not pending:
+                self._deadlines[key] = time.monotonic() + self.max_wait
+            pending.append((item, future))
+            if len(pending) >= self.max_batch:
+                self._dispatch(key)
+            else:
+                self._ensure_thread()
+                self._cond.notify()
+        return future
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="hf-batcher", daemon=True)
+            self._thread.start()
+
+    def _dispatch(self, key: Hashable) -> None:
+        # caller holds self._cond
+        batch = self._pending.pop(key)
+        self._deadlines.pop(key, None)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hf-batch")
+        self.batches += 1
+        self.items += len(batch)
+        self._executor.submit(self._run, key, batch)
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                for key in [k for k, deadline in self._deadlines.items() if deadline <= now]:
+                    self._dispatch(key)
+                timeout = min(self._deadlines.values()) - now if self._deadlines else None
+                self._cond.wait(timeout)
+
+    def _run(self, key: Hashable, batch: List[Tuple[Any, "Future[Any]"]]) -> None:
+        # callers that gave up (e.g. a hedged attempt that lost) are left out of the request
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.send(key, [item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"batch of {len(batch)} items returned {len(results)} results")
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        return {"batches": self.batches, "items": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0}
+
+
+def batch_models() -> Optional[List[str]]:
+    """Models configured for batching, or None for the default (MNLI models)."""
+    raw = os.environ.get("HF_BATCH_MODELS", "").strip()
+    if not raw:
+        return None
+    return [m.strip() for m in raw.split(",") if m.strip()]
+
+
+def supports_batching(model: str) -> bool:
+    if int(os.environ.get("HF_BATCH_SIZE", "16")) <= 1:
+        return False
+    models = batch_models()
+    return "mnli" in model.lower() if models is None else model in models
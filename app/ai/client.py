@@ -2,19 +2,375 @@ from dotenv import load_dotenv
 import json
 import requests
 import os
+import asyncio
 import concurrent.futures
-import functools
 import builtins
-from typing import Any, cast
+import functools
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union, cast
+from urllib3.exceptions import ReadTimeoutError
 from app.nlp.classifier import classify_email as nlp_classify_email
+from app.nlp.compaction import compact_prompt
+from app.ai import health, hedge
+from app.ai.batcher import MicroBatcher, supports_batching
+from app.ai.deadline import Deadline
+from app.ai.neardup import get_neardup_index
+from app.ai.scheduler import LLMSaturated, bulk, current_priority, get_scheduler
+from app.ai.session import call_budget, get_session
+from app.ai.singleflight import get_singleflight
+from app.utils import metrics
+from app.utils.cache import TTLCache, TieredCache, make_cache
 import bleach
 
 load_dotenv() 
 
-class AIClient:
-    from typing import Optional
+logger = logging.getLogger(__name__)
+
+# Cache de respostas do LLM entre requisições (a mesma notificação enlatada chega
+# o dia todo e cada chamada é paga). Chave: operação + endpoint + modelo + hash do
+# payload (prompt e parâmetros); só respostas bem-sucedidas entram no cache.
+# LLM_CACHE_SIZE=0 desativa; LLM_CACHE_PATH adiciona um arquivo SQLite que
+# sobrevive a reinícios e é compartilhado pelos workers.
+_llm_cache: Optional[Union[TTLCache, TieredCache]] = None
+_llm_cache_configured = False
+_llm_cache_lock = threading.Lock()
+
+
+def _get_llm_cache() -> Optional[Union[TTLCache, TieredCache]]:
+    global _llm_cache, _llm_cache_configured
+    if not _llm_cache_configured:
+        with _llm_cache_lock:
+            if not _llm_cache_configured:
+                try:
+                    size = int(os.environ.get("LLM_CACHE_SIZE", "1024"))
+                    ttl = float(os.environ.get("LLM_CACHE_TTL", "86400"))
+                    path = os.environ.get("LLM_CACHE_PATH") or None
+                    _llm_cache = make_cache(size, ttl, path) if size > 0 else None
+                except Exception:
+                    logger.exception("invalid LLM cache settings; cache disabled")
+                    _llm_cache = None
+                _llm_cache_configured = True
+    return _llm_cache
+
+
+def configure_llm_cache(maxsize: int = 1024, ttl: float = 86400.0, path: Optional[str] = None) -> None:
+    """Substitui o cache de respostas do LLM (maxsize=0 desativa)."""
+    global _llm_cache, _llm_cache_configured
+    _llm_cache = make_cache(maxsize, ttl, path) if maxsize > 0 else None
+    _llm_cache_configured = True
+
+
+def clear_llm_cache() -> None:
+    cache = _get_llm_cache()
+    if cache is not None:
+        cache.clear()
+
+
+def llm_cache_stats() -> Dict[str, object]:
+    """Contadores de acerto/erro do cache de respostas do LLM."""
+    cache = _get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+def _llm_cache_key(op: str, api_base: str, model: str, payload: Dict[str, Any]) -> str:
+    # o token não entra na chave: a resposta depende só do modelo e do payload
+    raw = json.dumps([op, api_base.rstrip("/"), model, payload], sort_keys=True, ensure_ascii=False)
+    return "llm:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _classification_payload(prompt: str, model_name: str) -> Dict[str, Any]:
+    # Caso especial: modelos zero-shot (ex.: facebook/bart-large-mnli) que
+    # esperam `inputs` como string e `parameters` contendo `candidate_labels`.
+    # Para modelos zero-shot / MNLI prefere-se um dict de inputs com chave `text`.
+    if "bart-large-mnli" in model_name or "mnli" in model_name:
+        return {"inputs": {"text": prompt}, "parameters": {"candidate_labels": ["Produtivo", "Improdutivo"]}}
+    return {"inputs": prompt, "options": {"wait_for_model": True}}
+
+
+def _classification_prompt(email_content: str) -> str:
+    return f"Classifique o seguinte email como 'Produtivo' ou 'Improdutivo':\n\n{email_content}"
+
+
+def _local_classification(email_content: str, source: str = "local_fallback") -> str:
+    try:
+        return _dbg_wrap(nlp_classify_email(email_content), source)
+    except Exception:
+        return _dbg_wrap("Unknown", "hf")
+
+
+def _classification_request(prompt_text: str, model_name: str) -> Dict[str, Any]:
+    # `prompt_text` já vem compactado (compact_prompt), uma vez por chamada pública
+    # modelos MNLI recebem só o texto normalizado; os demais, a instrução completa
+    if "bart-large-mnli" in model_name or "mnli" in model_name:
+        return _classification_payload(" ".join(prompt_text.split()).strip(), model_name)
+    return _classification_payload(_classification_prompt(prompt_text), model_name)
+
+
+def _cached_answer(op: str, api_base: str, candidates: List[str], payload_for: Callable[[str], Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+    """(modelo, resposta) já guardada no cache do LLM para algum dos candidatos."""
+    cache = _get_llm_cache()
+    if cache is None:
+        return None
+    for model in candidates:
+        cached = cache.get(_llm_cache_key(op, api_base, model, payload_for(model)))
+        if cached is not None:
+            return model, cached
+    return None
+
+
+def _classification_candidates(hf_model: str) -> List[str]:
+    # sensible hosted fallbacks recommended: BART MNLI for zero-shot and Llama instruct models
+    return [hf_model] + [m for m in ("facebook/bart-large-mnli", "meta-llama/Llama-3.1-8B-Instruct", "meta-llama/Llama-3.1-70B-Instruct") if m != hf_model]
+
+
+def _classification_label(text: Optional[str]) -> Optional[str]:
+    """Etiqueta reconhecida na saída do modelo, ou None quando a saída não serve."""
+    text = (text or "").strip()
+    lowered = text.lower()
+    if "improdut" in lowered or "improd" in lowered:
+        return "Improdutivo"
+    if "produt" in lowered:
+        return "Produtivo"
+    if any(tok in lowered for tok in ("entailment", "contradiction", "neutral", "produtivo", "improdutivo")):
+        return text or "Unknown"
+    return None
+
+
+def _generation_payload(category: str, original_text: str) -> Dict[str, Any]:
+    prompt = f"Categoria: {category}\nEmail: {original_text}\nGere uma resposta breve e adequada."
+    return {"inputs": prompt, "options": {"wait_for_model": True}}
+
+
+def _generation_candidates(hf_model: str) -> List[str]:
+    # try configured model first, then a short fallback list of reasonable hosted candidates
+    # Note: zero-shot MNLI models (facebook/bart-large-mnli) are for classification only
+    # and should not be used for text generation; skip them in the generation path.
+    raw_fallbacks = ("facebook/bart-large-mnli", "meta-llama/Llama-3.1-8B-Instruct", "meta-llama/Llama-3.1-70B-Instruct", "autoevaluate/natural-language-inference")
+    candidates = [hf_model] + [m for m in raw_fallbacks if m != hf_model]
+    return [m for m in candidates if "mnli" not in m.lower()]
+
+
+def _generated_text(body: Any) -> str:
+    if isinstance(body, list) and body:
+        first_item = cast(dict[str, Any], body[0])
+        text = first_item.get("generated_text") or first_item.get("text") or builtins.str(first_item)
+    elif isinstance(body, dict) and ("generated_text" in body or "text" in body):
+        body_dict = cast(dict[str, Any], body)
+        gen = body_dict.get("generated_text") or body_dict.get("text")
+        text = builtins.str(gen) if gen is not None else builtins.str(body_dict)
+    else:
+        text = builtins.str(cast(object, body))
+    return (text or "").strip()
+
+
+def _stream_chunks(response: requests.Response) -> Iterator[str]:
+    """Texto incremental de uma resposta em streaming do backend de inferência.
+
+    Aceita SSE no formato do text-generation-inference (`{"token": {"text": ...}}`)
+    e no formato compatível com OpenAI (`choices[0].delta.content`), texto puro
+    em chunks e, para backends sem streaming, o JSON completo de uma vez.
+    """
+    content_type = response.headers.get("Content-Type", "")
+    if "text/event-stream" in content_type:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            event = json.loads(data)
+            if isinstance(event, dict) and "error" in event:
+                raise RuntimeError(f"stream error: {event['error']}")
+            token = event.get("token") if isinstance(event, dict) else None
+            if isinstance(token, dict):
+                if not token.get("special"):
+                    yield builtins.str(token.get("text") or "")
+                continue
+            choices = event.get("choices") if isinstance(event, dict) else None
+            if isinstance(choices, list) and choices:
+                choice = cast(dict[str, Any], choices[0])
+                delta = choice.get("delta")
+                text = delta.get("content") if isinstance(delta, dict) else choice.get("text")
+                if text:
+                    yield builtins.str(text)
+    elif "json" in content_type:
+        yield _generated_text(response.json())
+    else:
+        response.encoding = response.encoding or "utf-8"
+        for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+            if chunk:
+                yield chunk
+
+
+def _classification_text(body: Any) -> str:
+    """Texto da saída de classificação do HF (rótulo do zero-shot ou texto gerado)."""
+    # If zero-shot classification output (labels + scores)
+    if isinstance(body, dict) and "labels" in body:
+        # Treat the JSON body as a typed dict for safe .get() usage
+        body_dict = cast(dict[str, Any], body)
+        # Be explicit about the expected type: coerce/validate into a list[str]
+        raw_labels: Any = body_dict.get("labels", [])
+        labels: list[str] = []
+        # Normalize and validate labels to be a list of strings
+        if isinstance(raw_labels, list):
+            for item in cast(list[Any], raw_labels):
+                if isinstance(item, str):
+                    labels.append(item)
+                else:
+                    # Coerce non-string items to string to keep a predictable type
+                    try:
+                        # Use builtins.str() to coerce items into a string (explicit for type checkers)
+                        labels.append(builtins.str(cast(object, item)))
+                    except Exception:
+                        # Skip items that cannot be represented
+                        continue
+        elif isinstance(raw_labels, str):
+            # single-label string provided
+            labels.append(raw_labels)
+        # otherwise ignore unexpected types
+        if labels:
+            top = labels[0]
+            # top is guaranteed to be a string here
+            return top
+    # Common generation formats
+    if isinstance(body, list) and body:
+        first: Any = cast(list[Any], body)[0]
+        # Only call .get on actual dict objects to satisfy type checkers
+        if isinstance(first, dict):
+            # Cast to a typed dict so .get has a known signature for the type checker
+            first_dict = cast(dict[str, Any], first)
+            gen = first_dict.get("generated_text") or first_dict.get("text")
+            if gen is not None:
+                return builtins.str(gen)
+            return builtins.str(cast(object, first))
+        # Non-dict items: stringify
+        return builtins.str(cast(object, first))
+    if isinstance(body, dict) and "generated_text" in body:
+        # Prefer generated_text or text fields, coerce to str and avoid returning None
+        body_dict = cast(dict[str, Any], body)
+        gen = body_dict.get("generated_text") or body_dict.get("text")
+        if gen is not None:
+            return builtins.str(gen)
+        # Fallback to stringifying the whole body to satisfy the declared return type
+        return builtins.str(body_dict)
+    return builtins.str(cast(object, body))
+
+
+def _canned_reply(category: str) -> str:
+    # Fallback canned replies when HF is not available or fails
+    if category == "Produtivo":
+        return "Obrigado pelo contato. Recebi sua mensagem e vou analisar/acionar o responsável. Retorno em breve com uma atualização."
+    return "Agradeço a mensagem. Registro-a e, caso seja necessário, entrarei em contato. Desejo um ótimo dia."
+
+
+def _failure_outcome(exc: BaseException) -> str:
+    if isinstance(exc, (requests.Timeout, asyncio.TimeoutError, concurrent.futures.TimeoutError)):
+        return "timeout"
+    # com o Retry do urllib3 um read timeout chega como ConnectionError(MaxRetryError)
+    reason = getattr(exc.args[0] if exc.args else None, "reason", None)
+    if isinstance(exc, requests.ConnectionError) and isinstance(reason, ReadTimeoutError):
+        return "timeout"
+    response = getattr(exc, "response", None)
+    if isinstance(exc, requests.HTTPError) and response is not None and response.status_code == 404:
+        return "not_found"
+    return "error"
+
+
+def _attempt_outcome(exc: BaseException, timeout: float, cap: float) -> str:
+    # um timeout encurtado pelo orçamento da requisição não é culpa do modelo
+    outcome = _failure_outcome(exc)
+    return "deadline" if outcome == "timeout" and timeout < cap else outcome
+
+
+def _schedule(op: str, model: str, fn: Callable[..., Any], *args: Any,
+              priority: Optional[int] = None) -> "concurrent.futures.Future[Any]":
+    """Entrega a chamada ao agendador do processo; fila cheia ou limite de taxa -> LLMSaturated."""
+    try:
+        return get_scheduler().submit(model, fn, *args, priority=priority)
+    except LLMSaturated:
+        metrics.count_llm_request(op, model, "saturated")
+        raise
+
+
+def _close_when_done(future: "concurrent.futures.Future[Any]") -> None:
+    """Fecha a resposta em streaming que um futuro abandonado ainda vier a devolver (libera a conexão do pool)."""
+    if not future.cancel():
+        future.add_done_callback(
+            lambda f: not f.cancelled() and f.exception() is None and f.result() is not None and f.result().close())
+
+
+def _report(op: str, model: str, outcome: str, latency: Optional[float] = None) -> None:
+    """Conta o resultado da chamada e alimenta o histórico de saúde do modelo."""
+    metrics.count_llm_request(op, model, outcome)
+    if outcome in ("cache_hit", "cancelled", "deadline", "saturated"):
+        return  # não diz nada sobre a saúde do modelo
+    health.get_tracker().record(model, outcome == "ok", latency if outcome == "ok" else None,
+                                hard=outcome == "not_found")
+
+
+_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def _send_classification_batch(key: Any, items: List[Tuple[Dict[str, Any], Deadline, int]]) -> List[str]:
+    # o lote junta chamadas de qualquer AIClient: só endpoint, modelo e token definem a requisição,
+    # que sai pela sessão do processo
+    _, api_base, model_name, token = key
+    # a requisição inteira respeita o prazo mais curto entre os itens
+    timeout = min(deadline.timeout(float(os.environ.get("HF_TIMEOUT", "12.0"))) for _, deadline, _ in items)
+    # esta thread não herda o contexto de quem chamou: a prioridade veio junto com cada item
+    priority = min(p for _, _, p in items)
+    payloads = [payload for payload, _, _ in items]
+    future = _schedule("classify", model_name, AIClient()._hf_classify_batch, payloads, model_name, api_base, token, timeout,
+                       priority=priority)
+    with metrics.stage_timer("hf_classify_batch"):
+        return future.result()
+
+
+def _get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(_send_classification_batch,
+                                        max_batch=int(os.environ.get("HF_BATCH_SIZE", "16")),
+                                        max_wait=float(os.environ.get("HF_BATCH_WAIT_MS", "10")) / 1000.0,
+                                        workers=int(os.environ.get("LLM_WORKERS", "4")))
+    return _batcher
+
+
+def _async_enabled() -> bool:
+    return os.environ.get("HF_ASYNC", "0") == "1"
 
-    def __init__(self, api_url: str = "https://api.x.ai/v1/chat/completions", api_key: Optional[str] = None) -> None:
+
+def _hedge_delay() -> Optional[float]:
+    # segundos até disparar o próximo candidato; 0 dispara todos juntos, vazio = só em sequência
+    raw = os.environ.get("HF_HEDGE_DELAY", "2.0").strip()
+    return float(raw) if raw else None
+
+
+def _dbg_wrap(text: str, source: str, raw: str | None = None) -> str:
+    """Return text optionally annotated when AI_DBG=1."""
+    if os.environ.get("AI_DBG", "0") != "1":
+        return text
+    parts = [f"src={source}"]
+    if raw and os.environ.get("AI_DBG_RAW", "0") == "1":
+        # include only first 200 chars of raw body (sanitize newlines)
+        sanitized = raw[:200].replace("\n", " ")
+        parts.append(f"raw={sanitized}")
+    return f"{text} ({', '.join(parts)})"
+
+
+class AIClient:
+    def __init__(self, api_url: str = "https://api.x.ai/v1/chat/completions", api_key: Optional[str] = None,
+                 session: Optional[requests.Session] = None) -> None:
+        # sessão HTTP com pool de conexões (keep-alive + retry em 429/503); por padrão a do processo
+        self._session = session
         # Campos legados mantidos por compatibilidade; o cliente agora prefere Hugging Face (HF)
         self.api_url = api_url or os.environ.get("GROK_API_URL", "https://api.x.ai/v1/chat/completions")
         self.api_key = api_key or os.environ.get("GROK_API_KEY")
@@ -23,164 +379,217 @@ class AIClient:
         self.hf_model = os.environ.get("HF_MODEL", "google/flan-t5-large")
         self.hf_api_base = os.environ.get("HF_API_URL", "https://api-inference.huggingface.co/models")
 
-    def classify_email(self, email_content: str) -> str:
+    @property
+    def session(self) -> requests.Session:
+        # resolved per call so a client created before a fork uses the child's pool
+        return self._session or get_session()
+
+    def _post(self, url: str, timeout: float, **kwargs: Any) -> requests.Response:
+        # os retries do urllib3 (e o backoff entre eles) ficam dentro do timeout da tentativa
+        with call_budget(timeout):
+            return self.session.post(url, timeout=timeout, **kwargs)
+
+    def _hf_post_json(self, payload: Dict[str, Any], model_name: str, api_base: str, token: str, timeout: float) -> Any:
+        hf_headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        url = f"{api_base.rstrip('/')}/{model_name}"
+        if os.environ.get("AI_DBG", "0") == "1":
+            try:
+                pretty = json.dumps(payload, ensure_ascii=False)
+            except Exception:
+                pretty = str(payload)
+            print(f"[AI_DBG] HF SEND {url} payload={pretty}")
+
+        r = self._post(url, timeout, headers=hf_headers, json=payload)
+
+        if os.environ.get("AI_DBG", "0") == "1":
+            try:
+                short = r.text if os.environ.get("AI_DBG_RAW", "0") == "1" else r.text[:400]
+            except Exception:
+                short = "<no body>"
+            print(f"[AI_DBG] HF POST {url} -> status={r.status_code} body={short}")
+
+        r.raise_for_status()
+        return r.json()
+
+    # HF inference call (runs on the LLM scheduler); repeated prompts are served by llm_cache
+    def _hf_classify_call(self, payload: Dict[str, Any], model_name: str, api_base: str, token: str, timeout: float) -> str:
+        return _classification_text(self._hf_post_json(payload, model_name, api_base, token, timeout))
+
+    def _hf_classify_batch(self, payloads: List[Dict[str, Any]], model_name: str, api_base: str, token: str, timeout: float) -> List[str]:
+        """Classifica vários e-mails numa só requisição (modelos zero-shot aceitam lista em `inputs`)."""
+        if len(payloads) == 1:
+            return [self._hf_classify_call(payloads[0], model_name, api_base, token, timeout)]
+        inputs = [p["inputs"]["text"] if isinstance(p["inputs"], dict) else p["inputs"] for p in payloads]
+        batch_payload: Dict[str, Any] = {"inputs": inputs}
+        if "parameters" in payloads[0]:
+            batch_payload["parameters"] = payloads[0]["parameters"]
+        body = self._hf_post_json(batch_payload, model_name, api_base, token, timeout)
+        if isinstance(body, list) and len(body) == len(payloads):
+            return [_classification_text(item) for item in cast(list[Any], body)]
+        # o modelo não devolveu um resultado por item: classifica um a um
+        logger.warning("model %s ignored batched inputs; sending %d requests instead", model_name, len(payloads))
+        return [self._hf_classify_call(p, model_name, api_base, token, timeout) for p in payloads]
+
+    def classify_emails(self, emails: List[str]) -> List[str]:
+        """Classifica vários e-mails de uma vez (ex.: uma caixa de entrada inteira).
+
+        As chamadas partem em paralelo, então os modelos zero-shot recebem os
+        textos agrupados pelo micro-batcher em vez de uma requisição por e-mail.
+        No agendador elas têm prioridade de lote: chamadas interativas passam
+        na frente e a fila cheia faz o lote esperar em vez de falhar.
+        """
+        def classify(email: str) -> str:
+            with bulk():
+                return self.classify_email(email)
+
+        if len(emails) <= 1:
+            return [classify(e) for e in emails]
+        workers = min(len(emails), max(1, int(os.environ.get("HF_BATCH_SIZE", "16"))))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(classify, emails))
+
+    def _hf_generate_call(self, model_name: str, payload: Dict[str, Any], timeout: float) -> Optional[str]:
+        """Gera texto com um modelo do HF; None quando o modelo não existe (404)."""
+        hf_url = f"{self.hf_api_base.rstrip('/')}/{model_name}"
+        hf_headers = {"Authorization": f"Bearer {self.hf_token}", "Content-Type": "application/json"}
+        r = self._post(hf_url, timeout, headers=hf_headers, json=payload)
+        if os.environ.get("AI_DBG", "0") == "1":
+            try:
+                short = r.text if os.environ.get("AI_DBG_RAW", "0") == "1" else r.text[:400]
+            except Exception:
+                short = "<no body>"
+            print(f"[AI_DBG] HF POST {hf_url} -> status={r.status_code} body={short}")
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return _generated_text(r.json())
+
+    def _hf_open_stream(self, model_name: str, headers: Dict[str, str], payload: Dict[str, Any],
+                        timeout: float) -> requests.Response:
+        """Abre a resposta em streaming; erros (menos 404) sobem no worker, e um 429 pausa o modelo no agendador."""
+        r = self._post(f"{self.hf_api_base.rstrip('/')}/{model_name}", timeout, headers=headers, json=payload, stream=True)
+        if r.status_code >= 400 and r.status_code != 404:
+            r.close()
+            r.raise_for_status()
+        return r
+
+    def classify_email(self, email_content: str, deadline: Optional[Deadline] = None) -> str:
         """Classifica um e‑mail como 'Produtivo' ou 'Improdutivo'.
 
         Estratégia:
         - Tenta a API de inferência do Hugging Face primeiro (com cache + threadpool).
         - Se o HF expirar ou não estiver disponível, faz fallback para o classificador local.
         - Sempre retorna uma etiqueta curta ou 'Unknown' quando não for possível decidir.
+
+        Com HF_ASYNC=1 os candidatos são disparados em paralelo escalonado
+        (ver `classify_email_async`). Chamadas simultâneas com o mesmo texto
+        compartilham uma única ida ao HF (ver `app.ai.singleflight`).
+
+        `deadline` limita o tempo total da chamada (padrão: LLM_DEADLINE); cada
+        candidato usa só o que resta dele e, esgotado, vale o classificador local.
         """
-        # Caso especial: modelos zero-shot (ex.: facebook/bart-large-mnli) que
-        # esperam `inputs` como string e `parameters` contendo `candidate_labels`.
-        # Para modelos zero-shot / MNLI prefere-se um dict de inputs com chave `text`
-        # (a API de inferência do HF aceita tanto uma string quanto um dict como {"text": "..."}).
-        # HF config
-        hf_token = os.environ.get("HF_API_TOKEN")
+        deadline = deadline or Deadline.from_env()
+        if not os.environ.get("HF_API_TOKEN"):
+            return self._classify_email(email_content, deadline)
         hf_model = os.environ.get("HF_MODEL", "google/flan-t5-large")
         hf_api_base = os.environ.get("HF_API_URL", "https://api-inference.huggingface.co/models")
-        hf_timeout = float(os.environ.get("HF_TIMEOUT", "12.0"))
+        # só as frases mais informativas do e-mail, dentro de LLM_PROMPT_TOKENS (ver app.nlp.compaction)
+        prompt_text = compact_prompt(email_content)
 
-        # Prepare thread pool executor for offloading HF calls (stored on instance)
-        if not hasattr(self, "_hf_executor"):
-            setattr(self, "_hf_executor", concurrent.futures.ThreadPoolExecutor(max_workers=int(os.environ.get("LLM_WORKERS", "2"))))
-        executor = getattr(self, "_hf_executor")
-
-        # Simple LRU cache for HF inference
-        @functools.lru_cache(maxsize=256)
-        def _hf_inference_cached(prompt: str, model_name: str, api_base: str, token: str, timeout: float) -> str:
-            hf_headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-            # Caso especial: modelos zero-shot (ex.: facebook/bart-large-mnli) que
-            # esperam `inputs` como string e `parameters` contendo `candidate_labels`.
-            # Para modelos zero-shot / MNLI prefere-se um dict de inputs com chave `text`.
-            if "bart-large-mnli" in model_name or "mnli" in model_name:
-                payload: dict[str, Any] = {"inputs": {"text": prompt}, "parameters": {"candidate_labels": ["Produtivo", "Improdutivo"]}}
-            else:
-                payload: dict[str, Any] = {"inputs": prompt, "options": {"wait_for_model": True}}
-
-            url = f"{api_base.rstrip('/')}/{model_name}"
-            if os.environ.get("AI_DBG", "0") == "1":
-                try:
-                    pretty = json.dumps(payload, ensure_ascii=False)
-                except Exception:
-                    pretty = str(payload)
-                print(f"[AI_DBG] HF SEND {url} payload={pretty}")
+        def lookup() -> Optional[str]:
+            found = _cached_answer("classify", hf_api_base, _classification_candidates(hf_model),
+                                   lambda m: _classification_request(prompt_text, m))
+            label = _classification_label(found[1]) if found is not None else None
+            return _dbg_wrap(label, "hf", found[1]) if label is not None and found is not None else None
 
-            r = requests.post(url, headers=hf_headers, json=payload, timeout=timeout)
+        key = _llm_cache_key("classify", hf_api_base, hf_model, _classification_request(prompt_text, hf_model))
+        return self._coalesced("classify", hf_model, key, lambda: self._classify_email(email_content, deadline, prompt_text), lookup,
+                               deadline, lambda: _local_classification(email_content))
 
-            if os.environ.get("AI_DBG", "0") == "1":
-                try:
-                    short = r.text if os.environ.get("AI_DBG_RAW", "0") == "1" else r.text[:400]
-                except Exception:
-                    short = "<no body>"
-                print(f"[AI_DBG] HF POST {url} -> status={r.status_code} body={short}")
+    def _coalesced(self, op: str, model: str, key: str, fn: Callable[[], str], lookup: Callable[[], Optional[str]],
+                   deadline: Deadline, fallback: Callable[[], str]) -> str:
+        flight = get_singleflight()
+        if flight is None:
+            return fn()
+        # sem cache do LLM não há resposta a reaproveitar entre workers: só coalesce no processo
+        try:
+            result, shared = flight.do(key, fn, lookup if _get_llm_cache() is not None else None,
+                                       timeout=deadline.remaining())
+        except concurrent.futures.TimeoutError:
+            # a chamada compartilhada não terminou dentro do orçamento desta requisição
+            metrics.count_llm_request(op, model, "deadline")
+            return fallback()
+        if shared:
+            metrics.count_llm_request(op, model, "coalesced")
+        return result
 
-            r.raise_for_status()
-            body: Any = r.json()
-            # If zero-shot classification output (labels + scores)
-            if isinstance(body, dict) and "labels" in body:
-                # Treat the JSON body as a typed dict for safe .get() usage
-                body_dict = cast(dict[str, Any], body)
-                # Be explicit about the expected type: coerce/validate into a list[str]
-                raw_labels: Any = body_dict.get("labels", [])
-                labels: list[str] = []
-                # Normalize and validate labels to be a list of strings
-                if isinstance(raw_labels, list):
-                    for item in cast(list[Any], raw_labels):
-                        if isinstance(item, str):
-                            labels.append(item)
-                        else:
-                            # Coerce non-string items to string to keep a predictable type
-                            try:
-                                # Use builtins.str() to coerce items into a string (explicit for type checkers)
-                                labels.append(builtins.str(cast(object, item)))
-                            except Exception:
-                                # Skip items that cannot be represented
-                                continue
-                elif isinstance(raw_labels, str):
-                    # single-label string provided
-                    labels.append(raw_labels)
-                # otherwise ignore unexpected types
-                if labels:
-                    top = labels[0]
-                    # top is guaranteed to be a string here
-                    return top
-            # Common generation formats
-            if isinstance(body, list) and body:
-                first: Any = cast(list[Any], body)[0]
-                # Only call .get on actual dict objects to satisfy type checkers
-                if isinstance(first, dict):
-                    # Cast to a typed dict so .get has a known signature for the type checker
-                    first_dict = cast(dict[str, Any], first)
-                    gen = first_dict.get("generated_text") or first_dict.get("text")
-                    if gen is not None:
-                        return builtins.str(gen)
-                    return builtins.str(cast(object, first))
-                # Non-dict items: stringify
-                return builtins.str(cast(object, first))
-            if isinstance(body, dict) and "generated_text" in body:
-                # Prefer generated_text or text fields, coerce to str and avoid returning None
-                body_dict = cast(dict[str, Any], body)
-                gen = body_dict.get("generated_text") or body_dict.get("text")
-                if gen is not None:
-                    return builtins.str(gen)
-                # Fallback to stringifying the whole body to satisfy the declared return type
-                return builtins.str(body_dict)
-            return builtins.str(cast(object, body))
-
-        def _dbg_wrap(text: str, source: str, raw: str | None = None) -> str:
-            """Return text optionally annotated when AI_DBG=1."""
-            if os.environ.get("AI_DBG", "0") != "1":
-                return text
-            parts = [f"src={source}"]
-            if raw and os.environ.get("AI_DBG_RAW", "0") == "1":
-                # include only first 200 chars of raw body (sanitize newlines)
-                sanitized = raw[:200].replace("\n", " ")
-                parts.append(f"raw={sanitized}")
-            return f"{text} ({', '.join(parts)})"
+    def _classify_email(self, email_content: str, deadline: Deadline, prompt_text: Optional[str] = None) -> str:
+        if _async_enabled() and os.environ.get("HF_API_TOKEN"):
+            return hedge.run_sync(self.classify_email_async(email_content, deadline, prompt_text))
+        # HF config
+        hf_token = os.environ.get("HF_API_TOKEN")
+        hf_model = os.environ.get("HF_MODEL", "google/flan-t5-large")
+        hf_api_base = os.environ.get("HF_API_URL", "https://api-inference.huggingface.co/models")
+        hf_timeout = float(os.environ.get("HF_TIMEOUT", "12.0"))
+
+        llm_cache = _get_llm_cache()
 
         # Use the configured HF model first, then sensible hosted fallbacks.
         if hf_token:
-            prompt = f"Classifique o seguinte email como 'Produtivo' ou 'Improdutivo':\n\n{email_content}"
-            # sensible hosted fallbacks recommended: BART MNLI for zero-shot and Llama instruct models
-            candidates = [hf_model] + [m for m in ("facebook/bart-large-mnli", "meta-llama/Llama-3.1-8B-Instruct", "meta-llama/Llama-3.1-70B-Instruct") if m != hf_model]
             last_exc = None
-            normalized = " ".join(email_content.split()).strip()
-            for model_try in candidates:
+            prompt_text = compact_prompt(email_content) if prompt_text is None else prompt_text
+            for model_try in health.get_tracker().order(_classification_candidates(hf_model)):
+                if deadline.expired:
+                    metrics.count_llm_request("classify", model_try, "deadline")
+                    break
                 if os.environ.get("AI_DBG", "0") == "1":
                     print(f"[AI_DBG] Trying HF model for classification: {model_try}")
-                model_prompt = normalized if ("bart-large-mnli" in model_try or "mnli" in model_try) else prompt
-                future = executor.submit(_hf_inference_cached, model_prompt, model_try, hf_api_base, hf_token, hf_timeout)
-                try:
-                    text = future.result(timeout=hf_timeout)
-                except concurrent.futures.TimeoutError:
-                    if os.environ.get("AI_DBG", "0") == "1":
-                        print(f"[AI_DBG] HF timeout for model {model_try} after {hf_timeout}s")
-                    last_exc = concurrent.futures.TimeoutError()
-                    continue
-                except Exception as e:
-                    if os.environ.get("AI_DBG", "0") == "1":
-                        print(f"[AI_DBG] HF exception for model {model_try}: {e}")
-                    last_exc = e
-                    continue
+                payload = _classification_request(prompt_text, model_try)
+                cache_key = _llm_cache_key("classify", hf_api_base, model_try, payload)
+                cached = llm_cache.get(cache_key) if llm_cache is not None else None
+                if cached is not None:
+                    text, ok, latency = cached, "cache_hit", None
+                else:
+                    if not health.get_tracker().allow(model_try):
+                        continue  # another request holds the half-open probe
+                    attempt_timeout = deadline.timeout(hf_timeout)
+                    if supports_batching(model_try):
+                        future = _get_batcher().submit(("classify", hf_api_base, model_try, hf_token), (payload, deadline, current_priority()))
+                    else:
+                        future = _schedule("classify", model_try, self._hf_classify_call, payload, model_try, hf_api_base, hf_token, attempt_timeout)
+                    try:
+                        started = time.monotonic()
+                        with metrics.stage_timer("hf_classify"):
+                            text = future.result(timeout=attempt_timeout)
+                    except concurrent.futures.TimeoutError:
+                        future.cancel()  # ainda na fila: libera o lugar
+                        _report("classify", model_try, "timeout" if attempt_timeout >= hf_timeout else "deadline")
+                        if os.environ.get("AI_DBG", "0") == "1":
+                            print(f"[AI_DBG] HF timeout for model {model_try} after {attempt_timeout}s")
+                        last_exc = concurrent.futures.TimeoutError()
+                        continue
+                    except LLMSaturated:
+                        raise
+                    except Exception as e:
+                        _report("classify", model_try, _attempt_outcome(e, attempt_timeout, hf_timeout))
+                        if os.environ.get("AI_DBG", "0") == "1":
+                            print(f"[AI_DBG] HF exception for model {model_try}: {e}")
+                        last_exc = e
+                        continue
+                    ok, latency = "ok", time.monotonic() - started
+                    if llm_cache is not None:
+                        llm_cache.set(cache_key, text)
 
-                raw_body = text
-                text = (text or "").strip()
-                if "improdut" in text.lower() or "improd" in text.lower():
-                    return _dbg_wrap("Improdutivo", "hf", raw_body)
-                if "produt" in text.lower():
-                    return _dbg_wrap("Produtivo", "hf", raw_body)
-                lowered = text.lower()
-                if any(tok in lowered for tok in ("entailment", "contradiction", "neutral", "produtivo", "improdutivo")):
-                    return _dbg_wrap(text or "Unknown", "hf", raw_body)
+                label = _classification_label(text)
+                if label is not None:
+                    _report("classify", model_try, ok, latency)
+                    return _dbg_wrap(label, "hf", text)
                 # unrecognized HF output for this model -> try next candidate
+                _report("classify", model_try, "unrecognized")
             # All HF attempts failed or returned unrecognized output -> local fallback
             if os.environ.get("AI_DBG", "0") == "1":
                 print(f"[AI_DBG] HF classification failed for all candidates: last_exception={last_exc}")
-            try:
-                return _dbg_wrap(nlp_classify_email(email_content), "local_fallback")
-            except Exception:
-                return _dbg_wrap("Unknown", "hf")
+            return _local_classification(email_content)
 
         # No HF token -> fall back to the local heuristic classifier
         try:
@@ -189,56 +598,159 @@ class AIClient:
         except Exception:
             return _dbg_wrap("Unknown", "canned")
 
-    def generate_response(self, data: dict[str, object], input_data: dict[str, object], category: str, original_text: str) -> str:
+    async def classify_email_async(self, email_content: str, deadline: Optional[Deadline] = None,
+                                   prompt_text: Optional[str] = None) -> str:
+        """Versão assíncrona de `classify_email` com candidatos escalonados (hedging).
+
+        O primeiro candidato parte imediatamente; se não responder em
+        HF_HEDGE_DELAY segundos (ou falhar antes disso) o próximo é disparado
+        em paralelo. A primeira etiqueta reconhecida vence e os demais são
+        cancelados. Sem resposta aceitável dentro do `deadline`, cai no
+        classificador local.
+        """
+        deadline = deadline or Deadline.from_env()
+        hf_token = os.environ.get("HF_API_TOKEN")
+        hf_model = os.environ.get("HF_MODEL", "google/flan-t5-large")
+        hf_api_base = os.environ.get("HF_API_URL", "https://api-inference.huggingface.co/models")
+        hf_timeout = float(os.environ.get("HF_TIMEOUT", "12.0"))
+        llm_cache = _get_llm_cache()
+
+        if hf_token:
+            saturated: List[LLMSaturated] = []
+            prompt = compact_prompt(email_content) if prompt_text is None else prompt_text
+
+            async def attempt(model_try: str) -> Optional[Tuple[str, str]]:
+                payload = _classification_request(prompt, model_try)
+                cache_key = _llm_cache_key("classify", hf_api_base, model_try, payload)
+                cached = llm_cache.get(cache_key) if llm_cache is not None else None
+                if cached is not None:
+                    text, ok, latency = cached, "cache_hit", None
+                else:
+                    if not health.get_tracker().allow(model_try):
+                        return None  # another request holds the half-open probe
+                    attempt_timeout = deadline.timeout(hf_timeout)
+                    try:
+                        started = time.monotonic()
+                        with metrics.stage_timer("hf_classify"):
+                            if supports_batching(model_try):
+                                batched = _get_batcher().submit(("classify", hf_api_base, model_try, hf_token), (payload, deadline, current_priority()))
+                                text = await asyncio.wait_for(asyncio.wrap_future(batched), attempt_timeout)
+                            else:
+                                scheduled = _schedule("classify", model_try, self._hf_classify_call, payload, model_try, hf_api_base,
+                                                      hf_token, attempt_timeout)
+                                text = await asyncio.wait_for(asyncio.wrap_future(scheduled), attempt_timeout)
+                    except asyncio.CancelledError:
+                        _report("classify", model_try, "cancelled")
+                        raise
+                    except LLMSaturated as e:
+                        saturated.append(e)
+                        return None
+                    except Exception as e:
+                        _report("classify", model_try, _attempt_outcome(e, attempt_timeout, hf_timeout))
+                        if os.environ.get("AI_DBG", "0") == "1":
+                            print(f"[AI_DBG] HF exception for model {model_try}: {e}")
+                        return None
+                    ok, latency = "ok", time.monotonic() - started
+                    if llm_cache is not None:
+                        llm_cache.set(cache_key, text)
+                label = _classification_label(text)
+                _report("classify", model_try, ok if label is not None else "unrecognized", latency)
+                return (label, text) if label is not None else None
+
+            try:
+                won = await asyncio.wait_for(
+                    hedge.race([functools.partial(attempt, m) for m in health.get_tracker().order(_classification_candidates(hf_model))],
+                               delay=_hedge_delay()),
+                    deadline.remaining())
+            except asyncio.TimeoutError:
+                metrics.count_llm_request("classify", hf_model, "deadline")
+                won = None
+            if won is not None:
+                return _dbg_wrap(won[0], "hf", won[1])
+            if saturated:
+                raise saturated[0]
+            return _local_classification(email_content)
+
+        try:
+            return _dbg_wrap(nlp_classify_email(email_content), "local")
+        except Exception:
+            return _dbg_wrap("Unknown", "canned")
+
+    def generate_response(self, data: dict[str, object], input_data: dict[str, object], category: str, original_text: str,
+                          deadline: Optional[Deadline] = None) -> str:
+        # `deadline` limita o tempo total (padrão: LLM_DEADLINE); esgotado, vale a resposta pronta
+        deadline = deadline or Deadline.from_env()
+        if not self.hf_token:
+            return _canned_reply(category)
+        # e-mails de modelo (matrículas, tickets) que só mudam nomes e números reaproveitam a resposta
+        neardup = get_neardup_index()
+        reused = neardup.lookup(original_text, category) if neardup is not None else None
+        if reused is not None:
+            metrics.count_llm_request("generate", self.hf_model, "near_duplicate")
+            return reused
+        # pedidos simultâneos iguais (ex.: e-mail em massa) compartilham uma única geração
+        hf_payload = _generation_payload(category, original_text)
+
+        def lookup() -> Optional[str]:
+            found = _cached_answer("generate", self.hf_api_base, _generation_candidates(self.hf_model), lambda m: hf_payload)
+            return found[1] if found is not None else None
+
+        key = _llm_cache_key("generate", self.hf_api_base, self.hf_model, hf_payload)
+        reply = self._coalesced("generate", self.hf_model, key,
+                                lambda: self._generate_response(data, input_data, category, original_text, deadline), lookup,
+                                deadline, lambda: _canned_reply(category))
+        if neardup is not None and reply != _canned_reply(category):
+            neardup.add(original_text, category, reply)
+        return reply
+
+    def _generate_response(self, data: dict[str, object], input_data: dict[str, object], category: str, original_text: str,
+                           deadline: Deadline) -> str:
         # Prefer the configured Hugging Face model. If no HF token is available
         # or the request fails we fall back to a short canned reply.
         hf_token = self.hf_token
         hf_model = self.hf_model
         hf_api_base = self.hf_api_base
 
+        if hf_token and _async_enabled():
+            return hedge.run_sync(self.generate_response_async(data, input_data, category, original_text, deadline))
+
         if hf_token:
-            hf_headers = {"Authorization": f"Bearer {hf_token}", "Content-Type": "application/json"}
-            prompt = f"Categoria: {category}\nEmail: {original_text}\nGere uma resposta breve e adequada."
-            hf_payload: dict[str, Any] = {"inputs": prompt, "options": {"wait_for_model": True}}
-            # try configured model first, then a short fallback list of reasonable hosted candidates
-            # Note: zero-shot MNLI models (facebook/bart-large-mnli) are for classification only
-            # and should not be used for text generation; skip them in the generation path.
-            raw_fallbacks = ("facebook/bart-large-mnli", "meta-llama/Llama-3.1-8B-Instruct", "meta-llama/Llama-3.1-70B-Instruct", "autoevaluate/natural-language-inference")
-            candidates = [hf_model] + [m for m in raw_fallbacks if m != hf_model and "mnli" not in m.lower()]
+            hf_payload = _generation_payload(category, original_text)
+            hf_timeout = float(os.environ.get("HF_TIMEOUT", "20"))
             last_exc: Exception | None = None
-            for model_try in candidates:
-                hf_url = f"{hf_api_base.rstrip('/')}/{model_try}"
-                # Skip MNLI-style models for generation attempts
-                if "mnli" in model_try.lower() or "bart-large-mnli" in model_try.lower():
-                    if os.environ.get("AI_DBG", "0") == "1":
-                        print(f"[AI_DBG] Skipping MNLI model for generation: {model_try}")
-                    continue
+            llm_cache = _get_llm_cache()
+            for model_try in health.get_tracker().order(_generation_candidates(hf_model)):
+                if deadline.expired:
+                    metrics.count_llm_request("generate", model_try, "deadline")
+                    break
+                cache_key = _llm_cache_key("generate", hf_api_base, model_try, hf_payload)
+                cached = llm_cache.get(cache_key) if llm_cache is not None else None
+                if cached is not None:
+                    _report("generate", model_try, "cache_hit")
+                    return cached
+                if not health.get_tracker().allow(model_try):
+                    continue  # another request holds the half-open probe
 
+                attempt_timeout = deadline.timeout(hf_timeout)
+                future = _schedule("generate", model_try, self._hf_generate_call, model_try, hf_payload, attempt_timeout)
                 try:
-                    r = requests.post(hf_url, headers=hf_headers, json=hf_payload, timeout=float(os.environ.get("HF_TIMEOUT", "20")))
-                    if os.environ.get("AI_DBG", "0") == "1":
-                        try:
-                            short = r.text if os.environ.get("AI_DBG_RAW", "0") == "1" else r.text[:400]
-                        except Exception:
-                            short = "<no body>"
-                        print(f"[AI_DBG] HF POST {hf_url} -> status={r.status_code} body={short}")
-                    if r.status_code == 404:
+                    started = time.monotonic()
+                    with metrics.stage_timer("hf_generate"):
+                        text = future.result(timeout=attempt_timeout)
+                    if text is None:
+                        _report("generate", model_try, "not_found")
                         if os.environ.get("AI_DBG", "0") == "1":
                             print(f"[AI_DBG] HF model {model_try} not found (404), trying next candidate")
                         continue
-                    r.raise_for_status()
-                    body = r.json()
-                    if isinstance(body, list) and body:
-                        first_item = cast(dict[str, Any], body[0])
-                        text = first_item.get("generated_text") or first_item.get("text") or builtins.str(first_item)
-                    elif isinstance(body, dict) and ("generated_text" in body or "text" in body):
-                        body_dict = cast(dict[str, Any], body)
-                        gen = body_dict.get("generated_text") or body_dict.get("text")
-                        text = builtins.str(gen) if gen is not None else builtins.str(body_dict)
-                    else:
-                        text = builtins.str(cast(object, body))
-                    return (text or "").strip()
+                    _report("generate", model_try, "ok", time.monotonic() - started)
+                    if llm_cache is not None and text:
+                        llm_cache.set(cache_key, text)
+                    return text
+                except LLMSaturated:
+                    raise
                 except Exception as e:
+                    future.cancel()
+                    _report("generate", model_try, _attempt_outcome(e, attempt_timeout, hf_timeout))
                     last_exc = e
                     if os.environ.get("AI_DBG", "0") == "1":
                         print(f"[AI_DBG] HF attempt {model_try} failed: {e}")
@@ -246,14 +758,157 @@ class AIClient:
             if os.environ.get("AI_DBG", "0") == "1":
                 print(f"[AI_DBG] All HF candidates failed: last_exception={last_exc}")
 
-        # Fallback canned replies when HF is not available or fails
-        if category == "Produtivo":
-            return "Obrigado pelo contato. Recebi sua mensagem e vou analisar/acionar o responsável. Retorno em breve com uma atualização."
-        return "Agradeço a mensagem. Registro-a e, caso seja necessário, entrarei em contato. Desejo um ótimo dia."
+        return _canned_reply(category)
+
+    async def generate_response_async(self, data: dict[str, object], input_data: dict[str, object], category: str, original_text: str,
+                                      deadline: Optional[Deadline] = None) -> str:
+        """Versão assíncrona de `generate_response` com candidatos escalonados (hedging)."""
+        deadline = deadline or Deadline.from_env()
+        if not self.hf_token:
+            return _canned_reply(category)
+        hf_payload = _generation_payload(category, original_text)
+        hf_timeout = float(os.environ.get("HF_TIMEOUT", "20"))
+        llm_cache = _get_llm_cache()
+        saturated: List[LLMSaturated] = []
+
+        async def attempt(model_try: str) -> Optional[str]:
+            cache_key = _llm_cache_key("generate", self.hf_api_base, model_try, hf_payload)
+            cached = llm_cache.get(cache_key) if llm_cache is not None else None
+            if cached is not None:
+                _report("generate", model_try, "cache_hit")
+                return cached
+            if not health.get_tracker().allow(model_try):
+                return None  # another request holds the half-open probe
+            attempt_timeout = deadline.timeout(hf_timeout)
+            try:
+                started = time.monotonic()
+                with metrics.stage_timer("hf_generate"):
+                    scheduled = _schedule("generate", model_try, self._hf_generate_call, model_try, hf_payload, attempt_timeout)
+                    text = await asyncio.wait_for(asyncio.wrap_future(scheduled), attempt_timeout)
+            except asyncio.CancelledError:
+                _report("generate", model_try, "cancelled")
+                raise
+            except LLMSaturated as e:
+                saturated.append(e)
+                return None
+            except Exception as e:
+                _report("generate", model_try, _attempt_outcome(e, attempt_timeout, hf_timeout))
+                return None
+            if text is None:
+                _report("generate", model_try, "not_found")
+                return None
+            _report("generate", model_try, "ok", time.monotonic() - started)
+            if llm_cache is not None and text:
+                llm_cache.set(cache_key, text)
+            return text
+
+        try:
+            reply = await asyncio.wait_for(
+                hedge.race([functools.partial(attempt, m) for m in health.get_tracker().order(_generation_candidates(self.hf_model))],
+                           delay=_hedge_delay()),
+                deadline.remaining())
+        except asyncio.TimeoutError:
+            metrics.count_llm_request("generate", self.hf_model, "deadline")
+            reply = None
+        if reply is None and saturated:
+            raise saturated[0]
+        return reply if reply is not None else _canned_reply(category)
+
+    def stream_response(self, category: str, original_text: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        """Gera a resposta em pedaços, repassados à medida que o modelo os produz.
+
+        Pede `stream: true` ao backend e repassa cada token recebido. Um
+        candidato que falha antes do primeiro token cede a vez ao próximo;
+        depois do primeiro token não há troca de modelo (o cliente já recebeu
+        parte do texto). O tempo até o primeiro token vai para
+        `automail_llm_ttft_seconds`.
+
+        O `deadline` vale até o primeiro token: cada tentativa espera no máximo
+        o que resta dele; depois disso a resposta segue até o fim.
+        """
+        deadline = deadline or Deadline.from_env()
+        if not self.hf_token:
+            yield _canned_reply(category)
+            return
+        neardup = get_neardup_index()
+        reused = neardup.lookup(original_text, category) if neardup is not None else None
+        if reused is not None:
+            metrics.count_llm_request("generate", self.hf_model, "near_duplicate")
+            yield reused
+            return
+        hf_payload = _generation_payload(category, original_text)
+        hf_timeout = float(os.environ.get("HF_TIMEOUT", "20"))
+        hf_headers = {"Authorization": f"Bearer {self.hf_token}", "Content-Type": "application/json",
+                      "Accept": "text/event-stream"}
+        llm_cache = _get_llm_cache()
+        for model_try in health.get_tracker().order(_generation_candidates(self.hf_model)):
+            if deadline.expired:
+                metrics.count_llm_request("generate", model_try, "deadline")
+                break
+            cache_key = _llm_cache_key("generate", self.hf_api_base, model_try, hf_payload)
+            cached = llm_cache.get(cache_key) if llm_cache is not None else None
+            if cached is not None:
+                _report("generate", model_try, "cache_hit")
+                yield cached
+                return
+            if not health.get_tracker().allow(model_try):
+                continue  # another request holds the half-open probe
+
+            started = time.monotonic()
+            attempt_timeout = deadline.timeout(hf_timeout)
+            # só a abertura da resposta passa pelo agendador; os tokens são lidos nesta thread
+            future = _schedule("generate", model_try, self._hf_open_stream, model_try, hf_headers,
+                               {**hf_payload, "stream": True}, attempt_timeout)
+            try:
+                r = future.result(timeout=attempt_timeout)
+            except LLMSaturated:
+                raise
+            except Exception as e:
+                _close_when_done(future)
+                _report("generate", model_try, _attempt_outcome(e, attempt_timeout, hf_timeout))
+                continue
+            parts: List[str] = []
+            try:
+                if r.status_code == 404:
+                    _report("generate", model_try, "not_found")
+                    continue
+                r.raise_for_status()
+                for piece in _stream_chunks(r):
+                    if not piece:
+                        continue
+                    if not parts:
+                        metrics.observe_llm_ttft(model_try, time.monotonic() - started)
+                    parts.append(piece)
+                    yield piece
+            except Exception as e:
+                _report("generate", model_try, _attempt_outcome(e, attempt_timeout, hf_timeout))
+                if os.environ.get("AI_DBG", "0") == "1":
+                    print(f"[AI_DBG] HF stream {model_try} failed: {e}")
+                if parts:
+                    return
+                continue
+            finally:
+                r.close()
+            if not parts:
+                _report("generate", model_try, "unrecognized")
+                continue
+            _report("generate", model_try, "ok", time.monotonic() - started)
+            text = "".join(parts).strip()
+            if llm_cache is not None and text:
+                llm_cache.set(cache_key, text)
+            if neardup is not None and text:
+                neardup.add(original_text, category, text)
+            return
+        yield _canned_reply(category)
+
+
+# cada chamada resolve HF_API_TOKEN/HF_MODEL/HF_API_URL de novo; o que é único por processo
+# é a sessão HTTP em pool (ver `app.ai.session.get_session`), compartilhada por todos os clientes
+def generate_response(category: str, original_text: str, deadline: Optional[Deadline] = None) -> str:
+    return AIClient().generate_response({}, {}, category=category, original_text=original_text, deadline=deadline)
 
-def generate_response(category: str, original_text: str) -> str:
-    ai = AIClient()
-    return ai.generate_response({}, {}, category=category, original_text=original_text)
+def stream_response(category: str, original_text: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+    return AIClient().stream_response(category, original_text, deadline)
 
 if __name__ == "__main__":
     resposta = generate_response("Produtivo", "Preciso de suporte urgente.")
@@ -0,0 +1,48 @@
+"""Request-scoped time budget for LLM calls.
+
+Each model candidate used to get a fresh ``HF_TIMEOUT`` (12–20 s), so one
+``/classify-llm`` request could hold a sync gunicorn worker for well over a
+minute. A ``Deadline`` is created once per request (by the route, from the
+``LLM_DEADLINE`` config value) and passed through the client. Every attempt
+uses ``timeout(cap)``, i.e. at most what is left of the budget. Once the
+budget is spent the client returns its local or canned fallback.
+"""
+from typing import Optional
+import os
+import time
+
+
+class Deadline:
+    """Absolute point in time (monotonic clock) by which a request must finish."""
+
+    def __init__(self, budget: Optional[float] = None) -> None:
+        # budget in seconds; None or <= 0 means no limit
+        self.budget = budget if budget and budget > 0 else None
+        self.expires_at = time.monotonic() + self.budget if self.budget else None
+
+    @classmethod
+    def from_env(cls) -> "Deadline":
+        return cls(float(os.environ.get("LLM_DEADLINE") or "25"))
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None without a limit."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0.0
+
+    def timeout(self, cap: float) -> float:
+        """Timeout for the next attempt: ``cap``, shortened to the remaining budget."""
+        remaining = self.remaining()
+        # requests rejects a zero timeout; callers check ``expired`` before each attempt
+        return cap if remaining is None else max(0.001, min(cap, remaining))
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining()})"
+
+
+NO_DEADLINE = Deadline(None)
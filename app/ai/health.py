@@ -0,0 +1,191 @@
+"""Per-model health tracking for the LLM candidates.
+
+Every request used to walk the same candidate list, paying the full timeout
+again for a model that has been returning 404 or timing out all day. The
+tracker keeps, per model and per process:
+
+- a rolling success rate over the last ``window`` calls;
+- an EWMA of the latency of successful calls;
+- a circuit breaker: ``failures`` consecutive failures (or one 404, the model
+  does not exist) open it; after ``cooldown`` seconds one half-open probe is
+  let through, and its outcome closes the breaker or opens it again.
+
+``order`` drops models whose breaker is open and sorts the rest by expected
+cost (latency / success rate), so fast healthy models are tried first; it
+claims no probe. Callers claim it with ``allow`` right before each attempt.
+
+Configuration (environment):
+    HF_BREAKER_FAILURES   consecutive failures that open the breaker (default 3)
+    HF_BREAKER_COOLDOWN   seconds before a half-open probe (default 60)
+    HF_HEALTH_WINDOW      calls in the rolling success rate (default 20)
+    HF_EWMA_ALPHA         weight of the newest latency sample (default 0.3)
+    HF_REORDER            1 = sort candidates by expected cost (default), 0 = keep configured order
+"""
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence
+import os
+import threading
+import time
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class ModelHealth:
+    def __init__(self, window: int) -> None:
+        self.outcomes: Deque[bool] = deque(maxlen=max(1, window))
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+
+    @property
+    def success_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 1.0
+
+
+class HealthTracker:
+    """Thread-safe per-model success rate, EWMA latency and circuit breaker."""
+
+    def __init__(self, failures: int = 3, cooldown: float = 60.0, window: int = 20, alpha: float = 0.3,
+                 reorder: bool = True, clock=time.monotonic) -> None:
+        self.failures = max(1, int(failures))
+        self.cooldown = float(cooldown)
+        self.window = int(window)
+        self.alpha = min(1.0, max(0.01, float(alpha)))
+        self.reorder = reorder
+        self._clock = clock
+        self._models: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model: str) -> ModelHealth:
+        health = self._models.get(model)
+        if health is None:
+            health = self._models[model] = ModelHealth(self.window)
+        return health
+
+    def _open(self, health: ModelHealth, now: float) -> None:
+        health.state = OPEN
+        health.opened_at = now
+        health.probe_started = None
+
+    def _available(self, health: ModelHealth, now: float) -> bool:
+        if health.state == CLOSED:
+            return True
+        if health.state == OPEN and now - health.opened_at < self.cooldown:
+            return False
+        # half-open: one probe at a time; a probe that never reported back (e.g. it was
+        # cancelled by a faster candidate) is given up after another cooldown
+        return health.probe_started is None or now - health.probe_started >= self.cooldown
+
+    def is_available(self, model: str) -> bool:
+        """Whether ``model`` could be called now; unlike ``allow`` it claims nothing."""
+        now = self._clock()
+        with self._lock:
+            health = self._models.get(model)
+            return health is None or self._available(health, now)
+
+    def allow(self, model: str) -> bool:
+        """Whether ``model`` may be called now (claims the half-open probe if due).
+
+        Call it just before the attempt starts: a model listed by ``order`` but
+        never tried must not hold the probe.
+        """
+        now = self._clock()
+        with self._lock:
+            health = self._model(model)
+            if not self._available(health, now):
+                return False
+            if health.state == CLOSED:
+                return True
+            health.state = HALF_OPEN
+            health.probe_started = now
+            return True
+
+    def record(self, model: str, ok: bool, latency: Optional[float] = None, hard: bool = False) -> None:
+        """Report a call outcome; ``hard`` failures (404) open the breaker at once."""
+        now = self._clock()
+        with self._lock:
+            health = self._model(model)
+            health.outcomes.append(ok)
+            if ok:
+                if latency is not None:
+                    prev = health.ewma_latency
+                    health.ewma_latency = latency if prev is None else self.alpha * latency + (1 - self.alpha) * prev
+                health.consecutive_failures = 0
+                health.state = CLOSED
+                health.probe_started = None
+                return
+            health.consecutive_failures += 1
+            if hard or health.state == HALF_OPEN or health.consecutive_failures >= self.failures:
+                self._open(health, now)
+
+    def order(self, candidates: Sequence[str]) -> List[str]:
+        """Candidates that may be called now, cheapest expected cost first.
+
+        Models without latency samples keep their configured position relative
+        to each other and are costed at the median of the known ones.
+        """
+        allowed = [m for m in dict.fromkeys(candidates) if self.is_available(m)]
+        if not self.reorder or len(allowed) < 2:
+            return allowed
+        with self._lock:
+            known = sorted(h.ewma_latency for m, h in self._models.items() if m in allowed and h.ewma_latency is not None)
+            prior = known[len(known) // 2] if known else 1.0
+
+            def cost(model: str) -> float:
+                health = self._models.get(model)
+                if health is None:
+                    return prior
+                latency = health.ewma_latency if health.ewma_latency is not None else prior
+                return latency / max(health.success_rate, 0.05)
+
+            costs = {m: cost(m) for m in allowed}
+        return sorted(allowed, key=costs.__getitem__)
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            return {
+                model: {
+                    "state": h.state,
+                    "success_rate": round(h.success_rate, 4),
+                    "calls": len(h.outcomes),
+                    "ewma_latency_ms": round(h.ewma_latency * 1000, 1) if h.ewma_latency is not None else None,
+                    "consecutive_failures": h.consecutive_failures,
+                }
+                for model, h in sorted(self._models.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+_tracker: Optional[HealthTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker() -> HealthTracker:
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = HealthTracker(
+                    failures=int(os.environ.get("HF_BREAKER_FAILURES", "3")),
+                    cooldown=float(os.environ.get("HF_BREAKER_COOLDOWN", "60")),
+                    window=int(os.environ.get("HF_HEALTH_WINDOW", "20")),
+                    alpha=float(os.environ.get("HF_EWMA_ALPHA", "0.3")),
+                    reorder=os.environ.get("HF_REORDER", "1") == "1",
+                )
+    return _tracker
+
+
+def configure_health(**kwargs) -> HealthTracker:
+    """Replace the process tracker (keyword arguments as ``HealthTracker``)."""
+    global _tracker
+    _tracker = HealthTracker(**kwargs)
+    return _tracker
+
+
+def health_stats() -> Dict[str, Dict[str, object]]:
+    return get_tracker().snapshot()
@@ -0,0 +1,113 @@
+"""Hedged/raced LLM candidate calls on a per-process event loop.
+
+Trying model candidates strictly in sequence means one slow model costs the
+full ``HF_TIMEOUT`` before the next is even asked. ``race`` starts the first
+attempt, starts the next one when the current attempt fails or after
+``delay`` seconds without an answer, returns the first acceptable result and
+cancels the rest.
+
+The inference calls themselves stay on the pooled ``requests`` session
+(``app.ai.session``) and run on the process LLM scheduler
+(``app.ai.scheduler``); ``call`` runs other blocking work in the loop's
+thread pool. A cancelled attempt stops waiting at once; if its call is
+still queued it is dropped, otherwise its HTTP request finishes (or times
+out) in the background on a scheduler worker.
+
+``run_sync`` is the adapter for the sync Flask routes: it submits a coroutine
+to a background event loop owned by this process and blocks for its result.
+The coroutine, and the blocking work it hands to ``call``, run in a copy of
+the caller's context, so context variables such as the scheduler priority
+(``app.ai.scheduler.bulk``) follow the work across threads.
+
+Configuration (environment):
+    HF_ASYNC_WORKERS    threads available to in-flight HTTP calls (default 8)
+"""
+from typing import Any, Awaitable, Callable, Coroutine, Optional, Sequence, Set, TypeVar
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_pid
+    pid = os.getpid()
+    if _loop is None or _loop_pid != pid:
+        with _lock:
+            if _loop is None or _loop_pid != pid:
+                # after a fork the parent's loop thread does not exist in the child: start a new one
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max(1, int(os.environ.get("HF_ASYNC_WORKERS", "8"))),
+                    thread_name_prefix="hf-async"))
+                threading.Thread(target=loop.run_forever, name="hf-async-loop", daemon=True).start()
+                _loop, _loop_pid = loop, pid
+    return _loop
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """Run ``coro`` on the process event loop and wait for its result."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("run_sync() called from a running event loop; await the coroutine instead")
+    # call_soon_threadsafe (behind run_coroutine_threadsafe) starts the task in a copy of this thread's context
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+async def call(timeout: Optional[float], fn: Callable[..., T], *args: Any) -> T:
+    """Run a blocking ``fn(*args)`` in the loop's thread pool, giving up after ``timeout`` seconds."""
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not carry context variables over to the pool thread
+    ctx = contextvars.copy_context()
+    return await asyncio.wait_for(loop.run_in_executor(None, functools.partial(ctx.run, fn, *args)), timeout)
+
+
+async def race(attempts: Sequence[Callable[[], Awaitable[Optional[T]]]], delay: Optional[float] = None) -> Optional[T]:
+    """Return the first non-None result of ``attempts``, started in order.
+
+    The next attempt starts as soon as a running one fails (raises or
+    returns None) or when ``delay`` seconds pass without an answer.
+    ``delay=0`` starts them all at once; ``delay=None`` runs them strictly in
+    sequence. Attempts still running when a result arrives are cancelled.
+    Returns None when no attempt produced a result.
+    """
+    queue = list(attempts)
+    running: Set["asyncio.Future[Optional[T]]"] = set()
+
+    def start_next() -> None:
+        if queue:
+            running.add(asyncio.ensure_future(queue.pop(0)()))
+
+    start_next()
+    while delay == 0 and queue:
+        start_next()
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, timeout=delay if queue else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                start_next()  # hedge: the running attempts are slow
+                continue
+            for task in done:
+                running.discard(task)
+                if not task.cancelled() and task.exception() is None and task.result() is not None:
+                    return task.result()
+                start_next()  # a failed attempt is replaced right away
+        return None
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
@@ -0,0 +1,424 @@
+"""Near-duplicate reuse of generated replies (MinHash + LSH).
+
+Templated e-mails (ticket notifications, "minhas matrículas" enrollment
+mails) differ only in names and numbers, so the exact-prompt LLM cache
+misses them. ``NearDuplicateIndex`` keeps a MinHash signature of every
+e-mail that got a generated reply, bucketed by LSH bands. A new e-mail whose
+estimated Jaccard similarity to a stored one reaches ``threshold`` reuses
+that reply without calling the LLM.
+
+Replies are stored parameterized. Only a few kinds of token are variable:
+numbers (including dates and codes), e-mail addresses, URLs and the name
+after an opening greeting ("Olá Ana Souza,"). Reply tokens that also occur
+at a variable position of the original e-mail become slots pointing at that
+position. On reuse the two e-mails are aligned token by token and each slot
+takes the value found at the aligned position of the new e-mail ("Olá Ana,
+matrícula 123" becomes "Olá Bruno, matrícula 456"). Every other token must
+be equal in both e-mails (case-insensitively), so "Aprovado" / "Reprovado"
+or "confirmada" / "cancelada" is a miss however similar the rest is. A slot
+without a counterpart is a miss too, so a reply is never reused for a
+different message or with another person's details. The stored category
+must match the caller's decision as well. E-mails longer than
+``_MAX_TOKENS`` tokens are neither indexed nor reused: they must be compared
+whole, and that is too costly to do on every request.
+
+Memory is bounded by ``maxsize`` entries (LRU). With ``path`` the entries
+also go to a local SQLite file: they are loaded on start and entries
+written by other workers are picked up every few seconds.
+
+Configuration (environment):
+    LLM_NEARDUP             1 = reuse replies of near-duplicate e-mails, 0 = off (default)
+    LLM_NEARDUP_THRESHOLD   minimum estimated Jaccard similarity of word 3-shingles (default 0.7)
+    LLM_NEARDUP_SIZE        max indexed e-mails per worker (default 2000)
+    LLM_NEARDUP_PATH        SQLite file that persists the index (empty = memory only)
+"""
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Set, Tuple
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_PRIME = (1 << 31) - 1
+# URLs, then words, numbers, dates and e-mail addresses ("12/05/2024", "ana@acme.com")
+_TOKEN_RE = re.compile(r"(?:https?://|www\.)[^\s<>\"']*[^\s<>\"'.,;:!?)]|\w(?:[\w@.+/-]*\w)?")
+_DIGIT_RE = re.compile(r"\d")
+_URL_RE = re.compile(r"^(?:https?://|www\.)", re.IGNORECASE)
+# opening greeting followed by a name: "Olá Ana Souza," / "Prezada Sra. Lima:" / "Hi John"
+_GREETING_RE = re.compile(
+    r"^\W*(?:ol[áa]|oi|prezad[oa]s?|car[oa]s?|bom dia|boa tarde|boa noite|hello|hi|dear)\b[ \t,]*"
+    r"((?:(?:sr|sra|srta|dr|dra|mr|mrs|ms)\.?[ \t]+)?[A-ZÀ-Ý][\w'-]*(?:[ \t]+(?:d[aeo]s?[ \t]+)?[A-ZÀ-Ý][\w'-]*){0,3})",
+    re.IGNORECASE)
+# an e-mail needs this many shingles before it is indexed or looked up
+_MIN_SHINGLES = 4
+# longer e-mails are not indexed: slot alignment compares the whole token stream
+_MAX_TOKENS = 400
+
+Slot = Tuple[int, int, int]  # (start, end) in the reply, token index in the e-mail
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text)
+
+
+def _name_positions(text: str) -> Set[int]:
+    """Token indices of the name after an opening greeting."""
+    m = _GREETING_RE.match(text)
+    if m is None or not m.group(1)[:1].isupper():
+        return set()
+    first = len(_TOKEN_RE.findall(text[:m.start(1)]))
+    return set(range(first, first + len(_TOKEN_RE.findall(m.group(1)))))
+
+
+def _variable_value(token: str) -> bool:
+    return "@" in token or bool(_DIGIT_RE.search(token)) or bool(_URL_RE.match(token))
+
+
+def _shape(token: str) -> str:
+    # numbers, addresses and links vary between copies of a template: compare their shape only
+    if _URL_RE.match(token):
+        return "<url>"
+    if "@" in token:
+        return "<email>"
+    if _DIGIT_RE.search(token):
+        return "<num>"
+    return token.lower()
+
+
+Unit = Tuple[str, int, int]  # alignment key, first and last + 1 token index
+
+
+def _units(tokens: List[str], names: Set[int]) -> List[Unit]:
+    """Alignment units: the greeting name as one unit, then one per token.
+
+    Keys are the kind of a variable token ("<num>", "<email>", "<url>",
+    "<name>") or the lowercased token itself.
+    """
+    units: List[Unit] = []
+    i = 0
+    while i < len(tokens):
+        end = i + 1
+        if i in names:
+            while end in names:
+                end += 1
+            units.append(("<name>", i, end))
+        else:
+            units.append((_shape(tokens[i]), i, end))
+        i = end
+    return units
+
+
+def _shingles(units: List[Unit], k: int = 3) -> Set[str]:
+    keys = [key for key, _, _ in units]
+    return {" ".join(keys[i:i + k]) for i in range(len(keys) - k + 1)}
+
+
+def _is_slot_key(key: str) -> bool:
+    return key in ("<name>", "<num>", "<email>", "<url>")
+
+
+def parameterize(tokens: List[str], names: Set[int], reply: str) -> List[Slot]:
+    """Slots of ``reply`` filled from variable positions of the e-mail ``tokens`` (first occurrence)."""
+    first: Dict[str, int] = {}
+    for i, token in enumerate(tokens):
+        if i in names or _variable_value(token):
+            first.setdefault(token, i)
+    return [(m.start(), m.end(), first[m.group(0)]) for m in _TOKEN_RE.finditer(reply) if m.group(0) in first]
+
+
+def _aligned(old: List[str], old_names: Set[int], new: List[str], new_names: Set[int]) -> Optional[Dict[int, str]]:
+    """Token of ``new`` at the position aligned with each index of ``old``.
+
+    None when the e-mails differ in anything but variable tokens: a changed
+    word ("confirmada" / "cancelada", "Aprovado" / "Reprovado") means a
+    different message, however similar the rest is. Names of different
+    lengths ("Ana Souza" / "Bruno") only map their first tokens.
+    """
+    old_units, new_units = _units(old, old_names), _units(new, new_names)
+    old_keys, new_keys = [u[0] for u in old_units], [u[0] for u in new_units]
+    mapping: Dict[int, str] = {}
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, old_keys, new_keys, autojunk=False).get_opcodes():
+        if op != "equal" and not all(_is_slot_key(k) for k in old_keys[i1:i2] + new_keys[j1:j2]):
+            return None
+        if op != "equal" and (op != "replace" or i2 - i1 != j2 - j1):
+            continue
+        for (_, o1, o2), (_, n1, n2) in zip(old_units[i1:i2], new_units[j1:j2]):
+            if o2 - o1 == n2 - n1:
+                for offset in range(o2 - o1):
+                    mapping[o1 + offset] = new[n1 + offset]
+            else:
+                mapping[o1] = new[n1]
+    return mapping
+
+
+def render(reply: str, slots: List[Slot], old_tokens: List[str], old_names: Set[int],
+           new_tokens: List[str], new_names: Set[int]) -> Optional[str]:
+    """The stored reply with its slots filled from the new e-mail.
+
+    None when the e-mails differ beyond their variable tokens, or a slot has
+    no counterpart in the new e-mail.
+    """
+    mapping = _aligned(old_tokens, old_names, new_tokens, new_names)
+    if mapping is None:
+        return None
+    parts: List[str] = []
+    pos = 0
+    for start, end, index in slots:
+        value = mapping.get(index)
+        if value is None:
+            return None
+        parts.append(reply[pos:start])
+        parts.append(value)
+        pos = end
+    parts.append(reply[pos:])
+    return "".join(parts)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1) -> None:
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, _PRIME, size=num_perm).astype(np.int64)
+        self.b = rng.randint(0, _PRIME, size=num_perm).astype(np.int64)
+
+    def signature(self, shingles: Set[str]) -> np.ndarray:
+        x = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") % _PRIME
+                         for s in shingles), dtype=np.int64, count=len(shingles))
+        return ((np.outer(x, self.a) + self.b) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+class _Entry:
+    __slots__ = ("category", "signature", "tokens", "names", "reply", "slots")
+
+    def __init__(self, category: str, signature: np.ndarray, tokens: List[str], names: Set[int], reply: str,
+                 slots: List[Slot]) -> None:
+        self.category = category
+        self.signature = signature
+        self.tokens = tokens
+        self.names = names
+        self.reply = reply
+        self.slots = slots
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = 0.7, maxsize: int = 2000, path: Optional[str] = None,
+                 num_perm: int = 64, bands: int = 16, sync_interval: float = 5.0) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = float(threshold)
+        self.maxsize = max(1, int(maxsize))
+        self.path = path
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.sync_interval = sync_interval
+        self.hasher = MinHasher(num_perm)
+        self.lookups = 0
+        self.hits = 0
+        self.rejected = 0
+        self.mismatched = 0
+        self.errors = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: List[Dict[bytes, Set[int]]] = [{} for _ in range(bands)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_row = 0
+        self._last_sync = 0.0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)) or ".", exist_ok=True)
+            self._sync(force=True)
+
+    # -- in-memory index --
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[b * self.rows:(b + 1) * self.rows].tobytes() for b in range(self.bands)]
+
+    def _insert(self, entry: _Entry) -> None:
+        # caller holds self._lock
+        self._next_id += 1
+        self._entries[self._next_id] = entry
+        for band, key in zip(self._buckets, self._band_keys(entry.signature)):
+            band.setdefault(key, set()).add(self._next_id)
+        while len(self._entries) > self.maxsize:
+            old_id, old = self._entries.popitem(last=False)
+            for band, key in zip(self._buckets, self._band_keys(old.signature)):
+                ids = band.get(key)
+                if ids is not None:
+                    ids.discard(old_id)
+                    if not ids:
+                        del band[key]
+
+    def _best(self, signature: np.ndarray) -> Optional[Tuple[int, float]]:
+        # caller holds self._lock
+        candidates: Set[int] = set()
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(band.get(key, ()))
+        best: Optional[Tuple[int, float]] = None
+        for entry_id in candidates:
+            similarity = float(np.mean(self._entries[entry_id].signature == signature))
+            if best is None or similarity > best[1]:
+                best = (entry_id, similarity)
+        return best
+
+    def _signature(self, tokens: List[str], names: Set[int]) -> Optional[np.ndarray]:
+        if len(tokens) > _MAX_TOKENS:
+            return None  # too long to compare whole on every request
+        shingles = _shingles(_units(tokens, names))
+        if len(shingles) < _MIN_SHINGLES:
+            return None  # too short to tell a template from a coincidence
+        return self.hasher.signature(shingles)
+
+    def lookup(self, text: str, category: str) -> Optional[str]:
+        """Reply of a stored near-duplicate of ``text``, adapted to it; None on a miss."""
+        tokens, names = _tokens(text), _name_positions(text)
+        signature = self._signature(tokens, names)
+        if signature is None:
+            return None
+        self._sync()
+        with self._lock:
+            self.lookups += 1
+            best = self._best(signature)
+            if best is None or best[1] < self.threshold:
+                return None
+            entry = self._entries[best[0]]
+            if entry.category != category:
+                self.mismatched += 1
+                return None
+            self._entries.move_to_end(best[0])
+        reply = render(entry.reply, entry.slots, entry.tokens, entry.names, tokens, names)
+        with self._lock:
+            if reply is None:
+                self.rejected += 1
+            else:
+                self.hits += 1
+        return reply
+
+    def add(self, text: str, category: str, reply: str) -> None:
+        tokens, names = _tokens(text), _name_positions(text)
+        signature = self._signature(tokens, names)
+        if signature is None or not reply:
+            return
+        entry = _Entry(category, signature, tokens, names, reply, parameterize(tokens, names, reply))
+        with self._lock:
+            if self._known(entry):
+                return  # already indexed (e.g. coalesced callers of the same request)
+            self._insert(entry)
+        if self.path:
+            self._persist(entry)
+
+    def _known(self, entry: _Entry) -> bool:
+        # caller holds self._lock
+        best = self._best(entry.signature)
+        return best is not None and best[1] >= 1.0 and self._entries[best[0]].tokens == entry.tokens
+
+    # -- persistence --
+
+    def _conn(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS neardup (id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT NOT NULL, "
+                "signature BLOB NOT NULL, tokens TEXT NOT NULL, names TEXT NOT NULL, reply TEXT NOT NULL, slots TEXT NOT NULL, "
+                "created REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _persist(self, entry: _Entry) -> None:
+        try:
+            conn = self._conn()
+            cur = conn.execute(
+                "INSERT INTO neardup (category, signature, tokens, names, reply, slots, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry.category, entry.signature.tobytes(), json.dumps(entry.tokens, ensure_ascii=False),
+                 json.dumps(sorted(entry.names)), entry.reply, json.dumps(entry.slots), time.time()))
+            if (cur.lastrowid or 0) % 64 == 0:
+                conn.execute("DELETE FROM neardup WHERE id <= ?", (int(cur.lastrowid or 0) - self.maxsize * 4,))
+        except sqlite3.Error:
+            logger.debug("near-duplicate index write failed", exc_info=True)
+            self.errors += 1
+
+    def _sync(self, force: bool = False) -> None:
+        """Load entries written by other workers (or by earlier runs)."""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+        try:
+            rows = self._conn().execute(
+                "SELECT id, category, signature, tokens, names, reply, slots FROM neardup WHERE id > ? ORDER BY id DESC LIMIT ?",
+                (self._last_row, self.maxsize)).fetchall()
+        except sqlite3.Error:
+            logger.debug("near-duplicate index read failed", exc_info=True)
+            self.errors += 1
+            return
+        with self._lock:
+            for row_id, category, signature, tokens, names, reply, slots in reversed(rows):
+                self._last_row = max(self._last_row, row_id)
+                entry = _Entry(category, np.frombuffer(signature, dtype=np.uint32).copy(), json.loads(tokens),
+                               set(json.loads(names)), reply, [tuple(s) for s in json.loads(slots)])  # type: ignore[misc]
+                if not self._known(entry):  # rows this worker wrote itself are already in memory
+                    self._insert(entry)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "rejected": self.rejected,
+                "category_mismatch": self.mismatched,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "path": self.path,
+                "errors": self.errors,
+            }
+
+
+_index: Optional[NearDuplicateIndex] = None
+_index_configured = False
+_index_lock = threading.Lock()
+
+
+def get_neardup_index() -> Optional[NearDuplicateIndex]:
+    """The process index, or None unless LLM_NEARDUP=1."""
+    global _index, _index_configured
+    if not _index_configured:
+        with _index_lock:
+            if not _index_configured:
+                if os.environ.get("LLM_NEARDUP", "0") == "1":
+                    _index = NearDuplicateIndex(threshold=float(os.environ.get("LLM_NEARDUP_THRESHOLD", "0.7")),
+                                                maxsize=int(os.environ.get("LLM_NEARDUP_SIZE", "2000")),
+                                                path=os.environ.get("LLM_NEARDUP_PATH") or None)
+                _index_configured = True
+    return _index
+
+
+def configure_neardup(enabled: bool = True, threshold: float = 0.7, maxsize: int = 2000,
+                      path: Optional[str] = None) -> Optional[NearDuplicateIndex]:
+    global _index, _index_configured
+    _index = NearDuplicateIndex(threshold, maxsize, path) if enabled else None
+    _index_configured = True
+    return _index
+
+
+def neardup_stats() -> Dict[str, Any]:
+    index = get_neardup_index()
+    return index.stats() if index is not None else {"enabled": False}
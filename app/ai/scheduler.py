@@ -0,0 +1,272 @@
+"""Process-wide scheduler for upstream LLM calls.
+
+Every HF call of the process runs on one small pool of worker threads fed by
+a bounded queue, instead of a per-``AIClient`` executor with an unbounded
+queue (or no limit at all for the generation calls).
+
+* Backpressure: an interactive call that finds the queue full raises
+  ``LLMSaturated`` right away; the routes answer 429 with ``Retry-After``
+  instead of piling up threads behind a slow upstream. Bulk calls (see
+  ``bulk()``) may only fill half of the queue and wait for room instead.
+* Rate limiting: a token bucket per upstream model (``LLM_RATE_LIMIT``
+  requests per second, bursts of ``LLM_RATE_BURST``). A call gets the next
+  free slot of its model's bucket; an interactive call whose slot is more than
+  ``LLM_RATE_MAX_WAIT`` seconds away is rejected instead of queued. A 429
+  from upstream pauses that model for its ``Retry-After``.
+* Priorities: interactive calls (the default) run before bulk ones. The
+  priority lives in a context variable, which threads do not inherit: code
+  that submits on behalf of another thread (the micro-batcher) captures it
+  with ``current_priority()`` and passes it explicitly.
+
+Configuration (environment):
+    LLM_WORKERS         worker threads per process (default 4)
+    LLM_QUEUE_SIZE      calls waiting for a worker before interactive calls are rejected (default 32)
+    LLM_RATE_LIMIT      requests per second per model (default 0 = no limit)
+    LLM_RATE_BURST      bucket size (default: max(1, LLM_RATE_LIMIT))
+    LLM_RATE_MAX_WAIT   longest wait for a rate-limit slot before rejecting (default 5)
+"""
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=INTERACTIVE)
+
+# pause applied to a model after an upstream 429 without a usable Retry-After
+_DEFAULT_UPSTREAM_PAUSE = 5.0
+
+
+class LLMSaturated(Exception):
+    """The scheduler cannot take the call now; retry after ``retry_after`` seconds."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(f"LLM scheduler saturated ({reason}); retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def current_priority() -> int:
+    """Priority of calls scheduled from this context; capture it before handing work to another thread."""
+    return _priority.get()
+
+
+@contextmanager
+def bulk() -> Iterator[None]:
+    """Calls scheduled inside this block (in this thread/context) run as bulk work."""
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until the next reservation would be served."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def reserve(self, now: float) -> float:
+        delay = self.delay(now)
+        self.tokens -= 1.0  # may go negative: later callers queue behind this slot
+        return delay
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "not_before", "model", "fn", "args", "future")
+
+    def __init__(self, priority: int, seq: int, not_before: float, model: str,
+                 fn: Callable[..., Any], args: tuple, future: "Future[Any]") -> None:
+        self.priority = priority
+        self.seq = seq
+        self.not_before = not_before
+        self.model = model
+        self.fn = fn
+        self.args = args
+        self.future = future
+
+
+def _upstream_retry_after(exc: BaseException) -> Optional[float]:
+    """Retry-After of an upstream 429 (None when ``exc`` is not a 429)."""
+    response = getattr(exc, "response", None)
+    if getattr(response, "status_code", None) != 429:
+        return None
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", "")))  # type: ignore[union-attr]
+    except (TypeError, ValueError):
+        return _DEFAULT_UPSTREAM_PAUSE
+
+
+class LLMScheduler:
+    def __init__(self, workers: int = 4, queue_size: int = 32, rate: float = 0.0,
+                 burst: Optional[float] = None, max_wait: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.bulk_limit = max(1, self.queue_size // 2)
+        self.rate = max(0.0, float(rate))
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self.max_wait = max(0.0, float(max_wait))
+        self.clock = clock
+        self.completed = 0
+        self.rejected: Dict[str, int] = {}
+        self._service_time = 1.0  # EWMA of call durations, for Retry-After estimates
+        self._reset()
+
+    def _reset(self) -> None:
+        # worker threads do not survive a fork: each process builds its own
+        self._cond = threading.Condition()
+        self._jobs: List[_Job] = []
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._paused: Dict[str, float] = {}
+        self._threads: List[threading.Thread] = []
+        self._running = 0
+        self._seq = 0
+        self._pid = os.getpid()
+
+    def submit(self, model: str, fn: Callable[..., Any], *args: Any, priority: Optional[int] = None) -> "Future[Any]":
+        """Queue ``fn(*args)`` as a call to ``model``; raises LLMSaturated when it cannot be taken."""
+        if self._pid != os.getpid():
+            self._reset()
+        priority = _priority.get() if priority is None else priority
+        future: "Future[Any]" = Future()
+        with self._cond:
+            if priority == INTERACTIVE and len(self._jobs) >= self.queue_size:
+                self._reject("queue_full", self._drain_estimate())
+            while priority != INTERACTIVE and len(self._jobs) >= self.bulk_limit:
+                self._cond.wait()  # bulk work waits for room instead of failing
+            now = self.clock()
+            delay = self._slot_delay(model, now)
+            if priority == INTERACTIVE and delay > self.max_wait:
+                self._reject("rate_limited", delay)
+            if self.rate > 0:
+                self._bucket(model, now).reserve(now)
+            self._seq += 1
+            self._jobs.append(_Job(priority, self._seq, now + delay, model, fn, args, future))
+            self._ensure_workers()
+            self._cond.notify_all()
+        return future
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise LLMSaturated(reason, retry_after)
+
+    def _bucket(self, model: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = self._buckets[model] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+    def _slot_delay(self, model: str, now: float) -> float:
+        delay = max(0.0, self._paused.get(model, 0.0) - now)
+        if self.rate > 0:
+            delay = max(delay, self._bucket(model, now).delay(now))
+        return delay
+
+    def _drain_estimate(self) -> float:
+        return max(1.0, math.ceil(len(self._jobs) / self.workers * self._service_time))
+
+    def pause(self, model: str, seconds: float) -> None:
+        """Hold new calls to ``model`` for ``seconds`` (upstream asked us to back off)."""
+        with self._cond:
+            self._paused[model] = max(self._paused.get(model, 0.0), self.clock() + seconds)
+
+    def _ensure_workers(self) -> None:
+        # caller holds self._cond
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"llm-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_job(self) -> _Job:
+        # caller holds self._cond
+        while True:
+            # callers that gave up (timeout, lost hedge) free their place right away
+            self._jobs = [j for j in self._jobs if not j.future.cancelled()]
+            now = self.clock()
+            ready = [j for j in self._jobs if j.not_before <= now]
+            if ready:
+                job = min(ready, key=lambda j: (j.priority, j.seq))
+                self._jobs.remove(job)
+                self._cond.notify_all()  # room for waiting bulk submitters
+                return job
+            self._cond.wait(min(j.not_before for j in self._jobs) - now if self._jobs else None)
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                self._running += 1
+            try:
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                started = time.monotonic()
+                try:
+                    result = job.fn(*job.args)
+                except BaseException as e:
+                    pause = _upstream_retry_after(e)
+                    if pause is not None:
+                        self.pause(job.model, pause)
+                    job.future.set_exception(e)
+                else:
+                    job.future.set_result(result)
+                with self._cond:
+                    self.completed += 1
+                    self._service_time = 0.8 * self._service_time + 0.2 * (time.monotonic() - started)
+            finally:
+                with self._cond:
+                    self._running -= 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            return {"workers": self.workers, "queue_size": self.queue_size, "queued": len(self._jobs),
+                    "running": self._running, "completed": self.completed, "rejected": dict(self.rejected),
+                    "rate_limit": self.rate or None}
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(workers=int(os.environ.get("LLM_WORKERS", "4")),
+                                          queue_size=int(os.environ.get("LLM_QUEUE_SIZE", "32")),
+                                          rate=float(os.environ.get("LLM_RATE_LIMIT") or "0"),
+                                          burst=float(os.environ.get("LLM_RATE_BURST") or "0") or None,
+                                          max_wait=float(os.environ.get("LLM_RATE_MAX_WAIT", "5")))
+    return _scheduler
+
+
+def configure_scheduler(**kwargs: Any) -> LLMScheduler:
+    """Replace the process scheduler (tests, scripts); takes LLMScheduler's arguments."""
+    global _scheduler
+    _scheduler = LLMScheduler(**kwargs)
+    return _scheduler
+
+
+def scheduler_stats() -> Dict[str, object]:
+    return get_scheduler().stats()
@@ -0,0 +1,116 @@
+"""Process-wide pooled HTTP session for the LLM providers.
+
+Every call used to go through a bare ``requests.post``, which opens a new
+connection (DNS + TCP + TLS handshake) per request and per fallback
+candidate. One ``requests.Session`` per process keeps connections alive and
+reuses them across requests and candidates on the same host.
+
+Configuration (environment):
+    HF_POOL_SIZE        connections kept per host (default 10)
+    HF_RETRIES          retries on 429/503 and connection errors (default 2; 0 disables)
+    HF_RETRY_BACKOFF    exponential backoff factor in seconds (default 0.5)
+
+Retries honour ``Retry-After``. Inside ``call_budget(seconds)`` they also
+stay within the calling attempt's time budget: the backoff is cut to what is
+left, and a retry that would start after the budget ends (or a
+``Retry-After`` longer than what is left) is not made. The last response is
+returned as is, so a 429 still reaches the LLM scheduler, which pauses the
+model. The session is rebuilt after a fork, because pooled sockets must not
+be shared between gunicorn workers.
+"""
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+import math
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 503)
+
+_budget = threading.local()
+
+
+@contextmanager
+def call_budget(seconds: Optional[float]) -> Iterator[None]:
+    """Bound the retries of requests made by this thread to ``seconds`` (None = no bound)."""
+    previous = getattr(_budget, "expires_at", None)
+    _budget.expires_at = time.monotonic() + seconds if seconds is not None else None
+    try:
+        yield
+    finally:
+        _budget.expires_at = previous
+
+
+def _budget_left() -> float:
+    expires_at = getattr(_budget, "expires_at", None)
+    return math.inf if expires_at is None else expires_at - time.monotonic()
+
+
+class BudgetedRetry(Retry):
+    """``Retry`` that never waits or retries past the thread's ``call_budget``."""
+
+    def increment(self, method: Optional[str] = None, url: Optional[str] = None, response: Any = None,
+                  error: Optional[Exception] = None, _pool: Any = None, _stacktrace: Any = None) -> Retry:
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        left = _budget_left()
+        retry_after = self.get_retry_after(response) if response is not None and self.respect_retry_after_header else None
+        if left <= 0 or (retry_after is not None and retry_after > left):
+            raise MaxRetryError(_pool, url or "", error or ResponseError("retry budget exhausted"))  # type: ignore[arg-type]
+        return new_retry
+
+    def get_backoff_time(self) -> float:
+        return max(0.0, min(super().get_backoff_time(), _budget_left()))
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def make_session(pool_size: int = 10, retries: int = 2, backoff: float = 0.5) -> requests.Session:
+    retry = BudgetedRetry(
+        total=max(0, retries),
+        connect=max(0, retries),
+        read=0,  # a read timeout means the model is slow; retrying it only doubles the wait
+        status=max(0, retries),
+        status_forcelist=RETRY_STATUSES,
+        # inference calls are POSTs, which urllib3 does not retry by default
+        allowed_methods=frozenset({"GET", "POST"}),
+        backoff_factor=max(0.0, backoff),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=max(1, pool_size), pool_maxsize=max(1, pool_size), max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """The pooled session of this process (created on first use, rebuilt after fork)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = make_session(
+                    pool_size=int(os.environ.get("HF_POOL_SIZE", "10")),
+                    retries=int(os.environ.get("HF_RETRIES", "2")),
+                    backoff=float(os.environ.get("HF_RETRY_BACKOFF", "0.5")),
+                )
+                _session_pid = pid
+    return _session
+
+
+def reset_session() -> None:
+    """Drop the pooled session (e.g. after changing the HF_* pool settings)."""
+    global _session, _session_pid
+    with _lock:
+        if _session is not None and _session_pid == os.getpid():
+            _session.close()
+        _session, _session_pid = None, None
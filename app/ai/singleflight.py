@@ -0,0 +1,161 @@
+"""Single-flight coalescing of identical in-flight LLM requests.
+
+When a mass email lands, many requests ask for the same reply within
+seconds. ``SingleFlight.do`` lets the first caller for a key (the leader)
+run the upstream call, while concurrent callers with the same key wait on
+the leader's future and share its result (or exception). A caller with a
+``timeout`` (what is left of its request deadline) stops waiting after it and
+gets ``concurrent.futures.TimeoutError``; the leader keeps running.
+
+Across gunicorn workers the leaders of each process also take a per-key
+``flock`` in ``lock_dir``. The worker that gets it first calls upstream; the
+others, once they acquire the lock, call ``lookup`` first, which reads the
+answer the winner left in the shared LLM cache (``LLM_CACHE_PATH``).
+Without a shared cache there is nothing to look up, so only in-process
+coalescing applies.
+
+Configuration (environment):
+    LLM_SINGLEFLIGHT          1 = coalesce identical requests (default), 0 = off
+    LLM_SINGLEFLIGHT_DIR      directory for the cross-worker lock files (empty = in-process only)
+    LLM_SINGLEFLIGHT_TIMEOUT  seconds to wait for another worker's lock before calling anyway (default 60)
+"""
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple, TypeVar
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process coalescing applies
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_STALE_LOCK_SECONDS = 3600.0
+
+
+class SingleFlight:
+    def __init__(self, lock_dir: Optional[str] = None, lock_timeout: float = 60.0) -> None:
+        self.lock_dir = lock_dir
+        self.lock_timeout = float(lock_timeout)
+        self._calls: Dict[str, "Future[object]"] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._last_sweep = 0.0
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key: str, fn: Callable[[], T], lookup: Optional[Callable[[], Optional[T]]] = None,
+           timeout: Optional[float] = None) -> Tuple[T, bool]:
+        """Run ``fn`` once per in-flight ``key``; returns (result, shared with another caller)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # futures of the parent's threads never complete in a forked child
+                self._calls, self._pid = {}, os.getpid()
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result(timeout), True  # type: ignore[return-value]
+        try:
+            result, shared = self._lead(key, fn, lookup, timeout)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, shared
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+    def _lead(self, key: str, fn: Callable[[], T], lookup: Optional[Callable[[], Optional[T]]],
+              timeout: Optional[float]) -> Tuple[T, bool]:
+        if not self.lock_dir or lookup is None or fcntl is None:
+            return fn(), False
+        with self._file_lock(key, self.lock_timeout if timeout is None else min(self.lock_timeout, timeout)):
+            found = lookup()
+            if found is not None:
+                return found, True
+            return fn(), False
+
+    @contextmanager
+    def _file_lock(self, key: str, wait: float) -> Iterator[bool]:
+        path = os.path.join(str(self.lock_dir), f"sf-{key[-40:]}.lock")
+        try:
+            fh = open(path, "a+")
+        except OSError:
+            logger.exception("cannot open single-flight lock %s", path)
+            yield False
+            return
+        acquired = False
+        try:
+            deadline = time.monotonic() + wait
+            while True:
+                try:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        break  # the holder is stuck: do not let it block this request
+                    time.sleep(0.02)
+            if acquired:
+                os.utime(path)  # marks the file as in use for the stale-lock sweep
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+            fh.close()
+            self._sweep()
+
+    def _sweep(self) -> None:
+        # one lock file per distinct request; drop the ones nobody has used for a while
+        now = time.time()
+        if now - self._last_sweep < 300:
+            return
+        self._last_sweep = now
+        try:
+            for name in os.listdir(str(self.lock_dir)):
+                path = os.path.join(str(self.lock_dir), name)
+                if name.startswith("sf-") and now - os.path.getmtime(path) > _STALE_LOCK_SECONDS:
+                    os.remove(path)
+        except OSError:
+            pass
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+_flight: Optional[SingleFlight] = None
+_flight_configured = False
+_flight_lock = threading.Lock()
+
+
+def get_singleflight() -> Optional[SingleFlight]:
+    """The process coalescer, or None when LLM_SINGLEFLIGHT=0."""
+    global _flight, _flight_configured
+    if not _flight_configured:
+        with _flight_lock:
+            if not _flight_configured:
+                if os.environ.get("LLM_SINGLEFLIGHT", "1") == "1":
+                    _flight = SingleFlight(lock_dir=os.environ.get("LLM_SINGLEFLIGHT_DIR") or None,
+                                           lock_timeout=float(os.environ.get("LLM_SINGLEFLIGHT_TIMEOUT", "60")))
+                _flight_configured = True
+    return _flight
+
+
+def configure_singleflight(enabled: bool = True, lock_dir: Optional[str] = None,
+                           lock_timeout: float = 60.0) -> Optional[SingleFlight]:
+    global _flight, _flight_configured
+    _flight = SingleFlight(lock_dir, lock_timeout) if enabled else None
+    _flight_configured = True
+    return _flight
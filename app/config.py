@@ -16,6 +16,11 @@ class BaseConfig:
     ALLOW_UI_LLM_TOGGLE = os.environ.get("ALLOW_UI_LLM_TOGGLE", "0") == "1"
     # confidence below which the UI will show the 'ask assistant' button
     LLM_PROMPT_CONF_THRESHOLD = float(os.environ.get("LLM_PROMPT_CONF_THRESHOLD", "0.6"))
+    # total seconds an LLM-backed request may spend across all model candidates (0 = no limit)
+    LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE") or "25")
+    # load the model / compile rules / prime caches inside create_app (run under
+    # `gunicorn --preload` so workers inherit the warm state after fork)
+    WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "0") == "1"
 
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
@@ -30,4 +35,5 @@ class TestingConfig(BaseConfig):
 class ProductionConfig(BaseConfig):
     DEBUG = False
     TESTING = False
-    LOG_LEVEL = "INFO"
\ No newline at end of file
+    LOG_LEVEL = "INFO"
+    WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "1") == "1"
\ No newline at end of file
@@ -10,6 +10,7 @@ from flask import Flask
 from flask import send_from_directory
 from app.routes import main as routes
 from app.config import DevelopmentConfig, ProductionConfig, TestingConfig
+from app.nlp.classifier import warm_up
 
 def create_app():
     app = Flask(__name__)
@@ -46,6 +47,14 @@ def create_app():
     # Register blueprints
     app.register_blueprint(routes)
 
+    # Warm-up: under `gunicorn --preload` this runs once in the master before the
+    # workers fork, so every worker starts with the model loaded and rules compiled.
+    if bool(config.get("WARMUP_ON_START")):
+        try:
+            warm_up()
+        except Exception:
+            app.logger.exception("warm-up failed; classifier will initialize lazily")
+
     # Static assets (like tiled background) are served from app/static in production.
     return app
 
@@ -0,0 +1,154 @@
+"""Vectorized character statistics for the spam and garbled hard filters.
+
+The text is turned into a code point array and mapped through a NumPy lookup
+table in one pass, giving one class byte per character (bit flags below).
+The ratios the filters need are then read off that byte string with C-level
+``bytes.translate`` / ``count`` / ``split`` instead of per-character Python
+loops. The batch forms convert many texts with a single pass and slice the
+class bytes per document.
+
+The class bits are computed with the very predicates and regexes the filters
+used (``str.isalnum``, ``\\w``, the garbled-token character class, ...), so
+the statistics are identical to the per-character implementation.
+"""
+from typing import Callable, List, NamedTuple, Optional, Sequence
+import re
+import threading
+
+import numpy as np
+
+# punctuation that is normal in e-mail bodies (not counted as spam symbols)
+SPAM_ALLOWED_PUNCT = frozenset(".,:;()-\"'<>@/\\\n\r\t")
+# letters that make up a token for the garbled check
+GARBLED_LETTER_RE = re.compile(r"[a-zA-Zçáéíóúâêîôûãõàèìòù]")
+GARBLED_VOWELS = frozenset("aeiouáéíóúâêîôûãõàèìòù")
+_CONSONANT_RE = re.compile(r"[bcdfghjklmnpqrstvwxyz]", re.IGNORECASE)
+_WORD_CHAR_RE = re.compile(r"\w")
+
+SPAM_SYMBOL = 1  # not alphanumeric, not whitespace, not allowed punctuation
+WORD = 2  # \w
+LETTER = 4  # garbled-token letter
+VOWEL = 8
+CONSONANT = 16
+
+_BMP = 0x10000
+# table entry for code points above the BMP (clipped onto the last slot); never a real class
+_ASTRAL = 0xFF
+_lut: Optional[np.ndarray] = None
+_lut_lock = threading.Lock()
+
+
+def char_class(ch: str) -> int:
+    bits = 0
+    if not ch.isalnum() and ch not in SPAM_ALLOWED_PUNCT and not ch.isspace():
+        bits |= SPAM_SYMBOL
+    if _WORD_CHAR_RE.match(ch):
+        bits |= WORD
+    if GARBLED_LETTER_RE.match(ch):
+        bits |= LETTER
+        if ch in GARBLED_VOWELS:
+            bits |= VOWEL
+        if _CONSONANT_RE.match(ch):
+            bits |= CONSONANT
+    return bits
+
+
+def _projection(fn: Callable[[int], str]) -> bytes:
+    return bytes(ord(fn(code)) for code in range(256))
+
+
+# class byte -> "1"/"0" (spam symbol), "w"/" " (word char) and
+# "v"/"c"/"l"/" " (vowel / consonant / other letter / not a letter)
+_SYMBOL_BYTES = _projection(lambda c: "1" if c != _ASTRAL and c & SPAM_SYMBOL else "0")
+_WORD_BYTES = _projection(lambda c: "w" if c != _ASTRAL and c & WORD else " ")
+_LETTER_BYTES = _projection(
+    lambda c: " " if c == _ASTRAL or not c & LETTER else "v" if c & VOWEL else "c" if c & CONSONANT else "l"
+)
+
+
+def _table() -> np.ndarray:
+    global _lut
+    if _lut is None:
+        with _lut_lock:
+            if _lut is None:
+                lut = np.empty(_BMP + 1, dtype=np.uint8)
+                lut[:_BMP] = [char_class(chr(cp)) for cp in range(_BMP)]
+                lut[_BMP] = _ASTRAL
+                _lut = lut
+    return _lut
+
+
+def warm() -> None:
+    """Build the lookup table now (e.g. before workers fork)."""
+    _table()
+
+
+def class_bytes(text: str) -> bytes:
+    """One class byte per code point of ``text``."""
+    cps = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+    out = _table().take(cps, mode="clip").tobytes()
+    if b"\xff" not in out:
+        return out
+    # rare (emoji, math letters, ...): classify the code points above the BMP one by one
+    fixed = bytearray(out)
+    for i in np.flatnonzero(cps >= _BMP):
+        fixed[i] = char_class(text[i])
+    return bytes(fixed)
+
+
+class SpamStats(NamedTuple):
+    length: int  # code points
+    symbols: int  # SPAM_SYMBOL chars
+    tokens: int  # \w+ tokens
+    short_tokens: int  # tokens of at most 2 chars
+
+
+class GarbleStats(NamedTuple):
+    tokens: int  # runs of garbled-token letters
+    garbled: int  # tokens with vowel ratio < 0.35, or a 4+ consonant cluster and length >= 5
+
+
+def _spam_from_classes(cls: bytes) -> SpamStats:
+    words = b" " + cls.translate(_WORD_BYTES)
+    tokens = words.count(b" w")
+    # every token starts with " w"; the ones longer than 2 chars with " www"
+    return SpamStats(len(cls), cls.translate(_SYMBOL_BYTES).count(b"1"), tokens, tokens - words.count(b" www"))
+
+
+def _garble_from_classes(cls: bytes) -> GarbleStats:
+    tokens = cls.translate(_LETTER_BYTES).split()
+    garbled = 0
+    for tok in tokens:
+        if tok.count(b"v") / len(tok) < 0.35 or (len(tok) >= 5 and b"cccc" in tok):
+            garbled += 1
+    return GarbleStats(len(tokens), garbled)
+
+
+def spam_stats(text: str) -> SpamStats:
+    """Statistics for the spam filter over ``text`` (lowercased, links removed)."""
+    return _spam_from_classes(class_bytes(text))
+
+
+def garble_stats(text: str) -> GarbleStats:
+    """Statistics for the garbled filter over ``text`` (lowercased)."""
+    return _garble_from_classes(class_bytes(text))
+
+
+def _split_classes(texts: Sequence[str]) -> List[bytes]:
+    # one conversion and one table lookup for the whole batch; the separator
+    # has no class bits, so slices never share a token
+    cls = class_bytes("\n".join(texts))
+    out: List[bytes] = []
+    pos = 0
+    for t in texts:
+        out.append(cls[pos:pos + len(t)])
+        pos += len(t) + 1
+    return out
+
+
+def spam_stats_batch(texts: Sequence[str]) -> List[SpamStats]:
+    return [_spam_from_classes(c) for c in _split_classes(texts)] if texts else []
+
+
+def garble_stats_batch(texts: Sequence[str]) -> List[GarbleStats]:
+    return [_garble_from_classes(c) for c in _split_classes(texts)] if texts else []
@@ -1,5 +1,8 @@
-from typing import List, Union, Tuple, Dict, Set, Optional, cast
+from typing import Callable, List, Union, Tuple, Dict, Set, Optional, Sequence, cast
+from dataclasses import asdict, dataclass, field
+import hashlib
 import os
+import time
 import re
 import logging
 import unicodedata
@@ -11,7 +14,21 @@ import joblib  # type: ignore
 import numpy as np
 from scipy.sparse import spmatrix  # type: ignore
 
+from app.nlp import charstats
+from app.nlp.compact_model import CompactNBModel, is_compact_model, save_compact
+from app.nlp.document import AnalyzedDocument, as_document, iter_windows
+from app.nlp.online import get_learner
+from app.nlp.matcher import KeywordMatcher, normalize_for_matching as _normalize_for_matching
+from app.nlp.rules import CompiledRules, RulePack, RuleStore
+from app.utils.cache import TTLCache, TieredCache, make_cache
+from app.utils.metrics import count_decision, count_ml_fallback, observe_stage, timed
+
+# stages accept raw text or a document already analyzed by the caller
+DocumentLike = Union[str, AnalyzedDocument]
+
 MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "email_classifier_model.pkl"))
+# memory-mapped compact model directory; preferred over the pickle when present
+COMPACT_MODEL_PATH = os.environ.get("MODEL_COMPACT_PATH") or os.path.splitext(MODEL_PATH)[0] + ".compact"
 logger = logging.getLogger(__name__)
 last_decision_reason: str = ""
 _COMBINED_PRODUCTIVE_KEYWORDS: Set[str] = {
@@ -67,6 +84,16 @@ class EmailClassifier:
         prediction = self.classifier.predict(email_vector)
         return str(prediction[0])
 
+    def classify_with_proba(self, emails: Sequence[str]) -> List[Tuple[str, float]]:
+        """(label, probability) for many emails with one transform + predict_proba call."""
+        if not getattr(self, "is_trained", False):
+            raise RuntimeError("Classifier is not trained yet.")
+        X = self.vectorizer.transform([str(e) for e in emails])  # type: ignore
+        proba = np.asarray(self.classifier.predict_proba(X))
+        classes = self.classifier.classes_
+        best = proba.argmax(axis=1)
+        return [(str(classes[j]), float(proba[r, j])) for r, j in enumerate(best)]
+
     def save_model(self, model_path: str = MODEL_PATH) -> None:
         os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
         # joblib.dump's return type can be partially unknown to type checkers;
@@ -74,6 +101,12 @@ class EmailClassifier:
         # and ignore the value, since we only need the side-effect of writing the file.
         _res = cast(Optional[List[str]], joblib.dump((self.vectorizer, self.classifier), model_path)) # type: ignore
 
+    def save_compact(self, out_dir: str = COMPACT_MODEL_PATH) -> None:
+        """Write the model in the memory-mappable compact format (see app/nlp/compact_model.py)."""
+        if not getattr(self, "is_trained", False):
+            raise RuntimeError("Classifier is not trained yet.")
+        save_compact(self.vectorizer, self.classifier, out_dir)
+
     def load_model(self, model_path: str = MODEL_PATH) -> None:
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found: {model_path}")
@@ -87,155 +120,115 @@ class EmailClassifier:
             raise RuntimeError("Unknown model format in file.")
         self.is_trained = True
 
-def _normalize_for_matching(s: str) -> str:
-    """Lowercase + remove diacritics, collapse whitespace for robust keyword matching."""
-    if not s:
-        return ""
-    s = str(s).lower()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    # replace non-word with spaces to make simple substring/token checks safer
-    s = re.sub(r"[^\w\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-
-def _keyword_fallback(text: str) -> str:
-    t_norm = _normalize_for_matching(text or "")
-    tokens = re.findall(r"\w+", t_norm)
+# hard-filter patterns, compiled once
+_REPEATED_CHAR_RE = re.compile(r"(.)\1{4,}")
+# the garbled check only runs on short texts
+_GARBLED_MAX_CHARS = 200
+_ACTION_PHRASE_RE = re.compile(r"\bclick here\b|\bclique aqui\b|\bclique no botão\b|\bbotão\b|\bacesse o link\b|\bconsulte o pedido\b")
+_FEED_CONTEXT_RE = re.compile(r"ler mais|leia mais|voto positivo|comentar")
+
+
+def _keyword_fallback(text: DocumentLike) -> str:
+    doc = as_document(text)
+    t_norm = doc.normalized
+    tokens = doc.tokens
     # short / empty emails => improdutivo
     if len(tokens) == 0 or len(tokens) <= 2:
         return "Improdutivo"
-    score_p = 0
-    score_u = 0
-    # count productive keywords occurrences (phrase-aware)
-    for k in _COMBINED_PRODUCTIVE_KEYWORDS:
-        kk = _normalize_for_matching(k)
-        if " " in kk:
-            if kk in t_norm:
-                score_p += 1
-        else:
-            score_p += tokens.count(kk)
-    for k in _COMBINED_UNPRODUCTIVE_KEYWORDS:
-        kk = _normalize_for_matching(k)
-        if " " in kk:
-            if kk in t_norm:
-                score_u += 1
-        else:
-            score_u += tokens.count(kk)
+    counts = _rules_for(doc).matcher.count(t_norm, tokens)
+    return _fallback_label(counts.productive, counts.unproductive)
+
 
+def _fallback_label(score_p: int, score_u: int) -> str:
     if score_u > score_p:
         return "Improdutivo"
     if score_p > score_u and score_p > 0:
         return "Produtivo"
     return "Improdutivo"
 
-def _looks_spammy(text: str) -> bool:
-    t = (text or "").lower()
+def _looks_spammy(text: DocumentLike) -> bool:
+    doc = as_document(text)
+    t = doc.lower
 
     # recognize full urls/emails more robustly
-    email_url_re = re.compile(r"(https?://\S+|www\.\S+|[\w.+-]+@[\w.-]+\.\w+)")
-    matches = email_url_re.findall(t)
+    matches = doc.url_matches
 
     # require multiple URLs/emails to consider it spammy (single sender address is normal)
     if len(matches) >= 2:
         return True
 
     # long repeated chars (aaaaa)
-    if re.search(r"(.)\1{4,}", t):
+    if _REPEATED_CHAR_RE.search(t):
         return True
 
-    # Remove detected emails/urls before computing non-alphanumeric ratio
-    t_no_links = email_url_re.sub(" ", t)
+    # Remove detected emails/urls before computing non-alphanumeric ratio;
+    # character classes and token lengths come from one vectorized pass
+    stats = doc.memo("spam_stats", lambda: charstats.spam_stats(doc.lower_without_links))
     # count non-alphanumeric chars (excluding common punctuation used in email bodies)
-    allowed_punct = set(".,:;()-\"'<>@/\\\n\r\t")
-    non_alnum = sum(1 for c in t_no_links if not c.isalnum() and c not in allowed_punct and not c.isspace())
-    total_len = max(1, len(t_no_links))
+    total_len = max(1, stats.length)
     # make threshold more permissive for normal emails
-    if non_alnum / total_len > 0.5:
+    if stats.symbols / total_len > 0.5:
         return True
 
     # too many very short tokens
-    tokens = re.findall(r"\w+", t_no_links)
-    if tokens:
-        short_ratio = sum(1 for w in tokens if len(w) <= 2) / len(tokens)
+    if stats.tokens:
+        short_ratio = stats.short_tokens / stats.tokens
         if short_ratio > 0.6:
             return True
 
     return False
 
-def _looks_garbled(text: str) -> bool:
+def _looks_garbled(text: DocumentLike) -> bool:
     """
     Return True if text looks garbled/non‑linguistic:
     - many tokens with very low vowel ratio
     - tokens containing long consonant clusters (likely gibberish)
     - too many tokens with digits/symbols
     """
-    t = (text or "").lower()
+    doc = as_document(text)
     # skip garbled detection for reasonably long texts (likely human-written prose)
-    if len(text or "") > 200:
+    if len(doc.text) > _GARBLED_MAX_CHARS:
         return False
 
-    tokens = re.findall(r"[a-zA-Zçáéíóúâêîôûãõàèìòù]+", t)  # include common accented letters
-    if not tokens:
+    # tokens are runs of (accented) letters; per token: vowel ratio < 0.35, or a
+    # consonant cluster of 4+ in a token of 5+ letters (e.g. "sdfghjk")
+    stats = doc.memo("garble_stats", lambda: charstats.garble_stats(doc.lower))
+    if not stats.tokens:
         return True
 
-    vowels = set("aeiouáéíóúâêîôûãõàèìòù")
-    garbled_count = 0
-    digit_tokens = 0
-    consonant_cluster_re = re.compile(r"[bcdfghjklmnpqrstvwxyz]{4,}", re.IGNORECASE)
-
-    for w in tokens:
-        # digit/alpha mix
-        if any(ch.isdigit() for ch in w):
-            digit_tokens += 1
-
-        # vowel ratio
-        vowel_chars = sum(1 for ch in w if ch in vowels)
-        vowel_ratio = vowel_chars / max(1, len(w))
-        if vowel_ratio < 0.35:
-            garbled_count += 1
-            continue
-
-        # long consonant clusters (e.g., "sdfghjk")
-        if consonant_cluster_re.search(w) and len(w) >= 5:
-            garbled_count += 1
-            continue
-
-    garbled_ratio = garbled_count / len(tokens)
+    garbled_ratio = stats.garbled / stats.tokens
 
-    # If many tokens are garbled, or many tokens contain digits, consider garbled
+    # If many tokens are garbled, consider garbled. Tokens are letter runs, so
+    # the former "tokens with digits" ratio was always 0 and is not computed.
     # Use more conservative thresholds to avoid false positives on normal text
-    if garbled_ratio > 0.6 or (digit_tokens / max(1, len(tokens))) > 0.5:
+    if garbled_ratio > 0.6:
         return True
     return False
 
 
-def _looks_like_feed(text: str) -> bool:
+def _looks_like_feed(text: DocumentLike) -> bool:
     """
     Heuristic to detect feed/news-like content (multiple short article snippets,
     newsletter dumps, or social feed exports). These often contain markers like
     'Ler mais', 'Voto positivo', 'Comentar', 'Postado', 'Quora', 'Leia mais', etc.
     Return True when multiple such markers or repeated article blocks are present.
     """
-    if not text:
+    doc = as_document(text)
+    if not doc.text:
         return False
-    t = text.lower()
-    markers = [
-        "ler mais", "leia mais", "voto positivo", "votos", "comentar", "postado",
-        "quora", "notícias", "noticias", "leia também", "ver mais", "ler mais »"
-    ]
+    t = doc.lower
+    rules = _rules_for(doc)
     # simple marker count
-    marker_count = sum(t.count(m) for m in markers)
+    marker_count = sum(t.count(m) for m in rules.feed_markers)
     if marker_count >= 2:
         return True
 
     # count per-line markers (many feed exports have repeated short blocks)
-    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    lines = doc.lines
     perline = 0
     for ln in lines:
         ln_l = ln.lower()
-        if any(m in ln_l for m in ("ler mais", "leia mais", "voto positivo", "comentar")):
+        if any(m in ln_l for m in rules.feed_line_markers):
             perline += 1
     if perline >= 2:
         return True
@@ -247,7 +240,7 @@ def _looks_like_feed(text: str) -> bool:
 
     return False
 
-def _contains_actionable_elements(text: str) -> bool:
+def _contains_actionable_elements(text: DocumentLike) -> bool:
     """
     Detect if the email contains elements that require user interaction:
     - urls (http/https/www)
@@ -255,19 +248,25 @@ def _contains_actionable_elements(text: str) -> bool:
     - explicit order words near links (e.g., 'clique no botão', 'acesse o link')
     Returns True when an actionable element is present.
     """
-    if not text:
+    doc = as_document(text)
+    if not doc.text:
         return False
-    t = text.lower()
+    # memoized per document: both the hard filters and the overrides ask for it
+    return doc.memo("actionable", lambda: _detect_actionable(doc))
+
+
+def _detect_actionable(doc: AnalyzedDocument) -> bool:
+    t = doc.lower
     # urls
-    if re.search(r"https?://\S+|www\.\S+", t):
+    if doc.has_url:
         return True
     # email/payment/order patterns with 'click' / 'clique' / 'botão' nearby
-    if re.search(r"\bclick here\b|\bclique aqui\b|\bclique no botão\b|\bbotão\b|\bacesse o link\b|\bconsulte o pedido\b", t):
+    if _ACTION_PHRASE_RE.search(t):
         return True
     # short 'click' + 'order' context
     if "clique" in t or "click" in t or "botão" in t or "button" in t:
         # ensure these mentions are not in a purely feed-like context by checking for 'ler mais' nearby
-        if not re.search(r"ler mais|leia mais|voto positivo|comentar", t):
+        if not _FEED_CONTEXT_RE.search(t):
             return True
     return False
 
@@ -301,25 +300,136 @@ _DATE_PATTERNS = [
     r"\bàs?\b", r"\b\d{1,2}h\b",    # às, 15h
     r"\bdia\s+\d{1,2}\b"
 ]
-_DATE_RE = re.compile("|".join(_DATE_PATTERNS), flags=re.IGNORECASE)
+
+# markers of feed/newsletter exports (whole text) and of feed blocks (per line)
+FEED_MARKERS: List[str] = [
+    "ler mais", "leia mais", "voto positivo", "votos", "comentar", "postado",
+    "quora", "notícias", "noticias", "leia também", "ver mais", "ler mais »"
+]
+FEED_LINE_MARKERS: List[str] = ["ler mais", "leia mais", "voto positivo", "comentar"]
+
+# -- rule packs --
+# The sets above are the built-in rules. RULES_PATH points to a JSON/YAML rule
+# pack (see app.nlp.rules) with weights that overrides them section by section
+# and is hot-reloaded when the file changes. The compiled rules are rebuilt
+# automatically when any built-in set is replaced or mutated (e.g. by tests).
+_rules: Optional[CompiledRules] = None
+_rules_sig: Tuple[int, ...] = ()
+_rule_store: Optional[RuleStore] = None
+_rule_store_configured = False
+
+
+def _rules_signature() -> Tuple[int, ...]:
+    sets = (_COMBINED_PRODUCTIVE_KEYWORDS, _COMBINED_UNPRODUCTIVE_KEYWORDS, ACTION_VERBS, REQUEST_PATTERNS,
+            _DATE_PATTERNS, FEED_MARKERS, FEED_LINE_MARKERS)
+    return tuple(v for s in sets for v in (id(s), len(s)))
+
+
+def builtin_rule_pack() -> RulePack:
+    """The built-in rule sets of this module as a RulePack (defaults for any rule pack file)."""
+    return RulePack.from_sets(_COMBINED_PRODUCTIVE_KEYWORDS, _COMBINED_UNPRODUCTIVE_KEYWORDS, ACTION_VERBS,
+                              REQUEST_PATTERNS, _DATE_PATTERNS, FEED_MARKERS, FEED_LINE_MARKERS)
 
 
-def _score_text(text: str) -> Tuple[int, int, Dict[str, int]]:
+def _builtin_rules() -> CompiledRules:
+    global _rules, _rules_sig
+    sig = _rules_signature()
+    if _rules is None or sig != _rules_sig:
+        _rules = CompiledRules(builtin_rule_pack())
+        _rules_sig = sig
+    return _rules
+
+
+def configure_rules(path: Optional[str] = None, check_interval: Optional[float] = None) -> CompiledRules:
+    """Use the rule pack at ``path`` (None/empty: built-in rules only) and load it now.
+
+    Defaults come from RULES_PATH / RULES_CACHE_PATH / RULES_RELOAD_INTERVAL.
+    """
+    global _rule_store, _rule_store_configured
+    _rule_store_configured = True
+    if not path:
+        _rule_store = None
+        return _builtin_rules()
+    if check_interval is None:
+        check_interval = float(os.environ.get("RULES_RELOAD_INTERVAL", "2"))
+    store = RuleStore(path, builtin_rule_pack, cache_path=os.environ.get("RULES_CACHE_PATH") or None,
+                      check_interval=check_interval)
+    rules = store.reload()
+    _rule_store = store
+    return rules
+
+
+def _get_rules() -> CompiledRules:
+    """Active compiled rules (rule pack when configured, otherwise the built-in sets)."""
+    if not _rule_store_configured:
+        configure_rules(os.environ.get("RULES_PATH"))
+    store = _rule_store
+    if store is not None:
+        return store.get()
+    return _builtin_rules()
+
+
+def _rules_for(doc: AnalyzedDocument) -> CompiledRules:
+    """Rules pinned to one document, so a hot reload never mixes two packs in one classification."""
+    return doc.memo("rules", _get_rules)
+
+
+def _get_matcher() -> KeywordMatcher:
+    """Return the compiled keyword matcher of the active rules."""
+    return _get_rules().matcher
+
+
+def reload_rules() -> CompiledRules:
+    """Force a rebuild of the compiled rules (after editing the sets in place, or re-reading the pack)."""
+    global _rules
+    _rules = None
+    if _rule_store is not None:
+        return _rule_store.reload(force=True)
+    return _get_rules()
+
+
+def rules_info() -> Dict[str, object]:
+    rules = _get_rules()
+    info: Dict[str, object] = {"source": rules.pack.source, "fingerprint": rules.fingerprint}
+    if _rule_store is not None:
+        info.update(reloads=_rule_store.reloads, errors=_rule_store.errors)
+    return info
+
+
+def _count_request_patterns(doc: AnalyzedDocument, matcher: KeywordMatcher) -> int:
+    """Weighted request-pattern hits in sentences that also carry an action stem or a '?'."""
+    req_count = 0
+    # coarse sentences (split once per document) avoid counting unrelated occurrences in feeds
+    for sent, s_norm in doc.normalized_sentences:
+        hits = sum(w for p_norm, w in matcher.request_patterns if p_norm in s_norm)
+        # check for action verb presence in sentence or interrogative / polite marker
+        if hits and ('?' in sent or matcher.has_action_stem(s_norm)):
+            req_count += hits
+    return req_count
+
+
+@timed("score_text")
+def _score_text(text: DocumentLike) -> Tuple[int, int, Dict[str, int]]:
     """Compute simple rule-based productivity and unproductivity scores.
     Returns (prod_score, imp_score, details) where details is a dict of contributing counts.
     """
-    t_norm = _normalize_for_matching(text or "")
-    tokens = re.findall(r"\w+", t_norm)
+    return _score_signals(text)
+
+
+def _score_signals(text: DocumentLike) -> Tuple[int, int, Dict[str, int]]:
+    """_score_text without the stage timer (used per sentence by app.nlp.compaction)."""
+    doc = as_document(text)
+    t_norm = doc.normalized
+    tokens = doc.tokens
+    rules = _rules_for(doc)
+    matcher = rules.matcher
+    counts = matcher.count(t_norm, tokens)
     prod_score = 0
     imp_score = 0
     details: Dict[str, int] = {}
 
     # action verbs (stem matching)
-    action_count = 0
-    for stem in ACTION_VERBS:
-        cnt = sum(1 for tok in tokens if stem in tok)
-        if cnt:
-            action_count += cnt
+    action_count = counts.action_verb
     if action_count:
         prod_score += action_count
         details["action_verb"] = action_count
@@ -327,46 +437,14 @@ def _score_text(text: str) -> Tuple[int, int, Dict[str, int]]:
     # request patterns (phrase matches)
     # tighten detection: only count a request if it appears in a sentence
     # that also contains an action-verb stem or an explicit interrogative marker ("?")
-    req_count = 0
-    # split into coarse sentences to avoid counting unrelated occurrences in feeds
-    sentences = re.split(r"[\n\.!?]+", text or "")
-    for p in REQUEST_PATTERNS:
-        p_norm = _normalize_for_matching(p)
-        for sent in sentences:
-            s_norm = _normalize_for_matching(sent)
-            if not s_norm:
-                continue
-            if p_norm in s_norm:
-                # check for action verb presence in sentence
-                has_action = any(stem in s_norm for stem in ACTION_VERBS)
-                # or interrogative / polite marker
-                if '?' in sent or has_action:
-                    req_count += 1
+    req_count = _count_request_patterns(doc, matcher)
     if req_count:
         prod_score += req_count
         details["request_pattern"] = req_count
 
     # productive/unproductive keyword counts
-    prod_kw = 0
-    imp_kw = 0
-    for k in _COMBINED_PRODUCTIVE_KEYWORDS:
-        kk = _normalize_for_matching(k)
-        if not kk:
-            continue
-        if " " in kk:
-            if kk in t_norm:
-                prod_kw += 1
-        else:
-            prod_kw += tokens.count(kk)
-    for k in _COMBINED_UNPRODUCTIVE_KEYWORDS:
-        kk = _normalize_for_matching(k)
-        if not kk:
-            continue
-        if " " in kk:
-            if kk in t_norm:
-                imp_kw += 1
-        else:
-            imp_kw += tokens.count(kk)
+    prod_kw = counts.productive
+    imp_kw = counts.unproductive
     if prod_kw:
         prod_score += prod_kw
         details["work_context"] = prod_kw
@@ -375,25 +453,41 @@ def _score_text(text: str) -> Tuple[int, int, Dict[str, int]]:
         details["unproductive_keyword"] = imp_kw
 
     # co-occurrence boost: action/request with date/time mentions
-    if (action_count or req_count or prod_kw) and _DATE_RE.search(t_norm):
-        details["cooccurrence_boost"] = details.get("cooccurrence_boost", 0) + 2
-        prod_score += 2
+    cooc_w = rules.cooccurrence_weight
+    if cooc_w and (action_count or req_count or prod_kw) and rules.date_re.search(t_norm):
+        details["cooccurrence_boost"] = details.get("cooccurrence_boost", 0) + cooc_w
+        prod_score += cooc_w
 
     # short messages bias towards improdutivo
-    if len(tokens) <= 3:
-        imp_score += 1
-        details["short_message"] = details.get("short_message", 0) + 1
+    short_w = rules.short_message_weight
+    if short_w and len(tokens) <= 3:
+        imp_score += short_w
+        details["short_message"] = details.get("short_message", 0) + short_w
 
     return prod_score, imp_score, details
 
 
-def _apply_overrides(prod_score: int, imp_score: int, details: Dict[str, int], text: str) -> Tuple[str, str]:
+@timed("hard_filter")
+def _hard_filter(doc: DocumentLike) -> bool:
+    """Clearly spammy/garbled text, or feed-like dumps without actionable elements."""
+    return _looks_spammy(doc) or _looks_garbled(doc) or (_looks_like_feed(doc) and not _contains_actionable_elements(doc))
+
+
+@timed("apply_overrides")
+def _apply_overrides(prod_score: int, imp_score: int, details: Dict[str, int], text: DocumentLike) -> Tuple[str, str]:
     """Decide final label based on scores and simple overrides.
     Returns (decision_label, reason_key).
     """
+    return _decide(prod_score, imp_score, details,
+                   lambda: _contains_actionable_elements(text), lambda: _keyword_fallback(text))
+
+
+def _decide(prod_score: int, imp_score: int, details: Dict[str, int],
+            actionable: Callable[[], bool], fallback: Callable[[], str]) -> Tuple[str, str]:
+    """Override logic behind _apply_overrides, with the document-level checks passed in."""
     # if no signals, fall back to keyword heuristic
     if (not details or (prod_score == 0 and imp_score == 0)):
-        fb = _keyword_fallback(text)
+        fb = fallback()
         return fb, "no_score_fallback"
 
     # clear major majority
@@ -402,7 +496,7 @@ def _apply_overrides(prod_score: int, imp_score: int, details: Dict[str, int], t
     # requires user interaction. This replaces the prior feed-like override which
     # was marking many legitimate transactional/actionable emails as improdutivo.
     try:
-        if _contains_actionable_elements(text):
+        if actionable():
             return "Produtivo", "contains_action"
     except Exception:
         logger.debug("actionable element detection failed")
@@ -419,21 +513,37 @@ def _apply_overrides(prod_score: int, imp_score: int, details: Dict[str, int], t
         return "Improdutivo", "score_close_imp"
 
     # exact tie: use keyword fallback
-    fb = _keyword_fallback(text)
+    fb = fallback()
     return fb, "tie_fallback"
 
 
 # -- confidence / ML fallback support --
 _ml_clf = None
 
+def _online_mode() -> bool:
+    """ML_MODE=online (with LOAD_MODEL=1) uses the feedback-trained OnlineEmailClassifier."""
+    return os.environ.get("ML_MODE", "batch") == "online" and os.environ.get("LOAD_MODEL", "0") == "1"
+
+
 def _load_ml_model_if_requested():
-    """Lazily load a saved sklearn model if environment requests it. Safe no-op otherwise."""
+    """Lazily load a saved model if environment requests it. Safe no-op otherwise.
+    The compact memory-mapped format is preferred; the joblib pickle is the fallback.
+    """
     global _ml_clf
     try:
+        if _online_mode():
+            # the learner reloads the model whenever a worker saves a newer version
+            model = get_learner().model
+            _ml_clf = model if model.is_trained else None
+            return
         if _ml_clf is not None:
             return
         if os.environ.get("LOAD_MODEL", "0") != "1":
             return
+        if is_compact_model(COMPACT_MODEL_PATH):
+            _ml_clf = CompactNBModel(COMPACT_MODEL_PATH)
+            logger.info("Loaded compact ML model from %s", COMPACT_MODEL_PATH)
+            return
         if not os.path.exists(MODEL_PATH):
             logger.info("ML model requested but MODEL_PATH not found: %s", MODEL_PATH)
             return
@@ -444,16 +554,52 @@ def _load_ml_model_if_requested():
     except Exception:
         logger.exception("failed loading ML model; proceeding without it")
 
-def _try_ml_classify(text: str) -> Union[str, None]:
-    """Return ML label or None if unavailable/error."""
+
+def convert_model_to_compact(model_path: str = MODEL_PATH, out_dir: str = COMPACT_MODEL_PATH) -> str:
+    """Convert an existing joblib model (email_classifier_model.pkl) to the compact format."""
+    clf = EmailClassifier()
+    clf.load_model(model_path)
+    clf.save_compact(out_dir)
+    return out_dir
+
+def _try_ml_classify(text: str) -> Optional[Tuple[str, float]]:
+    """Return (ML label, its probability) or None if unavailable/error."""
+    return _try_ml_classify_batch([text])[0]
+
+
+def _try_ml_classify_batch(texts: Sequence[str]) -> List[Optional[Tuple[str, float]]]:
+    """(label, probability) per text from one vectorize + predict_proba call; None entries when unavailable."""
+    if not texts:
+        return []
     _load_ml_model_if_requested()
     if _ml_clf is None:
-        return None
+        count_ml_fallback("unavailable", len(texts))
+        return [None] * len(texts)
+    started = time.perf_counter()
     try:
-        return _ml_clf.classify(text)
+        predictions: List[Optional[Tuple[str, float]]] = list(_ml_clf.classify_with_proba(texts))
     except Exception:
         logger.exception("ml classify failed")
-        return None
+        count_ml_fallback("error", len(texts))
+        return [None] * len(texts)
+    finally:
+        observe_stage("ml_fallback", time.perf_counter() - started)
+    count_ml_fallback("used", len(texts))
+    return predictions
+
+def _confidence_boost(details: Dict[str, int]) -> float:
+    """Part of the confidence that comes from strong signals; never shrinks as more text is scored."""
+    boost = 0.0
+    if details.get("action_verb"):
+        boost += 0.15
+    if details.get("request_pattern"):
+        boost += 0.15
+    if details.get("work_context"):
+        boost += 0.1
+    if details.get("cooccurrence_boost"):
+        boost += 0.1
+    return boost
+
 
 def _compute_confidence(prod_score: int, imp_score: int, details: Dict[str, int]) -> float:
     """Compute a heuristic confidence in [0.0, 1.0] from scores/details.
@@ -465,67 +611,513 @@ def _compute_confidence(prod_score: int, imp_score: int, details: Dict[str, int]
     if total <= 0:
         return 0.15
     base = abs(prod_score - imp_score) / float(total)
-    # boost for strong signals
-    boost = 0.0
-    if details.get("action_verb"):
-        boost += 0.15
-    if details.get("request_pattern"):
-        boost += 0.15
-    if details.get("work_context"):
-        boost += 0.1
-    if details.get("cooccurrence_boost"):
-        boost += 0.1
-    conf = min(1.0, base + boost)
+    conf = min(1.0, base + _confidence_boost(details))
     # clamp low-confidence cases a bit higher if base is tiny but boost exists
     return round(conf, 3)
 
-def classify_text_with_confidence(text: str, ml_threshold: float = 0.45) -> Tuple[str, float, bool]:
-    """Return (decision_label, confidence, used_ml_flag).
+# -- result cache --
+# Keyed by sha256(text) plus a version of the rule set and ML model, so edits to
+# the keyword sets or a new model file invalidate old entries automatically.
+# CLASSIFY_CACHE_SIZE=0 disables it; CLASSIFY_CACHE_PATH adds a SQLite file
+# shared by all worker processes on the host.
+_result_cache: Optional[Union[TTLCache, TieredCache]] = None
+_result_cache_configured = False
+
+
+def _get_result_cache() -> Optional[Union[TTLCache, TieredCache]]:
+    global _result_cache, _result_cache_configured
+    if not _result_cache_configured:
+        try:
+            size = int(os.environ.get("CLASSIFY_CACHE_SIZE", "2048"))
+            ttl = float(os.environ.get("CLASSIFY_CACHE_TTL", "3600"))
+            path = os.environ.get("CLASSIFY_CACHE_PATH") or None
+            _result_cache = make_cache(size, ttl, path) if size > 0 else None
+        except Exception:
+            logger.exception("invalid classification cache settings; cache disabled")
+            _result_cache = None
+        _result_cache_configured = True
+    return _result_cache
+
+
+def configure_result_cache(maxsize: int = 2048, ttl: float = 3600.0, path: Optional[str] = None) -> None:
+    """Replace the classification result cache (maxsize=0 disables it)."""
+    global _result_cache, _result_cache_configured
+    _result_cache = make_cache(maxsize, ttl, path) if maxsize > 0 else None
+    _result_cache_configured = True
+
+
+def clear_result_cache() -> None:
+    cache = _get_result_cache()
+    if cache is not None:
+        cache.clear()
+
+
+def result_cache_stats() -> Dict[str, object]:
+    """Hit/miss counters of the classification result cache."""
+    cache = _get_result_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+def _model_stamp() -> str:
+    if _ml_clf is not None:
+        loaded = "loaded"
+    elif os.environ.get("LOAD_MODEL", "0") == "1":
+        loaded = "requested"
+    else:
+        return "none"
+    if _online_mode():
+        path = get_learner().model_path
+    elif is_compact_model(COMPACT_MODEL_PATH):
+        path = os.path.join(COMPACT_MODEL_PATH, "meta.json")
+    else:
+        path = MODEL_PATH
+    try:
+        st = os.stat(path)
+        return f"{loaded}:{st.st_mtime_ns}:{st.st_size}"
+    except OSError:
+        return f"{loaded}:missing"
+
+
+def _result_cache_key(kind: str, text: str, ml_threshold: float = 0.0,
+                      rules: Optional[CompiledRules] = None) -> str:
+    h = hashlib.sha256()
+    h.update(f"{kind}|{(rules or _get_rules()).fingerprint}|{_model_stamp()}|{ml_threshold!r}|".encode("utf-8"))
+    h.update((text or "").encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+@dataclass
+class ClassificationResult:
+    """Outcome of one classification: decision plus everything needed to explain/render it."""
+    decision: str
+    confidence: float
+    reason: str
+    used_ml: bool = False
+    prod_score: int = 0
+    imp_score: int = 0
+    details: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def needs_review(self) -> bool:
+        # long documents carry a ":truncated" / ":early_exit" suffix
+        return self.reason.split(":", 1)[0] == "needs_human_review"
+
+    def as_tuple(self) -> Tuple[str, float, bool]:
+        """(decision_label, confidence, used_ml_flag), as returned by classify_text_with_confidence."""
+        return self.decision, self.confidence, self.used_ml
+
+    def render_html(self) -> str:
+        """HTML score fragment for the web UI."""
+        return _render_score_html(self.prod_score, self.imp_score, self.details, self.reason)
+
+
+def classify_text_result(text: str, ml_threshold: float = 0.45) -> ClassificationResult:
+    """Run the full pipeline once and return a ClassificationResult.
     If confidence < ml_threshold and an ML model is available, use ML as a fallback.
-    If ML not available and confidence low, returns heuristic decision with low confidence and needs_review True.
+    If ML not available and confidence low, the reason is 'needs_human_review'.
+    Results are served from the result cache when enabled (see _get_result_cache).
     """
-    global last_decision_reason
-    last_decision_reason = ""
-
+    cache = _get_result_cache()
+    if cache is None:
+        result = _classify_text_uncached(text, ml_threshold)
+        count_decision(result.reason)
+        return result
+    # key and pipeline use the same rules even if a pack reload lands in between
+    rules = _get_rules()
+    key = _result_cache_key("result", text, ml_threshold, rules)
+    cached = cache.get(key)
+    if cached is not None:
+        result = ClassificationResult(**{**cached, "details": dict(cached["details"])})
+    else:
+        result = _classify_text_uncached(text, ml_threshold, rules)
+        cache.set(key, asdict(result))
+    count_decision(result.reason)
+    return result
+
+
+def _classify_text_uncached(text: str, ml_threshold: float,
+                            rules: Optional[CompiledRules] = None) -> ClassificationResult:
+    """Pipeline behind classify_text_result; pure function of its input and the active rules."""
     if not text or not text.strip():
-        last_decision_reason = "empty_or_whitespace"
-        return "Improdutivo", 0.0, False
+        return ClassificationResult("Improdutivo", 0.0, "empty_or_whitespace")
+    if _is_long(text):
+        return _classify_long_text(text, ml_threshold, rules or _get_rules())
+
+    doc = AnalyzedDocument(text)
+    if rules is not None:
+        doc.memo("rules", lambda: rules)
 
     # hard filters (spam/garbled or feed-like without actionable elements)
     try:
         # treat clearly spammy/garbled text as improdutivo; also treat feed-like dumps
         # as improdutivo unless they contain actionable elements (links/buttons/etc).
-        if _looks_spammy(text) or _looks_garbled(text) or (_looks_like_feed(text) and not _contains_actionable_elements(text)):
-            last_decision_reason = "hard_filter_spam_or_garbled_or_feed"
-            return "Improdutivo", 1.0, False
+        if _hard_filter(doc):
+            return ClassificationResult("Improdutivo", 1.0, "hard_filter_spam_or_garbled_or_feed")
     except Exception:
         logger.exception("error in hard filters; proceeding to scoring")
 
     try:
-        prod_score, imp_score, details = _score_text(text)
-        decision, reason = _apply_overrides(prod_score, imp_score, details, text)
+        prod_score, imp_score, details = _score_text(doc)
+        decision, reason = _apply_overrides(prod_score, imp_score, details, doc)
         conf = _compute_confidence(prod_score, imp_score, details)
-        last_decision_reason = reason
 
         used_ml = False
         if conf < ml_threshold:
             # low confidence: try ML fallback if available
-            ml_label = _try_ml_classify(text)
-            if ml_label:
-                decision = ml_label
-                last_decision_reason = "ml_fallback"
-                conf = max(conf, 0.75)
+            ml = _try_ml_classify(text)
+            if ml:
+                # confidence is the model's own probability for the label it chose
+                decision, conf = ml[0], round(ml[1], 3)
+                reason = "ml_fallback"
                 used_ml = True
             else:
                 # mark for human review (routes can use this)
-                last_decision_reason = "needs_human_review"
+                reason = "needs_human_review"
 
-        return decision, conf, used_ml
+        return ClassificationResult(decision, conf, reason, used_ml, prod_score, imp_score, details)
     except Exception:
         logger.exception("error in scoring engine; falling back to keyword heuristic")
-        fallback = _keyword_fallback(text)
-        last_decision_reason = "keyword_fallback"
-        return fallback, 0.25, False
+        return ClassificationResult(_keyword_fallback(doc), 0.25, "keyword_fallback")
+
+
+# -- long documents --
+# Very long inputs (e.g. multi-page PDFs) are scored window by window with the
+# same rules, so the cost follows the text actually read and is capped:
+# CLASSIFY_MAX_CHARS bounds the characters scored and CLASSIFY_MAX_CPU_MS the
+# CPU time spent (0 disables a cap). Scoring stops early only when the rest of
+# the text cannot change the outcome: an actionable element plus some score
+# fixes the contains_action decision, and the signal boost alone already keeps
+# the confidence at or above the review threshold (it only grows with more
+# text, and the score-balance part is never negative). The reported scores and
+# confidence then cover the text read. When not all of the text was read the
+# reason gets a ":truncated" or ":early_exit" suffix.
+STREAM_THRESHOLD_CHARS = int(os.environ.get("CLASSIFY_STREAM_THRESHOLD", "20000"))
+STREAM_WINDOW_CHARS = int(os.environ.get("CLASSIFY_WINDOW_CHARS", "8000"))
+MAX_SCORED_CHARS = int(os.environ.get("CLASSIFY_MAX_CHARS", "200000"))
+MAX_SCORING_CPU_MS = float(os.environ.get("CLASSIFY_MAX_CPU_MS", "250"))
+
+
+def _is_long(text: str) -> bool:
+    return STREAM_THRESHOLD_CHARS > 0 and len(text or "") > STREAM_THRESHOLD_CHARS
+
+
+@dataclass
+class _WindowedScore:
+    prod_score: int
+    imp_score: int
+    details: Dict[str, int]
+    decision: str
+    reason: str
+    scored_chars: int
+    stop: str = ""  # "", "early_exit" or "truncated"
+
+    @property
+    def full_reason(self) -> str:
+        return f"{self.reason}:{self.stop}" if self.stop else self.reason
+
+
+@timed("score_windows")
+def _score_windows(text: str, rules: CompiledRules, ml_threshold: float = 0.0) -> _WindowedScore:
+    """Same scores as _score_text + _apply_overrides, accumulated over windows of the text.
+
+    Phrases count once per document and request patterns per sentence, as in
+    the whole-text path; only matches spanning a window boundary are lost.
+    ``ml_threshold`` is the caller's review threshold, used for the early exit.
+    """
+    matcher = rules.matcher
+    deadline = time.thread_time() + MAX_SCORING_CPU_MS / 1000.0 if MAX_SCORING_CPU_MS > 0 else None
+    action = req = prod_tok = imp_tok = n_tokens = 0
+    prod_phrases: Dict[str, int] = {}
+    imp_phrases: Dict[str, int] = {}
+    has_date = actionable = False
+
+    def totals() -> Tuple[int, int, Dict[str, int]]:
+        prod_kw = prod_tok + sum(prod_phrases.values())
+        imp_kw = imp_tok + sum(imp_phrases.values())
+        details: Dict[str, int] = {}
+        for key, value in (("action_verb", action), ("request_pattern", req), ("work_context", prod_kw),
+                           ("unproductive_keyword", imp_kw)):
+            if value:
+                details[key] = value
+        prod, imp = action + req + prod_kw, imp_kw
+        if rules.cooccurrence_weight and (action or req or prod_kw) and has_date:
+            details["cooccurrence_boost"] = rules.cooccurrence_weight
+            prod += rules.cooccurrence_weight
+        if rules.short_message_weight and n_tokens <= 3:
+            details["short_message"] = rules.short_message_weight
+            imp += rules.short_message_weight
+        return prod, imp, details
+
+    scored = 0
+    stop = ""
+    for offset, chunk in iter_windows(text, STREAM_WINDOW_CHARS, MAX_SCORED_CHARS):
+        doc = AnalyzedDocument(chunk)
+        doc.memo("rules", lambda: rules)
+        counts = matcher.count_tokens(doc.tokens)
+        action += counts.action_verb
+        prod_tok += counts.productive
+        imp_tok += counts.unproductive
+        found_prod, found_imp = matcher.matched_phrases(doc.normalized)
+        prod_phrases.update(found_prod)
+        imp_phrases.update(found_imp)
+        req += _count_request_patterns(doc, matcher)
+        n_tokens += len(doc.tokens)
+        has_date = has_date or rules.date_re.search(doc.normalized) is not None
+        actionable = actionable or _contains_actionable_elements(doc)
+        scored = offset + len(chunk)
+        if scored >= len(text):
+            break
+        prod, imp, details = totals()
+        if actionable and (prod or imp) and round(_confidence_boost(details), 3) >= ml_threshold:
+            stop = "early_exit"
+            break
+        if deadline is not None and time.thread_time() >= deadline:
+            stop = "truncated"
+            break
+    if not stop and scored < len(text):
+        stop = "truncated"
+
+    prod, imp, details = totals()
+    prod_kw, imp_kw = details.get("work_context", 0), details.get("unproductive_keyword", 0)
+    decision, reason = _decide(prod, imp, details, lambda: actionable,
+                               lambda: "Improdutivo" if n_tokens <= 2 else _fallback_label(prod_kw, imp_kw))
+    return _WindowedScore(prod, imp, details, decision, reason, scored, stop)
+
+
+def _classify_long_text(text: str, ml_threshold: float, rules: CompiledRules) -> ClassificationResult:
+    # hard filters only look at the first window: their ratios are settled long before
+    head = AnalyzedDocument(text[:STREAM_WINDOW_CHARS])
+    head.memo("rules", lambda: rules)
+    try:
+        if _hard_filter(head):
+            return ClassificationResult("Improdutivo", 1.0, "hard_filter_spam_or_garbled_or_feed:truncated")
+    except Exception:
+        logger.exception("error in hard filters; proceeding to scoring")
+
+    try:
+        ws = _score_windows(text, rules, ml_threshold)
+        conf = _compute_confidence(ws.prod_score, ws.imp_score, ws.details)
+        decision, reason, used_ml = ws.decision, ws.reason, False
+        if conf < ml_threshold:
+            # the model sees the same prefix the rules scored
+            ml = _try_ml_classify(text[:ws.scored_chars])
+            if ml:
+                decision, conf = ml[0], round(ml[1], 3)
+                reason = "ml_fallback"
+                used_ml = True
+            else:
+                reason = "needs_human_review"
+        if ws.stop:
+            reason = f"{reason}:{ws.stop}"
+        return ClassificationResult(decision, conf, reason, used_ml, ws.prod_score, ws.imp_score, ws.details)
+    except Exception:
+        logger.exception("error in windowed scoring; falling back to keyword heuristic")
+        return ClassificationResult(_keyword_fallback(head), 0.25, "keyword_fallback:truncated")
+
+
+def classify_text_with_confidence(text: str, ml_threshold: float = 0.45) -> Tuple[str, float, bool]:
+    """Return (decision_label, confidence, used_ml_flag).
+    Thin wrapper over classify_text_result kept for existing callers; also sets
+    last_decision_reason for get_last_decision_reason().
+    """
+    global last_decision_reason
+    result = classify_text_result(text, ml_threshold=ml_threshold)
+    last_decision_reason = result.reason
+    return result.as_tuple()
+
+
+def classify_batch(texts: Sequence[str], ml_threshold: float = 0.45) -> List[ClassificationResult]:
+    """Classify many texts at once; result i matches classify_text_result(texts[i]).
+
+    Keyword, stem and token counts for the whole batch come from one sparse
+    document-term matrix multiplied by per-term weights taken from the compiled
+    matcher; scores and confidences are then computed as array operations.
+    Sentence-level request patterns, hard filters and overrides stay per document.
+    """
+    results: List[Optional[ClassificationResult]] = [None] * len(texts)
+    docs: List[AnalyzedDocument] = []
+    positions: List[int] = []
+    # one rule pack for the whole batch
+    rules = _get_rules()
+    candidates: List[Tuple[int, AnalyzedDocument]] = []
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            results[i] = ClassificationResult("Improdutivo", 0.0, "empty_or_whitespace")
+            continue
+        if _is_long(text):
+            results[i] = _classify_long_text(text, ml_threshold, rules)
+            continue
+        doc = AnalyzedDocument(text)
+        doc.memo("rules", lambda: rules)
+        candidates.append((i, doc))
+
+    _precompute_char_stats([doc for _, doc in candidates])
+    for i, doc in candidates:
+        try:
+            if _hard_filter(doc):
+                results[i] = ClassificationResult("Improdutivo", 1.0, "hard_filter_spam_or_garbled_or_feed")
+                continue
+        except Exception:
+            logger.exception("error in hard filters; proceeding to scoring")
+        docs.append(doc)
+        positions.append(i)
+
+    if docs:
+        try:
+            scored = _classify_scored_batch(docs, ml_threshold, rules)
+        except Exception:
+            logger.exception("batch scoring failed; classifying one by one")
+            scored = [_classify_text_uncached(doc.text, ml_threshold, rules) for doc in docs]
+        for i, res in zip(positions, scored):
+            results[i] = res
+    for res in cast(List[ClassificationResult], results):
+        count_decision(res.reason)
+    return cast(List[ClassificationResult], results)
+
+
+def _precompute_char_stats(docs: Sequence[AnalyzedDocument]) -> None:
+    """Fill the spam/garbled filter statistics of many documents in one vectorized pass."""
+    try:
+        for doc, stats in zip(docs, charstats.spam_stats_batch([d.lower_without_links for d in docs])):
+            doc.memo("spam_stats", lambda s=stats: s)
+        short = [d for d in docs if len(d.text) <= _GARBLED_MAX_CHARS]
+        for doc, gstats in zip(short, charstats.garble_stats_batch([d.lower for d in short])):
+            doc.memo("garble_stats", lambda s=gstats: s)
+    except Exception:
+        # the filters compute their own statistics when these are missing
+        logger.exception("batch character statistics failed")
+
+
+@timed("score_batch")
+def _keyword_count_matrix(docs: Sequence[AnalyzedDocument], matcher: KeywordMatcher) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (weights, n_tokens): per-document [action, productive, unproductive] counts and token totals."""
+    vectorizer = CountVectorizer(token_pattern=r"(?u)\w+", lowercase=False, dtype=np.int64)
+    try:
+        X = vectorizer.fit_transform([d.normalized for d in docs])  # type: ignore
+    except ValueError:
+        # no tokens anywhere in the batch ("empty vocabulary")
+        return np.zeros((len(docs), 3), dtype=np.int64), np.zeros(len(docs), dtype=np.int64)
+    terms = vectorizer.get_feature_names_out()  # type: ignore
+    W = np.array([matcher.token_weights(str(t)) for t in terms], dtype=np.int64).reshape(-1, 3)
+    weights = np.asarray(X @ W)
+    n_tokens = np.asarray(X.sum(axis=1)).ravel()
+    # multi-word phrases are substring checks on the normalized text
+    for row, doc in enumerate(docs):
+        t_norm = doc.normalized
+        for phrase, mult in matcher.productive_phrases:
+            if phrase in t_norm:
+                weights[row, 1] += mult
+        for phrase, mult in matcher.unproductive_phrases:
+            if phrase in t_norm:
+                weights[row, 2] += mult
+    return weights, n_tokens
+
+
+def _classify_scored_batch(docs: Sequence[AnalyzedDocument], ml_threshold: float,
+                           rules: CompiledRules) -> List[ClassificationResult]:
+    matcher = rules.matcher
+    cooc_w, short_w = rules.cooccurrence_weight, rules.short_message_weight
+    weights, n_tokens = _keyword_count_matrix(docs, matcher)
+    action, prod_kw, imp_kw = weights[:, 0], weights[:, 1], weights[:, 2]
+    req = np.array([_count_request_patterns(d, matcher) for d in docs], dtype=np.int64)
+    has_date = np.array([bool(cooc_w) and rules.date_re.search(d.normalized) is not None for d in docs], dtype=bool)
+    cooc = ((action > 0) | (req > 0) | (prod_kw > 0)) & has_date
+    short = (n_tokens <= 3) & bool(short_w)
+
+    prod_score = action + req + prod_kw + cooc_w * cooc
+    imp_score = imp_kw + short_w * short
+
+    # same arithmetic, in the same order, as _compute_confidence
+    total = prod_score + imp_score
+    base = np.abs(prod_score - imp_score) / np.maximum(total, 1).astype(np.float64)
+    boost = np.zeros(len(docs), dtype=np.float64)
+    boost += np.where(action > 0, 0.15, 0.0)
+    boost += np.where(req > 0, 0.15, 0.0)
+    boost += np.where(prod_kw > 0, 0.1, 0.0)
+    boost += np.where(cooc, 0.1, 0.0)
+    conf = np.where(total <= 0, 0.15, np.minimum(1.0, base + boost))
+
+    results: List[ClassificationResult] = []
+    low_conf: List[int] = []
+    for row, doc in enumerate(docs):
+        details: Dict[str, int] = {}
+        for key, arr in (("action_verb", action), ("request_pattern", req), ("work_context", prod_kw),
+                         ("unproductive_keyword", imp_kw)):
+            if arr[row]:
+                details[key] = int(arr[row])
+        if cooc[row]:
+            details["cooccurrence_boost"] = cooc_w
+        if short[row]:
+            details["short_message"] = short_w
+        p, i = int(prod_score[row]), int(imp_score[row])
+        try:
+            decision, reason = _apply_overrides(p, i, details, doc)
+        except Exception:
+            logger.exception("error in scoring engine; falling back to keyword heuristic")
+            results.append(ClassificationResult(_keyword_fallback(doc), 0.25, "keyword_fallback"))
+            continue
+        # Python's round() (not np.round) so values are bit-identical to the scalar path
+        c = round(float(conf[row]), 3)
+        if c < ml_threshold:
+            low_conf.append(row)
+        results.append(ClassificationResult(decision, c, reason, False, p, i, details))
+
+    # all low-confidence items go to the ML model together
+    if low_conf:
+        predictions = _try_ml_classify_batch([docs[row].text for row in low_conf])
+        for row, ml in zip(low_conf, predictions):
+            res = results[row]
+            if ml:
+                res.decision, res.confidence, res.reason, res.used_ml = ml[0], round(ml[1], 3), "ml_fallback", True
+            else:
+                res.reason = "needs_human_review"
+    return results
+
+
+# -- warm-up / readiness --
+_WARMUP_SAMPLES = (
+    "Por favor, poderia revisar o anexo e confirmar a reunião amanhã às 15h?",
+    "Could you please update the status of the support ticket?",
+    "Feliz aniversário! Obrigado e abraços.",
+    "Ler mais\nVoto positivo\nComentar\nLer mais",
+    "Clique aqui para acessar https://exemplo.com/pedido",
+)
+_warm = False
+
+
+def is_warm() -> bool:
+    """True once warm_up() has completed in this process (or its pre-fork parent)."""
+    return _warm
+
+
+def warm_up(samples: Sequence[str] = _WARMUP_SAMPLES) -> Dict[str, object]:
+    """Load the ML model, compile the rule structures, configure the caches and run a
+    few synthetic classifications so lazy imports and memo tables are populated.
+
+    Meant to run in the gunicorn master under --preload, before workers fork, so
+    every worker inherits the warm state copy-on-write. Safe to call repeatedly.
+    """
+    global _warm
+    started = time.perf_counter()
+    rules = reload_rules()
+    charstats.warm()
+    _load_ml_model_if_requested()
+    _get_result_cache()
+    for text in samples:
+        # bypass the result cache: warm the pipeline, don't fill the cache with samples
+        _classify_text_uncached(text, ml_threshold=0.0)
+    classify_batch(list(samples), ml_threshold=0.0)
+    if _ml_clf is not None:
+        try:
+            _ml_clf.classify(samples[0])
+        except Exception:
+            logger.exception("ML model warm-up classification failed")
+    _warm = True
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("classifier warm-up done in %.1f ms (model=%s)", elapsed_ms, type(_ml_clf).__name__ if _ml_clf else None)
+    return {"elapsed_ms": elapsed_ms, "model_loaded": _ml_clf is not None, "rules": rules.fingerprint}
 
 
 def classify_text(text: str) -> str:
@@ -537,17 +1129,31 @@ def classify_text(text: str) -> str:
       - fallback -> _keyword_fallback
     Sets last_decision_reason for debugging.
     """
+    decision = _classify_text(text)
+    count_decision(last_decision_reason)
+    return decision
+
+
+def _classify_text(text: str) -> str:
     global last_decision_reason
     last_decision_reason = ""
 
     if not text or not text.strip():
         last_decision_reason = "empty_or_whitespace"
         logger.info("classification: Improdutivo (%s)", last_decision_reason)
+    if _is_long(text):
+        # same bounded windowed scoring as classify_text_result; no ML fallback here
+        result = _classify_long_text(text, 0.0, _get_rules())
+        last_decision_reason = result.reason
+        logger.info("classification: %s (%s)", result.decision, last_decision_reason)
+        return result.decision
+
+    doc = AnalyzedDocument(text)
     # Hard filters (spam/garbled or feed-like without actionable elements)
     try:
         # treat clearly spammy/garbled text as improdutivo; also treat feed-like dumps
         # as improdutivo unless they contain actionable elements (links/buttons/etc).
-        if _looks_spammy(text) or _looks_garbled(text) or (_looks_like_feed(text) and not _contains_actionable_elements(text)):
+        if _hard_filter(doc):
             last_decision_reason = "hard_filter_spam_or_garbled_or_feed"
             logger.info("classification: Improdutivo (%s)", last_decision_reason)
             return "Improdutivo"
@@ -559,8 +1165,8 @@ def classify_text(text: str) -> str:
 
     # Scoring engine (preferred)
     try:
-        prod_score, imp_score, details = _score_text(text)  # type: ignore
-        result = _apply_overrides(prod_score, imp_score, details, text)
+        prod_score, imp_score, details = _score_text(doc)  # type: ignore
+        result = _apply_overrides(prod_score, imp_score, details, doc)
         try:
             decision, reason = result  # type: ignore[assignment]
         except (TypeError, ValueError):
@@ -580,7 +1186,7 @@ def classify_text(text: str) -> str:
 
     # Final fallback: keyword heuristic
     try:
-        fallback = _keyword_fallback(text)
+        fallback = _keyword_fallback(doc)
         # compute token count outside any f-string to avoid backslash-in-expression issues
         token_count = len(re.findall(r"\w+", (text or "")))
         last_decision_reason = f"keyword_fallback ({token_count} tokens)"
@@ -635,18 +1241,35 @@ def classify_text_html(text: str) -> Tuple[str, str, Dict[str, int]]:
     Run scoring and return (decision, html_fragment).
     Does not change existing classify_text behavior.
     """
+    cache = _get_result_cache()
+    rules = _get_rules()
+    key = _result_cache_key("html", text, rules=rules) if cache is not None else ""
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0], cached[1], dict(cached[2])
+    doc = AnalyzedDocument(text)
+    doc.memo("rules", lambda: rules)
     try:
-        prod_score, imp_score, details = _score_text(text)
-        decision, reason = _apply_overrides(prod_score, imp_score, details, text)
+        if _is_long(text):
+            ws = _score_windows(text, rules)
+            prod_score, imp_score, details = ws.prod_score, ws.imp_score, ws.details
+            decision, reason = ws.decision, ws.full_reason
+        else:
+            prod_score, imp_score, details = _score_text(doc)
+            decision, reason = _apply_overrides(prod_score, imp_score, details, doc)
     except Exception:
         # fallback: safe degrade to keyword_fallback and empty details
-        decision = _keyword_fallback(text)
+        decision = _keyword_fallback(doc)
         prod_score = 0
         imp_score = 0
         details = {}
         reason = "fallback_html"
 
     html = _render_score_html(prod_score, imp_score, details, reason)
+    if cache is not None:
+        # the caller owns the returned dict; the cache keeps its own copy
+        cache.set(key, [decision, html, dict(details)])
     return decision, html, details
 
 def classify_email_html(text: str) -> Tuple[str, str, Dict[str, int]]:
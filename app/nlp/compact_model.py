@@ -0,0 +1,150 @@
+"""Compact, memory-mapped on-disk format for the Naive Bayes e-mail model.
+
+The joblib pickle written by ``EmailClassifier.save_model`` has to be fully
+unpickled by every worker (including the vocabulary dict). The compact format
+is a directory of plain ``.npy`` arrays that are opened with ``mmap_mode="r"``,
+so all gunicorn workers on a host share one page-cache copy and loading takes
+milliseconds:
+
+- ``vocab.npy``: sorted unicode array of vocabulary terms (binary-searched)
+- ``feature_log_prob.npy``: float32, shape (n_features, n_classes)
+- ``class_log_prior.npy``: float32, shape (n_classes,)
+- ``meta.json``: classes and tokenizer settings; written last, so a directory
+  without it is an incomplete conversion and is ignored.
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+import json
+import os
+import re
+
+import numpy as np
+from scipy.sparse import csr_matrix  # type: ignore
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+# CountVectorizer settings the compact scorer reproduces; anything else is rejected
+_SUPPORTED_VECTORIZER = {
+    "analyzer": "word",
+    "ngram_range": (1, 1),
+    "preprocessor": None,
+    "tokenizer": None,
+    "stop_words": None,
+    "strip_accents": None,
+}
+
+
+def _check_vectorizer(vectorizer: Any) -> None:
+    params = vectorizer.get_params()
+    for name, expected in _SUPPORTED_VECTORIZER.items():
+        value = params.get(name)
+        if name == "ngram_range":
+            value = tuple(value)
+        if value != expected:
+            raise ValueError(f"compact format does not support CountVectorizer({name}={value!r})")
+    if params.get("binary"):
+        raise ValueError("compact format does not support CountVectorizer(binary=True)")
+
+
+def save_compact(vectorizer: Any, classifier: Any, out_dir: str) -> None:
+    """Write a fitted CountVectorizer + MultinomialNB pair in the compact format."""
+    _check_vectorizer(vectorizer)
+    terms = vectorizer.get_feature_names_out()
+    order = np.argsort(terms)
+    vocab = np.asarray(terms[order], dtype=str)
+    # (n_classes, n_features) -> (n_features, n_classes), rows follow the sorted vocabulary
+    flp = np.ascontiguousarray(np.asarray(classifier.feature_log_prob_)[:, order].T, dtype=np.float32)
+    prior = np.asarray(classifier.class_log_prior_, dtype=np.float32)
+    meta: Dict[str, Any] = {
+        "format_version": FORMAT_VERSION,
+        "classes": [str(c) for c in classifier.classes_],
+        "lowercase": bool(vectorizer.lowercase),
+        "token_pattern": vectorizer.token_pattern,
+        "n_features": int(vocab.shape[0]),
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name, arr in (("vocab", vocab), ("feature_log_prob", flp), ("class_log_prior", prior)):
+        tmp = os.path.join(out_dir, f".{name}.tmp.npy")
+        np.save(tmp, arr)
+        os.replace(tmp, os.path.join(out_dir, f"{name}.npy"))
+    tmp = meta_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    os.replace(tmp, meta_path)
+
+
+def is_compact_model(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+class CompactNBModel:
+    """Multinomial Naive Bayes scorer over memory-mapped arrays.
+
+    Exposes the same ``classify`` method as ``EmailClassifier`` so it can be
+    used as a drop-in ML fallback.
+    """
+
+    def __init__(self, path: str, mmap: bool = True) -> None:
+        if not is_compact_model(path):
+            raise FileNotFoundError(f"Compact model not found: {path}")
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise RuntimeError(f"Unsupported compact model version: {meta.get('format_version')}")
+        mode = "r" if mmap else None
+        self.path = path
+        self.vocab: np.ndarray = np.load(os.path.join(path, "vocab.npy"), mmap_mode=mode)
+        self.feature_log_prob: np.ndarray = np.load(os.path.join(path, "feature_log_prob.npy"), mmap_mode=mode)
+        self.class_log_prior: np.ndarray = np.load(os.path.join(path, "class_log_prior.npy"), mmap_mode=mode)
+        self.classes: List[str] = list(meta["classes"])
+        self.lowercase = bool(meta.get("lowercase", True))
+        self._token_re = re.compile(meta.get("token_pattern") or r"(?u)\b\w\w+\b")
+        self.is_trained = True
+
+    def _counts(self, texts: Sequence[str]) -> csr_matrix:
+        indptr = [0]
+        indices: List[int] = []
+        data: List[int] = []
+        n_features = self.vocab.shape[0]
+        for text in texts:
+            text = str(text)
+            if self.lowercase:
+                text = text.lower()
+            tokens = self._token_re.findall(text)
+            if tokens and n_features:
+                uniq, counts = np.unique(np.asarray(tokens, dtype=str), return_counts=True)
+                pos = np.searchsorted(self.vocab, uniq)
+                pos_clipped = np.minimum(pos, n_features - 1)
+                found = self.vocab[pos_clipped] == uniq
+                indices.extend(pos_clipped[found].tolist())
+                data.extend(counts[found].tolist())
+            indptr.append(len(indices))
+        return csr_matrix((np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), indptr),
+                          shape=(len(texts), n_features))
+
+    def joint_log_likelihood(self, texts: Sequence[str]) -> np.ndarray:
+        X = self._counts(texts)
+        # sparse x dense only touches the rows (pages) of the terms present in the batch
+        jll = np.asarray(X @ self.feature_log_prob, dtype=np.float64)
+        return jll + np.asarray(self.class_log_prior, dtype=np.float64)
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        jll = self.joint_log_likelihood(texts)
+        jll -= jll.max(axis=1, keepdims=True)
+        p = np.exp(jll)
+        return p / p.sum(axis=1, keepdims=True)
+
+    def predict(self, texts: Sequence[str]) -> List[str]:
+        jll = self.joint_log_likelihood(texts)
+        return [self.classes[i] for i in np.argmax(jll, axis=1)]
+
+    def classify_with_proba(self, texts: Sequence[str]) -> List[Tuple[str, float]]:
+        proba = self.predict_proba(texts)
+        best = proba.argmax(axis=1)
+        return [(self.classes[j], float(proba[r, j])) for r, j in enumerate(best)]
+
+    def classify(self, email: str) -> str:
+        return self.predict([email])[0]
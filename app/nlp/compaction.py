@@ -0,0 +1,149 @@
+"""Token-budgeted compaction of e-mail text before it is sent to an LLM.
+
+``/classify-llm`` used to send the first 4096 characters of the e-mail, and
+``/classify-llm-stream`` and ``AIClient.classify_email`` the whole text, so
+upstream latency and cost grew with quoted threads, signatures and legal
+footers that carry no signal for the decision.
+
+``compact_prompt`` first drops that text: quoted lines (``> ...``), the
+quoted thread after a reply header ("Em ... escreveu:", "On ... wrote:",
+"-----Mensagem original-----", Outlook "De:/Enviado:" blocks), signatures
+after ``--`` or a short sign-off, and boilerplate lines (confidentiality
+notices, "Enviado do meu iPhone", and unsubscribe footers, i.e. an
+unsubscribe mention with a link or "clique aqui" among the last lines). A
+line that asks for something (action verb or request pattern) is never
+dropped as boilerplate. If what is left still
+exceeds the budget, its sentences are ranked with the scoring engine's own
+signals (action verbs, request patterns, work-context and unproductive
+keywords, date co-occurrence) and the best ones are kept, in their original
+order, until the budget is full. The opening sentence is always kept.
+
+Configuration (environment):
+    LLM_PROMPT_TOKENS   token budget of the compacted text (default 512; 0 disables compaction)
+"""
+from typing import List, Optional, Tuple
+import os
+import re
+
+from app.nlp.classifier import _score_signals
+from app.utils.metrics import timed
+
+# rough size of a subword token for pt/en text; only used to size the budget
+CHARS_PER_TOKEN = 4
+
+_QUOTED_LINE_RE = re.compile(r"^\s*>")
+# everything after one of these lines is the quoted thread
+_REPLY_HEADER_RE = re.compile(
+    r"^\s*(?:em\s.{0,120}\sescreveu:|on\s.{0,120}\swrote:|"
+    r"-{2,}\s*(?:mensagem original|original message)\s*-{2,})\s*$",
+    re.IGNORECASE)
+# Outlook-style header block: "De:" / "From:" followed by "Enviado:" / "Sent:" / "Date:"
+_HEADER_FROM_RE = re.compile(r"^\s*(?:de|from)\s*:", re.IGNORECASE)
+_HEADER_SENT_RE = re.compile(r"^\s*(?:enviad[oa](?:\s+em)?|sent|date|data)\s*:", re.IGNORECASE)
+_SIGNATURE_DELIMITER_RE = re.compile(r"^\s*--\s*$")
+_SIGN_OFF_RE = re.compile(
+    r"^\s*(?:atenciosamente|att\.?|abra[çc]os?|um abra[çc]o|cordialmente|sauda[çc][õo]es|"
+    r"best regards|kind regards|regards|best|cheers|sincerely)[\s,.!]*$",
+    re.IGNORECASE)
+_BOILERPLATE_RE = re.compile(
+    r"enviado do meu|sent from my|"
+    r"esta mensagem (?:pode conter|é confidencial|e seus anexos)|this (?:e-?mail|message) (?:and any|is confidential|may contain)|"
+    r"aviso de confidencialidade|confidentiality notice|antes de imprimir|before printing",
+    re.IGNORECASE)
+# mailing-list footer: an unsubscribe mention *with* a link or "clique aqui"; a
+# plain "quero me descadastrar" / "cancelar a inscrição no curso" is the request itself
+_UNSUBSCRIBE_RE = re.compile(r"unsubscribe|descadastr|cancel(?:ar|e) (?:a |sua )?inscri[çc][ãa]o", re.IGNORECASE)
+_FOOTER_LINK_RE = re.compile(r"https?://|www\.|clique aqui|click here", re.IGNORECASE)
+# a sign-off only starts the signature when at most this many lines follow it;
+# unsubscribe footers are only looked for in this many trailing lines
+_SIGNATURE_MAX_LINES = 6
+_SENTENCE_RE = re.compile(r"[^.!?\n]+[.!?]*")
+
+
+def prompt_budget() -> int:
+    """Token budget from LLM_PROMPT_TOKENS (0 = compaction disabled)."""
+    try:
+        return max(0, int(os.environ.get("LLM_PROMPT_TOKENS") or "512"))
+    except ValueError:
+        return 512
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def strip_boilerplate(text: str) -> str:
+    """Text without quoted replies, signatures and boilerplate lines."""
+    lines = text.splitlines()
+    # the message itself ends where the quoted thread or the signature starts
+    for i, line in enumerate(lines):
+        if (_REPLY_HEADER_RE.match(line) or _SIGNATURE_DELIMITER_RE.match(line)
+                or (_HEADER_FROM_RE.match(line) and any(_HEADER_SENT_RE.match(nxt) for nxt in lines[i + 1:i + 4]))):
+            lines = lines[:i]
+            break
+    # non-empty lines after each line
+    after: List[int] = [0] * len(lines)
+    for i in range(len(lines) - 2, -1, -1):
+        after[i] = after[i + 1] + (1 if lines[i + 1].strip() else 0)
+    kept: List[str] = []
+    for i, line in enumerate(lines):
+        trailing = after[i]
+        if _SIGN_OFF_RE.match(line) and kept and trailing <= _SIGNATURE_MAX_LINES:
+            break
+        if _QUOTED_LINE_RE.match(line):
+            continue
+        footer = trailing < _SIGNATURE_MAX_LINES and _UNSUBSCRIBE_RE.search(line) and _FOOTER_LINK_RE.search(line)
+        if (footer or _BOILERPLATE_RE.search(line)) and not _is_request(line):
+            continue
+        kept.append(line)
+    return "\n".join(kept).strip()
+
+
+def _is_request(line: str) -> bool:
+    """The line asks for something (action verb or request pattern): never boilerplate."""
+    details = _score_signals(line)[2]
+    return bool(details.get("action_verb") or details.get("request_pattern"))
+
+
+def _sentences(text: str) -> List[str]:
+    return [m.group(0).strip() for m in _SENTENCE_RE.finditer(text) if m.group(0).strip()]
+
+
+def _informativeness(sentence: str) -> int:
+    prod_score, imp_score, details = _score_signals(sentence)
+    # the short-message bias describes whole e-mails, not one sentence
+    return prod_score + imp_score - details.get("short_message", 0)
+
+
+def _select(sentences: List[str], budget: int) -> List[str]:
+    # best score first, earlier sentence on ties
+    ranked: List[Tuple[int, int]] = sorted((-_informativeness(s), i) for i, s in enumerate(sentences[1:], 1))
+    chosen = {0}
+    used = estimate_tokens(sentences[0])
+    for _, i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1  # + the joining space
+        if used + cost <= budget:
+            chosen.add(i)
+            used += cost
+    return [sentences[i] for i in sorted(chosen)]
+
+
+def _compact(text: str, budget: int) -> str:
+    cleaned = strip_boilerplate(text) or text.strip()
+    if estimate_tokens(cleaned) <= budget:
+        return cleaned
+    sentences = _sentences(cleaned)
+    if not sentences:
+        return cleaned[:budget * CHARS_PER_TOKEN]
+    compacted = " ".join(_select(sentences, budget))
+    # an opening sentence longer than the whole budget is cut
+    return compacted[:budget * CHARS_PER_TOKEN]
+
+
+@timed("prompt_compaction")
+def compact_prompt(text: str, budget: Optional[int] = None) -> str:
+    """Most informative part of ``text`` that fits ``budget`` tokens (default: LLM_PROMPT_TOKENS)."""
+    budget = prompt_budget() if budget is None else budget
+    if not text or budget <= 0:
+        return text
+    return _compact(text, budget)
@@ -0,0 +1,117 @@
+"""Per-document analysis shared by every classifier stage.
+
+A single ``AnalyzedDocument`` is built per classification call. Each derived
+view of the text (lowercase, normalized form, tokens, sentences, lines, URL
+matches, ...) is computed on first access and then reused, so the hard
+filters and the scoring engine don't redo the same string work.
+"""
+from functools import cached_property
+from typing import Any, Callable, Dict, Iterator, List, Tuple, TypeVar, Union
+import re
+
+from app.nlp.matcher import normalize_for_matching, tokenize_normalized
+
+# full urls and e-mail addresses (used by the spam filter)
+EMAIL_URL_RE = re.compile(r"(https?://\S+|www\.\S+|[\w.+-]+@[\w.-]+\.\w+)")
+# bare urls (used by actionable-element detection)
+URL_RE = re.compile(r"https?://\S+|www\.\S+")
+_SENTENCE_SPLIT_RE = re.compile(r"[\n\.!?]+")
+
+T = TypeVar("T")
+
+
+class AnalyzedDocument:
+    """Lazily computed views of one e-mail text."""
+
+    def __init__(self, text: str) -> None:
+        self.text: str = text or ""
+        self._memo: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def memo(self, key: str, fn: Callable[[], T]) -> T:
+        """Compute ``fn()`` once per document under ``key`` (for stage-level results)."""
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = fn()
+            return value
+
+    @cached_property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    @cached_property
+    def normalized(self) -> str:
+        return normalize_for_matching(self.text)
+
+    @cached_property
+    def tokens(self) -> List[str]:
+        """Word tokens of the normalized text."""
+        return tokenize_normalized(self.normalized)
+
+    @cached_property
+    def sentences(self) -> List[str]:
+        """Coarse sentences of the raw text (split on newlines and . ! ?)."""
+        return _SENTENCE_SPLIT_RE.split(self.text)
+
+    @cached_property
+    def normalized_sentences(self) -> List[Tuple[str, str]]:
+        """(raw_sentence, normalized_sentence) pairs, skipping empty sentences."""
+        pairs: List[Tuple[str, str]] = []
+        for sent in self.sentences:
+            s_norm = normalize_for_matching(sent)
+            if s_norm:
+                pairs.append((sent, s_norm))
+        return pairs
+
+    @cached_property
+    def lines(self) -> List[str]:
+        """Stripped, non-empty lines of the raw text."""
+        return [ln.strip() for ln in self.text.splitlines() if ln.strip()]
+
+    @cached_property
+    def url_matches(self) -> List[str]:
+        """URLs and e-mail addresses found in the lowercased text."""
+        return EMAIL_URL_RE.findall(self.lower)
+
+    @cached_property
+    def lower_without_links(self) -> str:
+        """Lowercased text with URLs/e-mail addresses replaced by spaces."""
+        if not self.url_matches:
+            return self.lower
+        return EMAIL_URL_RE.sub(" ", self.lower)
+
+    @cached_property
+    def has_url(self) -> bool:
+        return URL_RE.search(self.lower) is not None
+
+
+def as_document(text: Union[str, AnalyzedDocument, None]) -> AnalyzedDocument:
+    """Return ``text`` unchanged when already analyzed, otherwise wrap it."""
+    if isinstance(text, AnalyzedDocument):
+        return text
+    return AnalyzedDocument(text or "")
+
+
+def iter_windows(text: str, size: int, limit: int = 0) -> Iterator[Tuple[int, str]]:
+    """Yield (offset, chunk) windows of about ``size`` chars covering ``text[:limit]``.
+
+    Windows end at the last newline (or, failing that, whitespace) in their
+    second half so words and most sentences are not cut in two.
+    """
+    end_all = min(len(text), limit) if limit > 0 else len(text)
+    size = max(1, int(size))
+    start = 0
+    while start < end_all:
+        end = min(start + size, end_all)
+        if end < end_all:
+            half = start + size // 2
+            cut = text.rfind("\n", half, end)
+            if cut < 0:
+                cut = max(text.rfind(" ", half, end), text.rfind("\t", half, end))
+            if cut > start:
+                end = cut + 1
+        yield start, text[start:end]
+        start = end
@@ -0,0 +1,153 @@
+"""Precompiled keyword matcher used by the rule-based classifier.
+
+The keyword sets in ``app.nlp.classifier`` are normalized and indexed once
+(at import time or when the rules change) so that scoring a document is a
+single pass over its tokens instead of one scan per keyword.
+"""
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Tuple, Union
+from collections import Counter
+import hashlib
+import re
+import unicodedata
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_SPACES_RE = re.compile(r"\s+")
+_TOKEN_RE = re.compile(r"\w+")
+
+# upper bound for the per-token memo; cleared when exceeded so long-running
+# workers don't grow without limit on open-vocabulary traffic
+_TOKEN_MEMO_MAX = 50000
+
+
+def normalize_for_matching(s: str) -> str:
+    """Lowercase + remove diacritics, collapse whitespace for robust keyword matching."""
+    if not s:
+        return ""
+    s = str(s).lower()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    # replace non-word with spaces to make simple substring/token checks safer
+    s = _NON_WORD_RE.sub(" ", s)
+    s = _SPACES_RE.sub(" ", s).strip()
+    return s
+
+
+def tokenize_normalized(t_norm: str) -> List[str]:
+    """Split an already normalized string into word tokens."""
+    return _TOKEN_RE.findall(t_norm)
+
+
+Terms = Union[Mapping[str, int], Iterable[str]]
+
+
+def _weights(terms: Terms) -> Dict[str, int]:
+    if isinstance(terms, Mapping):
+        return {str(k): int(w) for k, w in terms.items() if int(w) > 0}
+    return {str(k): 1 for k in set(terms)}
+
+
+class KeywordCounts(NamedTuple):
+    action_verb: int
+    productive: int
+    unproductive: int
+
+
+class KeywordMatcher:
+    """Keyword/phrase/stem counts for a normalized document in one pass.
+
+    Semantics mirror the original per-keyword loops exactly:
+    - single-word keywords count every token equal to the normalized keyword;
+    - multi-word keywords (phrases) count once when present as a substring;
+    - action-verb stems count once per (token, stem) pair where the stem is a
+      substring of the token.
+    Keywords that collapse to the same normalized form keep their multiplicity.
+
+    Every argument is either a plain collection (each entry counts 1) or a
+    mapping of entry -> integer weight (from a rule pack, see app.nlp.rules);
+    a hit then counts ``weight`` instead of 1.
+    """
+
+    def __init__(self, productive: Terms, unproductive: Terms,
+                 action_stems: Terms, request_patterns: Terms = ()) -> None:
+        self.productive_words, self.productive_phrases = self._index(_weights(productive))
+        self.unproductive_words, self.unproductive_phrases = self._index(_weights(unproductive))
+        # stems are matched raw against normalized tokens (as before); keep them sorted
+        # so the fingerprint and iteration order are stable
+        stem_weights = _weights(action_stems)
+        self.action_stems: Tuple[str, ...] = tuple(sorted(stem_weights))
+        self.action_stem_weights: Tuple[Tuple[str, int], ...] = tuple(sorted(stem_weights.items()))
+        # (normalized pattern, weight); patterns normalizing to the same text each count
+        self.request_patterns: Tuple[Tuple[str, int], ...] = tuple(
+            (pn, w) for pn, w in ((normalize_for_matching(p), w) for p, w in sorted(_weights(request_patterns).items()))
+            if pn
+        )
+        self._token_memo: Dict[str, Tuple[int, int, int]] = {}
+        self.fingerprint = self._compute_fingerprint()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the per-token memo is runtime state; don't persist it with a compiled rule pack
+        state = dict(self.__dict__)
+        state["_token_memo"] = {}
+        return state
+
+    @staticmethod
+    def _index(keywords: Mapping[str, int]) -> Tuple[Dict[str, int], Tuple[Tuple[str, int], ...]]:
+        words: Dict[str, int] = {}
+        phrases: Dict[str, int] = {}
+        for k, weight in keywords.items():
+            kk = normalize_for_matching(k)
+            if not kk or weight <= 0:
+                continue
+            target = phrases if " " in kk else words
+            target[kk] = target.get(kk, 0) + weight
+        return words, tuple(sorted(phrases.items()))
+
+    def _compute_fingerprint(self) -> str:
+        h = hashlib.sha1()
+        for part in (sorted(self.productive_words.items()), self.productive_phrases,
+                     sorted(self.unproductive_words.items()), self.unproductive_phrases,
+                     self.action_stem_weights, self.request_patterns):
+            h.update(repr(part).encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    def token_weights(self, tok: str) -> Tuple[int, int, int]:
+        """Return (action_stem_hits, productive_weight, unproductive_weight) for one token."""
+        w = self._token_memo.get(tok)
+        if w is None:
+            stems = sum(w for stem, w in self.action_stem_weights if stem in tok)
+            w = (stems, self.productive_words.get(tok, 0), self.unproductive_words.get(tok, 0))
+            if len(self._token_memo) >= _TOKEN_MEMO_MAX:
+                self._token_memo.clear()
+            self._token_memo[tok] = w
+        return w
+
+    def count(self, t_norm: str, tokens: List[str]) -> KeywordCounts:
+        """Count action stems and productive/unproductive keywords in a normalized text."""
+        action, prod, imp = self.count_tokens(tokens)
+        prod_phrases, imp_phrases = self.matched_phrases(t_norm)
+        return KeywordCounts(action, prod + sum(m for _, m in prod_phrases), imp + sum(m for _, m in imp_phrases))
+
+    def count_tokens(self, tokens: List[str]) -> KeywordCounts:
+        """Single-word keyword and stem counts only (no phrases)."""
+        action = prod = imp = 0
+        weights = self.token_weights
+        for tok, n in Counter(tokens).items():
+            a, p, u = weights(tok)
+            if a or p or u:
+                action += a * n
+                prod += p * n
+                imp += u * n
+        return KeywordCounts(action, prod, imp)
+
+    def matched_phrases(self, t_norm: str) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        """(productive, unproductive) multi-word phrases present in ``t_norm``, with their weights.
+
+        A phrase counts once per document, so callers scoring a document in
+        pieces merge these by phrase instead of adding them up.
+        """
+        return ([(ph, m) for ph, m in self.productive_phrases if ph in t_norm],
+                [(ph, m) for ph, m in self.unproductive_phrases if ph in t_norm])
+
+    def has_action_stem(self, s_norm: str) -> bool:
+        """True when any action-verb stem occurs as a substring of ``s_norm``."""
+        return any(stem in s_norm for stem in self.action_stems)
@@ -0,0 +1,273 @@
+"""Incremental learning from reviewer feedback.
+
+Human corrections (typically for ``needs_human_review`` decisions) are stored
+in a local SQLite file. Once enough unseen corrections have accumulated they
+are fed to an ``OnlineEmailClassifier`` in a small ``partial_fit`` batch. The
+model uses a stateless ``HashingVectorizer``, so it never re-reads the
+corpus, never refits a vocabulary and has a fixed memory footprint
+(n_classes x n_features).
+"""
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import copy
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None  # type: ignore
+import joblib  # type: ignore
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import MultinomialNB
+
+logger = logging.getLogger(__name__)
+
+LABELS: Tuple[str, str] = ("Produtivo", "Improdutivo")
+ONLINE_MODEL_PATH = os.environ.get("ONLINE_MODEL_PATH") or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "email_classifier_online.joblib"))
+FEEDBACK_DB_PATH = os.environ.get("FEEDBACK_DB_PATH") or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "feedback.sqlite"))
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Exclusive lock shared by all worker processes on the host (no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class OnlineEmailClassifier:
+    """HashingVectorizer + MultinomialNB updated with partial_fit."""
+
+    def __init__(self, n_features: int = 2 ** 18) -> None:
+        # non-negative raw counts: MultinomialNB needs alternate_sign=False and no normalization
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+        self.classifier = MultinomialNB()
+        self.is_trained = False
+        self.n_seen = 0
+
+    def partial_fit(self, emails: Sequence[str], labels: Sequence[str]) -> None:
+        if not emails:
+            return
+        X = self.vectorizer.transform([str(e) for e in emails])
+        self.classifier.partial_fit(X, list(labels), classes=list(LABELS))
+        self.is_trained = True
+        self.n_seen += len(emails)
+
+    def predict_proba(self, emails: Sequence[str]) -> np.ndarray:
+        if not self.is_trained:
+            raise RuntimeError("Classifier is not trained yet.")
+        return self.classifier.predict_proba(self.vectorizer.transform([str(e) for e in emails]))
+
+    def classify_with_proba(self, emails: Sequence[str]) -> List[Tuple[str, float]]:
+        proba = self.predict_proba(emails)
+        classes = self.classes
+        best = proba.argmax(axis=1)
+        return [(classes[j], float(proba[r, j])) for r, j in enumerate(best)]
+
+    @property
+    def classes(self) -> List[str]:
+        return [str(c) for c in self.classifier.classes_]
+
+    def classify(self, email: str) -> str:
+        if not self.is_trained:
+            raise RuntimeError("Classifier is not trained yet.")
+        return str(self.classifier.predict(self.vectorizer.transform([str(email)]))[0])
+
+    def save(self, path: str = ONLINE_MODEL_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # write-then-rename so workers polling the file never see a partial model
+        tmp = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(self, tmp)  # type: ignore
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path: str = ONLINE_MODEL_PATH) -> "OnlineEmailClassifier":
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model file not found: {path}")
+        model = joblib.load(path)  # type: ignore
+        if not isinstance(model, OnlineEmailClassifier):
+            raise RuntimeError("Unknown model format in file.")
+        return model
+
+
+class FeedbackStore:
+    """Reviewer corrections in a local SQLite file (shared by all workers)."""
+
+    def __init__(self, path: str = FEEDBACK_DB_PATH) -> None:
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)) or ".", exist_ok=True)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback (id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL, "
+                "label TEXT NOT NULL, predicted TEXT, reason TEXT, created REAL NOT NULL, "
+                "trained INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, text: str, label: str, predicted: Optional[str] = None, reason: Optional[str] = None) -> int:
+        if label not in LABELS:
+            raise ValueError(f"label must be one of {LABELS}")
+        cur = self._conn().execute(
+            "INSERT INTO feedback (text, label, predicted, reason, created) VALUES (?, ?, ?, ?, ?)",
+            (text, label, predicted, reason, time.time()),
+        )
+        return int(cur.lastrowid or 0)
+
+    # ``trained``: 0 = pending, -1 = claimed by a training run in progress, 1 = learned
+    def pending(self, limit: int) -> List[Tuple[int, str, str]]:
+        rows = self._conn().execute(
+            "SELECT id, text, label FROM feedback WHERE trained = 0 ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+        return [(int(r[0]), str(r[1]), str(r[2])) for r in rows]
+
+    def pending_count(self) -> int:
+        return int(self._conn().execute("SELECT COUNT(*) FROM feedback WHERE trained = 0").fetchone()[0])
+
+    def claim(self, ids: Sequence[int]) -> List[int]:
+        """Reserve pending ids for a training run; returns only the ids this caller claimed."""
+        claimed: List[int] = []
+        conn = self._conn()
+        for i in ids:
+            if conn.execute("UPDATE feedback SET trained = -1 WHERE id = ? AND trained = 0", (i,)).rowcount:
+                claimed.append(i)
+        return claimed
+
+    def mark_trained(self, ids: Sequence[int]) -> None:
+        """The claimed ids are part of the published model."""
+        self._conn().executemany("UPDATE feedback SET trained = 1 WHERE id = ? AND trained = -1", [(i,) for i in ids])
+
+    def release(self, ids: Optional[Sequence[int]] = None) -> None:
+        """Put claimed ids (all claimed rows when ``ids`` is None) back to pending."""
+        conn = self._conn()
+        if ids is None:
+            conn.execute("UPDATE feedback SET trained = 0 WHERE trained = -1")
+        else:
+            conn.executemany("UPDATE feedback SET trained = 0 WHERE id = ? AND trained = -1", [(i,) for i in ids])
+
+    def stats(self) -> Dict[str, int]:
+        total, pending = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(trained != 1), 0) FROM feedback").fetchone()
+        return {"total": int(total), "pending": int(pending)}
+
+
+class OnlineLearner:
+    """Stores feedback and applies it to the online model in batches of ``batch_size``."""
+
+    def __init__(self, store: FeedbackStore, model_path: str = ONLINE_MODEL_PATH,
+                 batch_size: int = 32, n_features: int = 2 ** 18) -> None:
+        self.store = store
+        self.model_path = model_path
+        self.batch_size = max(1, int(batch_size))
+        self.n_features = n_features
+        self._lock = threading.Lock()
+        self._model: Optional[OnlineEmailClassifier] = None
+        self._model_mtime: Optional[int] = None
+
+    @property
+    def model(self) -> OnlineEmailClassifier:
+        mtime = _mtime(self.model_path)
+        if self._model is None or mtime != self._model_mtime:
+            # (re)load when another worker saved a newer version
+            if mtime is not None:
+                self._model = OnlineEmailClassifier.load(self.model_path)
+            elif self._model is None:
+                self._model = OnlineEmailClassifier(self.n_features)
+            self._model_mtime = mtime
+        return self._model
+
+    def record(self, text: str, label: str, predicted: Optional[str] = None,
+               reason: Optional[str] = None) -> Dict[str, Any]:
+        feedback_id = self.store.add(text, label, predicted, reason)
+        trained = 0
+        if self.store.pending_count() >= self.batch_size:
+            try:
+                trained = self.train_pending()
+            except Exception:
+                # the feedback is stored and stays pending for the next run
+                logger.exception("online model update failed")
+        return {"id": feedback_id, "trained": trained}
+
+    def train_pending(self) -> int:
+        """Apply all pending feedback in batches; returns the number of examples learned.
+
+        The batches are fitted on a copy of the model, which is saved and only then
+        swapped in, so concurrent predictions never see a half-updated model. The
+        feedback rows are marked as trained after that; on any failure they go back
+        to pending.
+        """
+        learned = 0
+        claimed: List[int] = []
+        # serialize updates across threads and worker processes so none is lost
+        with self._lock, _file_lock(self.model_path + ".lock"):
+            # rows still claimed here belong to a run that died before finishing
+            self.store.release()
+            model = copy.deepcopy(self.model)
+            try:
+                while True:
+                    rows = self.store.pending(self.batch_size)
+                    if not rows:
+                        break
+                    ids = set(self.store.claim([r[0] for r in rows]))
+                    claimed.extend(ids)
+                    batch = [r for r in rows if r[0] in ids]
+                    if batch:
+                        model.partial_fit([r[1] for r in batch], [r[2] for r in batch])
+                        learned += len(batch)
+                if learned:
+                    model.save(self.model_path)
+                    self._model = model
+                    self._model_mtime = _mtime(self.model_path)
+                self.store.mark_trained(claimed)
+            except BaseException:
+                self.store.release(claimed)
+                raise
+            if learned:
+                logger.info("online model updated with %d feedback examples (total seen %d)",
+                            learned, model.n_seen)
+        return learned
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+_learner: Optional[OnlineLearner] = None
+_learner_lock = threading.Lock()
+
+
+def get_learner() -> OnlineLearner:
+    """Process-wide learner configured from FEEDBACK_DB_PATH / ONLINE_MODEL_PATH / ONLINE_BATCH_SIZE."""
+    global _learner
+    with _learner_lock:
+        if _learner is None:
+            _learner = OnlineLearner(
+                FeedbackStore(FEEDBACK_DB_PATH),
+                ONLINE_MODEL_PATH,
+                batch_size=int(os.environ.get("ONLINE_BATCH_SIZE", "32")),
+                n_features=2 ** int(os.environ.get("ONLINE_HASH_BITS", "18")),
+            )
+        return _learner
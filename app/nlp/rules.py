@@ -0,0 +1,273 @@
+"""Declarative rule packs for the rule-based classifier.
+
+A rule pack is a JSON (or YAML, when PyYAML is installed) file with weighted
+keywords, action-verb stems, request patterns, date patterns and feed
+markers. Keyword sections are either a list (weight 1 each) or a mapping of
+keyword -> integer weight; a weight of 0 disables an entry. Sections missing
+from the pack keep the built-in defaults from ``app.nlp.classifier``::
+
+    {
+      "version": 1,
+      "productive_keywords": {"urgente": 3, "prazo": 2, "ticket": 1},
+      "unproductive_keywords": ["parabéns", "feliz natal"],
+      "action_verbs": {"revis": 1, "envie": 2},
+      "request_patterns": ["por favor", "could you"],
+      "date_patterns": ["\\\\bamanh[ãa]\\\\b", "\\\\b\\\\d{1,2}h\\\\b"],
+      "feed_markers": ["ler mais", "voto positivo"],
+      "feed_line_markers": ["ler mais"],
+      "weights": {"cooccurrence_boost": 2, "short_message": 1}
+    }
+
+A pack is compiled once into a ``CompiledRules`` (keyword index, combined
+date regex) and the compiled form is pickled next to the pack, keyed by a
+digest of its content, so worker start-up skips recompilation.
+``RuleStore`` watches the file and swaps in a freshly compiled pack as a
+single reference assignment: requests already running keep the pack they
+started with, and a pack that fails to load leaves the previous one active.
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, Pattern, Tuple, Union
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+
+from app.nlp.matcher import KeywordMatcher
+
+try:
+    import yaml  # type: ignore
+except ImportError:  # YAML packs are optional
+    yaml = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+PACK_VERSION = 1
+# bump when CompiledRules changes shape so stale precompiled caches are ignored
+COMPILER_VERSION = 1
+
+DEFAULT_WEIGHTS: Dict[str, int] = {"cooccurrence_boost": 2, "short_message": 1}
+
+_WEIGHTED_SECTIONS = ("productive_keywords", "unproductive_keywords", "action_verbs", "request_patterns")
+_LIST_SECTIONS = ("date_patterns", "feed_markers", "feed_line_markers")
+
+WeightedTerms = Union[Mapping[str, int], Iterable[str]]
+
+
+class RulePackError(ValueError):
+    """Invalid rule pack file."""
+
+
+def _weighted(terms: WeightedTerms, section: str = "") -> Dict[str, int]:
+    if isinstance(terms, Mapping):
+        out: Dict[str, int] = {}
+        for k, w in terms.items():
+            if not isinstance(k, str) or isinstance(w, bool) or not isinstance(w, int) or w < 0:
+                raise RulePackError(f"{section}: weights must be non-negative integers ({k!r}: {w!r})")
+            if w:
+                out[k] = w
+        return out
+    if isinstance(terms, str):
+        raise RulePackError(f"{section}: expected a list or a mapping, got a string")
+    return {str(k): 1 for k in terms}
+
+
+@dataclass(frozen=True)
+class RulePack:
+    """Rule definitions before compilation."""
+    productive_keywords: Dict[str, int]
+    unproductive_keywords: Dict[str, int]
+    action_verbs: Dict[str, int]
+    request_patterns: Dict[str, int]
+    date_patterns: Tuple[str, ...]
+    feed_markers: Tuple[str, ...]
+    feed_line_markers: Tuple[str, ...]
+    weights: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_WEIGHTS))
+    source: str = "<builtin>"
+
+    @classmethod
+    def from_sets(cls, productive: WeightedTerms, unproductive: WeightedTerms, action_verbs: WeightedTerms,
+                  request_patterns: WeightedTerms, date_patterns: Iterable[str], feed_markers: Iterable[str],
+                  feed_line_markers: Iterable[str], weights: Optional[Mapping[str, int]] = None) -> "RulePack":
+        return cls(_weighted(productive), _weighted(unproductive), _weighted(action_verbs),
+                   _weighted(request_patterns), tuple(date_patterns), tuple(feed_markers),
+                   tuple(feed_line_markers), {**DEFAULT_WEIGHTS, **(weights or {})})
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any], defaults: "RulePack", source: str = "<dict>") -> "RulePack":
+        """Build a pack from parsed JSON/YAML; missing sections come from ``defaults``."""
+        if not isinstance(data, Mapping):
+            raise RulePackError("rule pack must be a mapping")
+        version = data.get("version", PACK_VERSION)
+        if version != PACK_VERSION:
+            raise RulePackError(f"unsupported rule pack version: {version!r}")
+        unknown = set(data) - set(_WEIGHTED_SECTIONS) - set(_LIST_SECTIONS) - {"version", "weights"}
+        if unknown:
+            raise RulePackError(f"unknown rule pack sections: {sorted(unknown)}")
+        values: Dict[str, Any] = {}
+        for name in _WEIGHTED_SECTIONS:
+            values[name] = _weighted(data[name], name) if name in data else getattr(defaults, name)
+        for name in _LIST_SECTIONS:
+            if name in data:
+                items = data[name]
+                if isinstance(items, str) or not all(isinstance(i, str) for i in items):
+                    raise RulePackError(f"{name}: expected a list of strings")
+                values[name] = tuple(items)
+            else:
+                values[name] = getattr(defaults, name)
+        weights = dict(defaults.weights)
+        for k, w in (data.get("weights") or {}).items():
+            if k not in DEFAULT_WEIGHTS:
+                raise RulePackError(f"weights: unknown weight {k!r}")
+            if isinstance(w, bool) or not isinstance(w, int) or w < 0:
+                raise RulePackError(f"weights: {k} must be a non-negative integer")
+            weights[k] = w
+        for pattern in values["date_patterns"]:
+            try:
+                re.compile(pattern)
+            except re.error as exc:
+                raise RulePackError(f"date_patterns: invalid regex {pattern!r}: {exc}") from exc
+        return cls(weights=weights, source=source, **values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        del data["source"]
+        for name in _WEIGHTED_SECTIONS:
+            data[name] = dict(sorted(data[name].items()))
+        for name in _LIST_SECTIONS:
+            data[name] = list(data[name])
+        return {"version": PACK_VERSION, **data}
+
+
+class CompiledRules:
+    """A rule pack compiled into the structures the scoring stages use."""
+
+    def __init__(self, pack: RulePack) -> None:
+        self.pack = pack
+        self.matcher = KeywordMatcher(pack.productive_keywords, pack.unproductive_keywords,
+                                      pack.action_verbs, pack.request_patterns)
+        # one alternation instead of one search per pattern; never matches when empty
+        self.date_re: Pattern[str] = re.compile("|".join(pack.date_patterns) or r"(?!)", flags=re.IGNORECASE)
+        self.feed_markers = pack.feed_markers
+        self.feed_line_markers = pack.feed_line_markers
+        self.cooccurrence_weight = int(pack.weights.get("cooccurrence_boost", 0))
+        self.short_message_weight = int(pack.weights.get("short_message", 0))
+        h = hashlib.sha1(self.matcher.fingerprint.encode("utf-8"))
+        h.update(repr((pack.date_patterns, pack.feed_markers, pack.feed_line_markers,
+                       sorted(pack.weights.items()))).encode("utf-8"))
+        self.fingerprint = h.hexdigest()[:16]
+
+
+def _parse(path: str, raw: bytes) -> Any:
+    if path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise RulePackError("YAML rule packs require PyYAML (pip install pyyaml)")
+        return yaml.safe_load(raw.decode("utf-8"))
+    return json.loads(raw.decode("utf-8"))
+
+
+def _pack_from_bytes(path: str, raw: bytes, defaults: RulePack) -> RulePack:
+    try:
+        data = _parse(path, raw)
+    except (ValueError, TypeError) as exc:
+        raise RulePackError(f"cannot parse rule pack {path}: {exc}") from exc
+    return RulePack.from_dict(data, defaults, source=path)
+
+
+def load_pack(path: str, defaults: RulePack) -> RulePack:
+    with open(path, "rb") as fh:
+        return _pack_from_bytes(path, fh.read(), defaults)
+
+
+def _cache_key(raw: bytes, defaults: RulePack) -> str:
+    h = hashlib.sha256(f"{COMPILER_VERSION}|".encode("utf-8"))
+    h.update(raw)
+    # defaults fill missing sections, so they are part of what was compiled
+    h.update(json.dumps(defaults.to_dict(), sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_compiled(path: str, defaults: RulePack, cache_path: Optional[str] = None) -> CompiledRules:
+    """Compile the pack at ``path``, reusing the precompiled cache file when it matches."""
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    cache_path = cache_path or path + ".compiled"
+    key = _cache_key(raw, defaults)
+    try:
+        with open(cache_path, "rb") as fh:
+            cached = pickle.load(fh)
+        if cached.get("key") == key and isinstance(cached.get("rules"), CompiledRules):
+            return cached["rules"]
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.debug("ignoring unreadable precompiled rules %s", cache_path, exc_info=True)
+    compiled = CompiledRules(_pack_from_bytes(path, raw, defaults))
+    try:
+        tmp = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            pickle.dump({"key": key, "rules": compiled}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except OSError:
+        logger.debug("could not write precompiled rules %s", cache_path, exc_info=True)
+    return compiled
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class RuleStore:
+    """Active compiled rules for one pack file, hot-reloaded when the file changes.
+
+    The file is stat'ed at most every ``check_interval`` seconds. Reloads are
+    serialized by a lock and published with a single assignment, so readers
+    never block and never see a half-built pack.
+    """
+
+    def __init__(self, path: str, defaults: Callable[[], RulePack], cache_path: Optional[str] = None,
+                 check_interval: float = 2.0) -> None:
+        self.path = path
+        self.cache_path = cache_path
+        self.check_interval = max(0.0, float(check_interval))
+        self._defaults = defaults
+        self._lock = threading.Lock()
+        self._rules: Optional[CompiledRules] = None
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._next_check = 0.0
+        self.reloads = 0
+        self.errors = 0
+
+    def get(self) -> CompiledRules:
+        rules = self._rules
+        if rules is None or time.monotonic() >= self._next_check:
+            rules = self.reload()
+        return rules
+
+    def reload(self, force: bool = False) -> CompiledRules:
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            stamp = _file_stamp(self.path)
+            if self._rules is not None and not force and stamp == self._stamp:
+                return self._rules
+            try:
+                rules = load_compiled(self.path, self._defaults(), self.cache_path)
+            except Exception:
+                self.errors += 1
+                if self._rules is None:
+                    raise
+                logger.exception("failed to reload rule pack %s; keeping the previous rules", self.path)
+                # don't retry the same broken file on every check
+                self._stamp = stamp
+                return self._rules
+            self._rules, self._stamp = rules, stamp
+            self.reloads += 1
+            logger.info("loaded rule pack %s (fingerprint %s)", self.path, rules.fingerprint)
+            return rules
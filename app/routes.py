@@ -1,6 +1,7 @@
 import os
-from typing import Dict, Any, cast, Tuple, Union, List
+from typing import Dict, Any, Optional, cast, Tuple, Union, List, Iterator
 import logging
+import threading
 from flask import Blueprint, render_template, request, Response, jsonify, current_app
 try:
     import bleach
@@ -8,21 +9,40 @@ try:
 except Exception:
     _BLEACH_AVAILABLE = False
 from app.nlp.preprocess import preprocess_text
-from app.nlp.classifier import classify_text_html, classify_email, get_last_decision_reason, classify_text_with_confidence
+from app.nlp.online import LABELS, get_learner
+from app.nlp.compaction import compact_prompt
+from app.nlp.classifier import classify_email, classify_text_result, classify_text_with_confidence, result_cache_stats, rules_info, is_warm, warm_up
+from app.utils import metrics
+from app.ai.deadline import Deadline
+from app.ai.scheduler import LLMSaturated, scheduler_stats
 # Tenta importar a função real do cliente de AI; fornece um fallback tipado
 # para que a análise estática e erros em tempo de execução sejam evitados
 # caso o símbolo não esteja presente.
 try:
-    from app.ai.client import generate_response
+    from app.ai.client import generate_response, llm_cache_stats, stream_response
+    from app.ai.health import health_stats as llm_model_health
+    from app.ai.neardup import neardup_stats
 except Exception:
-    def generate_response(category: str, original_text: str) -> str:
+    def generate_response(category: str, original_text: str, deadline: Optional[Deadline] = None) -> str:
         # Fallback implementation used when the AI client or the symbol is missing.
         # Keep this simple and non-blocking: return an empty string or a short canned reply.
         return ""
+
+    def stream_response(category: str, original_text: str, deadline: Optional[Deadline] = None) -> Iterator[str]:
+        yield generate_response(category, original_text, deadline)
+
+    def llm_cache_stats() -> dict:
+        return {'enabled': False}
+
+    def llm_model_health() -> dict:
+        return {}
+
+    def neardup_stats() -> dict:
+        return {'enabled': False}
 from io import BytesIO
 import html as _html
+import math
 import re
-import time
 from flask import stream_with_context, Response
 
 bp = Blueprint("main", __name__)
@@ -31,6 +51,24 @@ main = bp
 
 logger = logging.getLogger(__name__)
 
+@bp.errorhandler(LLMSaturated)
+def _llm_saturated(e: LLMSaturated):
+    """Fila de chamadas ao LLM cheia ou limite de taxa atingido: 429 com Retry-After."""
+    resp = jsonify({"error": "llm busy", "reason": e.reason})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+    return resp
+
+
+def _llm_deadline() -> Deadline:
+    """Orçamento de tempo da requisição para chamadas ao LLM (config `LLM_DEADLINE`)."""
+    try:
+        return Deadline(float(current_app.config.get("LLM_DEADLINE", 25)))
+    except RuntimeError:
+        # fora de um app context (ex.: pipeline chamado direto)
+        return Deadline.from_env()
+
+
 @bp.route("/", methods=["GET"])
 def index():
     return render_template("index.html")
@@ -48,10 +86,12 @@ def classify_llm():
     text = data.get("text") or request.form.get("text") or ""
     if not text:
         return jsonify({"error": "no text provided"}), 400
+    deadline = _llm_deadline()
 
-    # optionally redact or trim text before sending to LLM (keep minimal for privacy)
-    # here we send a short prefix + max 4096 characters to avoid huge payloads
-    snippet = text if len(text) <= 4096 else text[:4096]
+    # send only the informative part of the text: quoted replies, signatures and
+    # boilerplate are dropped and the best sentences fill LLM_PROMPT_TOKENS;
+    # max 4096 characters either way to avoid huge payloads
+    snippet = compact_prompt(text)[:4096]
     try:
         # compute a heuristics-backed decision to pass as category to LLM so it can
         # produce a context-aware reply (Produtivo/Improdutivo)
@@ -59,7 +99,9 @@ def classify_llm():
             decision_label, _, _ = classify_text_with_confidence(text)
         except Exception:
             decision_label = classify_email(text)
-        llm_reply = generate_response(decision_label, snippet)
+        llm_reply = generate_response(decision_label, snippet, deadline)
+    except LLMSaturated:
+        raise
     except Exception:
         logger.exception("llm call failed")
         return jsonify({"error": "llm call failed"}), 500
@@ -70,8 +112,8 @@ def classify_llm():
 @bp.route("/classify-llm-stream", methods=["POST"])
 def classify_llm_stream():
     """Transmite a resposta do LLM em pedaços (streaming).
-    Para desenvolvimento/local, simula streaming gerando a resposta via
-    `generate_response` e emitindo pequenos trechos com pequenos atrasos.
+    Os tokens do backend de inferência são repassados ao cliente assim que chegam
+    (texto puro em chunks).
     """
     if not (bool(current_app.config.get("ENABLE_LLM")) and bool(current_app.config.get("ALLOW_UI_LLM_TOGGLE", False))):
         return jsonify({"error": "LLM not enabled"}), 403
@@ -80,32 +122,69 @@ def classify_llm_stream():
     text = data.get("text") or request.form.get("text") or ""
     if not text:
         return jsonify({"error": "no text provided"}), 400
+    deadline = _llm_deadline()
 
-    # generate full reply (synchronously) then stream it in small chunks
     try:
         try:
             decision_label, _, _ = classify_text_with_confidence(text)
         except Exception:
             decision_label = classify_email(text)
-        full_reply = generate_response(decision_label, text)
     except Exception:
         logger.exception("llm call failed")
         return jsonify({"error": "llm call failed"}), 500
 
+    # the first chunk is read before answering, so a saturated LLM queue still
+    # gets a 429 instead of an empty 200 stream
+    chunks = stream_response(decision_label, compact_prompt(text)[:4096], deadline)
+    try:
+        first = next(chunks, "")
+    except LLMSaturated:
+        raise
+    except Exception:
+        logger.exception("llm stream failed")
+        first = ""
+
     def generator():
-        # prefix with a simple JSON-like preface so the client can format
-        # We'll stream plain text chunks
-        words = (full_reply or "").split()
-        for w in words:
-            yield w + ' '
-            # brief delay to simulate streaming
-            time.sleep(0.03)
-
-    return Response(stream_with_context(generator()), mimetype='text/plain; charset=utf-8')
+        try:
+            if first:
+                yield first
+            yield from chunks
+        except Exception:
+            # the status line is already sent; end the stream instead of failing the worker
+            logger.exception("llm stream failed")
+
+    # no-transform/X-Accel-Buffering: proxies must not buffer the chunks
+    headers = {'Cache-Control': 'no-cache, no-transform', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generator()), mimetype='text/plain; charset=utf-8', headers=headers)
+
+
+@bp.route("/feedback", methods=["POST"])
+def feedback():
+    """Registra a correção de um revisor (ex.: para e-mails `needs_human_review`).
+    As correções ficam em SQLite e são aplicadas ao modelo online em pequenos lotes
+    (`partial_fit`), sem re-treinar sobre todo o histórico.
+    """
+    data = cast(Dict[str, Any], request.get_json(silent=True) or {})
+    text = data.get("text") or request.form.get("text") or ""
+    label = data.get("label") or request.form.get("label") or ""
+    if not text:
+        return jsonify({"error": "no text provided"}), 400
+    if label not in LABELS:
+        return jsonify({"error": f"label must be one of {list(LABELS)}"}), 400
+    try:
+        outcome = get_learner().record(text, label, predicted=data.get("predicted"), reason=data.get("reason"))
+    except Exception:
+        logger.exception("storing feedback failed")
+        return jsonify({"error": "feedback not stored"}), 500
+    return jsonify({"stored": True, **outcome})
+
+
 def process_email_pipeline(raw_text: str) -> Dict[str, str]:
+    deadline = _llm_deadline()
     text = preprocess_text(raw_text)
-    label: str = classify_email(text)
-    suggestion = generate_response(label, text)
+    # same decision as classify_email, served from the classification result cache
+    label: str = classify_text_result(text, ml_threshold=0.0).decision
+    suggestion = generate_response(label, text, deadline)
     return {"category": label, "suggested_reply": suggestion, "text": text}
 
 @bp.route("/process-email", methods=["POST"])
@@ -150,28 +229,8 @@ def _extract_text_from_file(f: Any) -> Tuple[str, str]:
         is_pdf = False
 
     if is_pdf:
-        try:
-            from PyPDF2 import PdfReader
-            # ensure BytesIO gets bytes: handle bytes, bytearray, memoryview and fallback to encoding strings
-            if isinstance(payload, bytes):
-                bio_bytes = payload
-            elif isinstance(payload, (bytearray, memoryview)):
-                bio_bytes = bytes(payload)
-            else:
-                # fallback for str or other types
-                bio_bytes = str(payload).encode()
-            bio = BytesIO(bio_bytes)
-            reader = PdfReader(bio)
-            pages: List[str] = []
-            for p in reader.pages:
-                txt = p.extract_text() or ""
-                pages.append(txt)
-            content = "\n".join(pages).strip()
-            if content:
-                return content, "pdf_text_extracted"
-            return "", "pdf_no_text_extracted"
-        except Exception:
-            return "", "pdf_extraction_failed"
+        with metrics.stage_timer("pdf_extraction"):
+            return _extract_pdf_text(payload)
 
     # non-pdf: try decode
     try:
@@ -183,6 +242,30 @@ def _extract_text_from_file(f: Any) -> Tuple[str, str]:
     except Exception:
         return "", "file_decode_failed"
 
+def _extract_pdf_text(payload: Union[bytes, str]) -> Tuple[str, str]:
+    try:
+        from PyPDF2 import PdfReader
+        # ensure BytesIO gets bytes: handle bytes, bytearray, memoryview and fallback to encoding strings
+        if isinstance(payload, bytes):
+            bio_bytes = payload
+        elif isinstance(payload, (bytearray, memoryview)):
+            bio_bytes = bytes(payload)
+        else:
+            # fallback for str or other types
+            bio_bytes = str(payload).encode()
+        bio = BytesIO(bio_bytes)
+        reader = PdfReader(bio)
+        pages: List[str] = []
+        for p in reader.pages:
+            txt = p.extract_text() or ""
+            pages.append(txt)
+        content = "\n".join(pages).strip()
+        if content:
+            return content, "pdf_text_extracted"
+        return "", "pdf_no_text_extracted"
+    except Exception:
+        return "", "pdf_extraction_failed"
+
 @bp.route("/classify", methods=["GET", "POST"])
 def classify():
     # If requested via GET, render the index page with the form
@@ -214,14 +297,23 @@ def classify():
                 if file_text:
                     text = file_text
 
-        # use HTML-aware classifier so we can render the score fragment in the template
+        # single evaluation: decision, confidence, reason and score fragment all come
+        # from one ClassificationResult. ml_threshold=0.0 keeps the ML fallback out
+        # of the UI path (the LLM is only called on explicit request).
         try:
-            # primary: heuristic decision, HTML fragment and structured details (no ML/LLM override)
-            decision, score_html, details = classify_text_html(text)
+            result = classify_text_result(text, ml_threshold=0.0)
+            decision = result.decision
+            confidence = result.confidence
+            details = result.details
+            debug = result.reason
+            needs_review = result.needs_review
+            score_html = result.render_html()
         except Exception:
+            logger.exception("classification failed; using keyword heuristic")
             decision = classify_email(text)
             score_html = ""
             details = {}
+            confidence = 0.2
 
         # sanitize classifier HTML fragment before marking safe in templates
         if score_html and _BLEACH_AVAILABLE:
@@ -240,18 +332,12 @@ def classify():
                 'code': ['class']
             }
             try:
-                score_html = bleach.clean(score_html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
+                with metrics.stage_timer("sanitize"):
+                    score_html = bleach.clean(score_html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
             except Exception:
                 # fallback: strip all tags
                 score_html = re.sub(r'<[^>]+>', '', score_html)
 
-        # compute confidence using the classifier helper but do NOT allow automatic ML fallback here
-        try:
-            # set ml_threshold=0.0 so classify_text_with_confidence computes confidence but will not call ML
-            _decision_tmp, confidence, _used_ml = classify_text_with_confidence(text, ml_threshold=0.0)
-        except Exception:
-            confidence = 0.2
-
         # ambiguous if confidence below a configurable UI threshold
         amb_threshold = float(current_app.config.get("LLM_PROMPT_CONF_THRESHOLD", 0.6))
         ambiguous = (confidence is None) or (confidence < amb_threshold)
@@ -259,9 +345,6 @@ def classify():
         # whether server allows UI-triggered LLM (global server enable + explicit allow toggle)
         llm_allowed = bool(current_app.config.get("ENABLE_LLM")) and bool(current_app.config.get("ALLOW_UI_LLM_TOGGLE", False))
 
-        needs_review = (get_last_decision_reason() == "needs_human_review")
-        debug = get_last_decision_reason()
-
         # prepare a display-friendly HTML version of the email text (keep original text for classification)
         def _format_text_for_display(s: str) -> str:
             if not s:
@@ -309,7 +392,45 @@ def classify():
 
 @bp.route('/_health', methods=['GET'])
 def _health():
-    return jsonify({'status': 'ok'})
+    return jsonify({'status': 'ok', 'classify_cache': result_cache_stats(), 'llm_cache': llm_cache_stats(), 'llm_models': llm_model_health(),
+                    'llm_scheduler': scheduler_stats(), 'llm_neardup': neardup_stats(), 'rules': rules_info()})
+
+
+@bp.route('/metrics', methods=['GET'])
+def _metrics():
+    """Métricas no formato texto do Prometheus (somadas entre os workers quando METRICS_DIR está definido)."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+_warmup_lock = threading.Lock()
+_warmup_thread: Optional[threading.Thread] = None
+
+
+def _start_background_warm_up() -> None:
+    # used when the app was started without WARMUP_ON_START: warm up once, off the request thread
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return
+        def _run() -> None:
+            try:
+                warm_up()
+            except Exception:
+                logger.exception("background warm-up failed")
+        _warmup_thread = threading.Thread(target=_run, name="classifier-warmup", daemon=True)
+        _warmup_thread.start()
+
+
+@bp.route('/_ready', methods=['GET'])
+def _ready():
+    """Prontidão: 200 só depois do warm-up do classificador (modelo, regras, caches)."""
+    if is_warm():
+        return jsonify({'status': 'ready'})
+    _start_background_warm_up()
+    resp = jsonify({'status': 'warming'})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = '1'
+    return resp
 
 # Cria aliases para endpoints para que templates que usam main.index / main.classify
 # resolvam corretamente
@@ -0,0 +1,228 @@
+"""Small result caches with LRU/TTL eviction and hit/miss counters.
+
+``TTLCache`` is an in-process LRU. ``SQLiteCache`` keeps entries in a local
+SQLite file so every gunicorn worker on the host shares hits. ``TieredCache``
+puts the in-process LRU in front of the shared one. Values must be
+JSON-serializable for the SQLite backend.
+
+A cache must never break the caller: backend errors are logged and treated
+as misses.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache with a per-entry time-to-live."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0) -> None:
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SQLiteCache:
+    """Cache stored in a local SQLite file, shared by all processes on the host.
+
+    Expiry uses wall-clock time (comparable across processes). Reads never
+    write, so concurrent workers only contend on inserts; size is bounded by
+    pruning the oldest entries every ``prune_every`` inserts.
+    """
+
+    def __init__(self, path: str, maxsize: int = 10000, ttl: float = 3600.0, prune_every: int = 64) -> None:
+        self.path = path
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.prune_every = max(1, int(prune_every))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)) or ".", exist_ok=True)
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread and per process (connections must not cross a fork)
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            row = self._conn().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            logger.debug("sqlite cache read failed", exc_info=True)
+            self.errors += 1
+            self.misses += 1
+            return None
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, expires) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now + self.ttl),
+            )
+            with self._lock:
+                self._inserts += 1
+                prune = self._inserts % self.prune_every == 0
+            if prune:
+                self._prune(conn, now)
+        except sqlite3.Error:
+            logger.debug("sqlite cache write failed", exc_info=True)
+            self.errors += 1
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        excess = count - self.maxsize
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created LIMIT ?)", (excess,)
+            )
+
+    def clear(self) -> None:
+        try:
+            self._conn().execute("DELETE FROM cache")
+        except sqlite3.Error:
+            logger.debug("sqlite cache clear failed", exc_info=True)
+
+    def __len__(self) -> int:
+        try:
+            return int(self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0])
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class TieredCache:
+    """In-process LRU in front of a shared cache; shared hits are promoted to memory."""
+
+    def __init__(self, front: TTLCache, back: SQLiteCache) -> None:
+        self.front = front
+        self.back = back
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.front.get(key)
+        if value is not None:
+            return value
+        value = self.back.get(key)
+        if value is not None:
+            self.front.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self.front.set(key, value)
+        self.back.set(key, value)
+
+    def clear(self) -> None:
+        self.front.clear()
+        self.back.clear()
+
+    def __len__(self) -> int:
+        return len(self.front)
+
+    def stats(self) -> Dict[str, Any]:
+        front, back = self.front.stats(), self.back.stats()
+        hits = front["hits"] + back["hits"]
+        lookups = front["hits"] + front["misses"]
+        return {
+            "backend": "memory+sqlite",
+            "hits": hits,
+            "misses": back["misses"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": front,
+            "shared": back,
+        }
+
+
+def make_cache(maxsize: int, ttl: float, path: Optional[str] = None) -> Union[TTLCache, TieredCache]:
+    """Build an in-memory cache, or a tiered memory+SQLite cache when ``path`` is given."""
+    front = TTLCache(maxsize=maxsize, ttl=ttl)
+    if not path:
+        return front
+    # the shared file serves every worker, so give it room for several workers' working sets
+    return TieredCache(front, SQLiteCache(path, maxsize=maxsize * 8, ttl=ttl))
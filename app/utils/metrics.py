@@ -0,0 +1,388 @@
+"""Low-overhead counters and stage timers exposed in Prometheus text format.
+
+Every process keeps its metrics in memory (one lock-protected dict update per
+observation). When ``METRICS_DIR`` is set, which gunicorn deployments with
+several workers need, each process also writes a snapshot of its values to
+``METRICS_DIR/metrics_<pid>.json``. A daemon thread does this every
+``METRICS_FLUSH_INTERVAL`` seconds, only when something changed. ``/metrics``
+then sums the snapshots of all workers, whichever worker serves the scrape.
+Snapshots of workers that exited are folded into ``metrics_archive.json``, so
+counters never go backwards when gunicorn replaces a worker.
+
+After a fork (``gunicorn --preload``) the child starts from empty metrics, so
+nothing recorded by the master before forking is counted twice.
+``METRICS_ENABLED=0`` turns all recording into a no-op.
+
+Metrics:
+    automail_stage_seconds{stage}                  histogram of pipeline stage latencies
+    automail_decisions_total{reason}               classifications by decision reason
+    automail_ml_fallback_total{outcome}            ML fallback attempts (used / unavailable / error)
+    automail_llm_requests_total{op,model,outcome}  LLM/HF candidate calls (ok / cache_hit / near_duplicate / coalesced / cancelled / deadline / saturated / failure kind)
+    automail_llm_ttft_seconds{model}               time to the first streamed token of a reply
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar, cast
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+Labels = Tuple[str, ...]
+
+# seconds; covers a ~10 us filter up to a 30 s LLM call
+STAGE_BUCKETS: Tuple[float, ...] = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# name -> (type, help, label names)
+METRICS: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "automail_stage_seconds": ("histogram", "Latency of classification and LLM pipeline stages.", ("stage",)),
+    "automail_decisions_total": ("counter", "Classifications by decision reason.", ("reason",)),
+    "automail_ml_fallback_total": ("counter", "ML fallback attempts for low-confidence texts by outcome.",
+                                   ("outcome",)),
+    "automail_llm_requests_total": ("counter", "LLM candidate calls by operation, model and outcome.",
+                                    ("op", "model", "outcome")),
+    "automail_llm_ttft_seconds": ("histogram", "Time to first token of streamed LLM replies.", ("model",)),
+}
+
+_ARCHIVE = "metrics_archive.json"
+
+
+class Registry:
+    """Counters and histograms of one process, optionally mirrored to a shared directory."""
+
+    def __init__(self, directory: Optional[str] = None, enabled: bool = True,
+                 flush_interval: float = 1.0) -> None:
+        self.directory = directory
+        self.enabled = enabled
+        self.flush_interval = max(0.05, float(flush_interval))
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # per series: non-cumulative bucket counts (+Inf last), then sum
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._dirty = False
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex
+        self._flusher: Optional[threading.Thread] = None
+        self._claimed = False
+
+    # -- recording --
+    def inc(self, name: str, labels: Labels, value: float = 1.0) -> None:
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+            self._dirty = True
+        if self.directory and self._flusher is None:
+            self._start_flusher()
+
+    def observe(self, name: str, labels: Labels, seconds: float) -> None:
+        if not self.enabled:
+            return
+        key = (name, labels)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0.0] * (len(STAGE_BUCKETS) + 2)
+            series[bisect_left(STAGE_BUCKETS, seconds)] += 1
+            series[-1] += seconds
+            self._dirty = True
+        if self.directory and self._flusher is None:
+            self._start_flusher()
+
+    # -- snapshots --
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": [[n, list(l), v] for (n, l), v in self._counters.items()],
+                "histograms": [[n, list(l), list(s)] for (n, l), s in self._histograms.items()],
+            }
+
+    def _path(self) -> str:
+        return os.path.join(cast(str, self.directory), f"metrics_{self._pid}.json")
+
+    def flush(self) -> None:
+        """Write this process's snapshot (no-op without a directory)."""
+        if not self.directory:
+            return
+        with self._lock:
+            self._dirty = False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if not self._claimed:
+                # a file with our pid left by a dead process: keep its counts before overwriting
+                with _dir_lock(self.directory):
+                    _archive_if_foreign(self.directory, self._path(), self._token)
+                self._claimed = True
+            data = {"pid": self._pid, "token": self._token, **self.snapshot()}
+            tmp = f"{self._path()}.{self._token}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, self._path())
+        except OSError:
+            logger.debug("could not write metrics snapshot to %s", self.directory, exc_info=True)
+
+    def _start_flusher(self) -> None:
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        pid = self._pid
+        while pid == self._pid:
+            time.sleep(self.flush_interval)
+            if self._dirty and pid == self._pid:
+                self.flush()
+
+    def after_fork(self) -> None:
+        # the child must not report (or inherit the lock of) what the parent recorded
+        self._reset_state()
+
+    # -- exposition --
+    def collect(self) -> Dict[str, Any]:
+        """Values summed over every process sharing the directory (or just this one)."""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        total: Dict[str, Any] = {"counters": [], "histograms": []}
+        try:
+            with _dir_lock(self.directory):
+                for path in sorted(glob.glob(os.path.join(self.directory, "metrics_*.json"))):
+                    if os.path.basename(path) == _ARCHIVE:
+                        continue
+                    data = _read(path)
+                    if data is None:
+                        continue
+                    pid = data.get("pid")
+                    if isinstance(pid, int) and not _alive(pid):
+                        _merge_into_archive(self.directory, data)
+                        _remove(path)
+                        continue
+                    _merge(total, data)
+                archive = _read(os.path.join(self.directory, _ARCHIVE))
+                if archive is not None:
+                    _merge(total, archive)
+        except OSError:
+            logger.exception("could not aggregate metrics from %s; reporting this process only", self.directory)
+            return self.snapshot()
+        return total
+
+    def render(self) -> str:
+        return render_prometheus(self.collect())
+
+
+def _merge(into: Dict[str, Any], data: Dict[str, Any]) -> None:
+    counters = {(n, tuple(l)): i for i, (n, l, _) in enumerate(into["counters"])}
+    for n, l, v in data.get("counters", []):
+        i = counters.get((n, tuple(l)))
+        if i is None:
+            counters[(n, tuple(l))] = len(into["counters"])
+            into["counters"].append([n, list(l), v])
+        else:
+            into["counters"][i][2] += v
+    histograms = {(n, tuple(l)): i for i, (n, l, _) in enumerate(into["histograms"])}
+    for n, l, s in data.get("histograms", []):
+        i = histograms.get((n, tuple(l)))
+        if i is None:
+            histograms[(n, tuple(l))] = len(into["histograms"])
+            into["histograms"].append([n, list(l), list(s)])
+        elif len(into["histograms"][i][2]) == len(s):
+            into["histograms"][i][2] = [a + b for a, b in zip(into["histograms"][i][2], s)]
+
+
+def _read(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning("ignoring unreadable metrics file %s", path)
+        return None
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _merge_into_archive(directory: str, data: Dict[str, Any]) -> None:
+    path = os.path.join(directory, _ARCHIVE)
+    archive = _read(path) or {"counters": [], "histograms": []}
+    _merge(archive, data)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(archive, fh)
+    os.replace(tmp, path)
+
+
+def _archive_if_foreign(directory: str, path: str, token: str) -> None:
+    data = _read(path)
+    if data is not None and data.get("token") != token:
+        _merge_into_archive(directory, data)
+        _remove(path)
+
+
+def _alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # e.g. EPERM: the process exists but belongs to someone else
+        return True
+    return True
+
+
+@contextmanager
+def _dir_lock(directory: str) -> Iterator[None]:
+    """Serializes archiving across worker processes (no-op without fcntl)."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, ".lock"), "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Tuple[str, ...], values: List[str], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(str(v))}"' for k, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render_prometheus(data: Dict[str, Any]) -> str:
+    """Prometheus text exposition (format 0.0.4) of a collected snapshot."""
+    lines: List[str] = []
+    counters: Dict[str, List[Any]] = {}
+    for n, l, v in data.get("counters", []):
+        counters.setdefault(n, []).append((l, v))
+    histograms: Dict[str, List[Any]] = {}
+    for n, l, s in data.get("histograms", []):
+        histograms.setdefault(n, []).append((l, s))
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for labels, value in sorted(counters.get(name, [])):
+                lines.append(f"{name}{_label_str(label_names, labels)} {_fmt(value)}")
+            continue
+        for labels, series in sorted(histograms.get(name, [])):
+            cumulative = 0.0
+            for bound, count in zip(STAGE_BUCKETS + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{name}_bucket{_label_str(label_names, labels, le)} {_fmt(cumulative)}")
+            lines.append(f"{name}_sum{_label_str(label_names, labels)} {_fmt(series[-1])}")
+            lines.append(f"{name}_count{_label_str(label_names, labels)} {_fmt(cumulative)}")
+    return "\n".join(lines) + "\n"
+
+
+_registry = Registry(
+    directory=os.environ.get("METRICS_DIR") or None,
+    enabled=os.environ.get("METRICS_ENABLED", "1") != "0",
+    flush_interval=float(os.environ.get("METRICS_FLUSH_INTERVAL", "1.0")),
+)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=lambda: _registry.after_fork())
+atexit.register(lambda: _registry.flush() if _registry._dirty else None)
+
+
+def get_registry() -> Registry:
+    return _registry
+
+
+def configure_metrics(directory: Optional[str] = None, enabled: bool = True,
+                      flush_interval: float = 1.0) -> Registry:
+    """Replace the process registry (tests, scripts); metrics recorded so far are dropped."""
+    global _registry
+    _registry = Registry(directory, enabled, flush_interval)
+    return _registry
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    _registry.observe("automail_stage_seconds", (stage,), seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time a block as ``stage`` (recorded even when the block raises)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registry.observe("automail_stage_seconds", (stage,), time.perf_counter() - started)
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Decorator form of stage_timer."""
+    def decorate(fn: F) -> F:
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _registry.observe("automail_stage_seconds", (stage,), time.perf_counter() - started)
+        return cast(F, wrapper)
+    return decorate
+
+
+def count_decision(reason: str) -> None:
+    # drop per-document detail ("keyword_fallback (12 tokens)", ":truncated") to bound cardinality
+    _registry.inc("automail_decisions_total", (reason.split(":", 1)[0].split(" (", 1)[0],))
+
+
+def count_ml_fallback(outcome: str, n: int = 1) -> None:
+    if n:
+        _registry.inc("automail_ml_fallback_total", (outcome,), n)
+
+
+def count_llm_request(op: str, model: str, outcome: str) -> None:
+    _registry.inc("automail_llm_requests_total", (op, model, outcome))
+
+
+def observe_llm_ttft(model: str, seconds: float) -> None:
+    _registry.observe("automail_llm_ttft_seconds", (model,), seconds)
+
+
+def render() -> str:
+    """Current metrics (all workers when METRICS_DIR is set) in Prometheus text format."""
+    return _registry.render()
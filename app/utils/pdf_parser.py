@@ -6,6 +6,9 @@ except Exception:
 
 from typing import Union
 
+from app.utils.metrics import timed
+
+@timed("pdf_extraction")
 def pdf_to_text(path_or_bytes: Union[str, bytes, bytearray, memoryview]):
     if extract_text is None:
         raise RuntimeError("pdfminer.six não instalado")
@@ -13,6 +16,7 @@ def pdf_to_text(path_or_bytes: Union[str, bytes, bytearray, memoryview]):
         return extract_text(io.BytesIO(path_or_bytes))
     return extract_text(path_or_bytes)
 
+@timed("pdf_extraction")
 def extract_text_from_pdf(pdf_path: str):
     from PyPDF2 import PdfReader
 
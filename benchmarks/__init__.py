@@ -0,0 +1,7 @@
+"""Offline micro-benchmarks for the rule-based classifier.
+
+``benchmarks.corpus`` generates a reproducible Portuguese/English e-mail
+corpus; ``benchmarks.run`` times the public classifier functions and the
+individual pipeline stages on it and compares the results with a stored
+baseline (see ``python -m benchmarks.run --help``).
+"""
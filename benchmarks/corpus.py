@@ -0,0 +1,198 @@
+"""Reproducible synthetic e-mail corpus for the benchmarks.
+
+Every text is built from fixed Portuguese/English fragments with a seeded
+``random.Random``, so the same ``(kind, count, seed)`` always yields the same
+texts on any machine and no file or network access is needed.
+
+Kinds:
+    short    one-liners ("urgente", "Obrigado!", "Can you check?")
+    typical  greeting + a few sentences (requests, dates, thanks) + signature
+    feed     social-network digests ("Ler mais", "Voto positivo", ...)
+    spammy   promotions full of symbols, links and repeated characters
+    huge     ~1 MB typical e-mail thread (long PDFs / pasted histories)
+"""
+from typing import Callable, Dict, List, Sequence, Tuple
+import random
+
+KINDS: Tuple[str, ...] = ("short", "typical", "feed", "spammy", "huge")
+HUGE_CHARS = 1_000_000
+
+_GREETINGS = {
+    "pt": ("Olá equipe,", "Bom dia!", "Prezados,", "Oi Ana,", "Boa tarde, pessoal."),
+    "en": ("Hi team,", "Hello!", "Dear all,", "Hi Ana,", "Good afternoon,"),
+}
+_REQUESTS = {
+    "pt": (
+        "Por favor, envie o relatório atualizado até amanhã.",
+        "Você poderia revisar o anexo e confirmar os valores?",
+        "Preciso que atualizem o status do ticket {n} hoje.",
+        "Podemos agendar uma reunião na quarta às {h}h para discutir o projeto?",
+        "O prazo de vencimento da fatura é {d}/{m}, favor confirmar o pagamento.",
+        "Clique aqui para acessar o pedido e aprovar a solicitação.",
+        "Estamos com um erro no sistema do cliente, é urgente.",
+    ),
+    "en": (
+        "Could you please send the updated report by tomorrow?",
+        "Can you review the attached file and confirm the numbers?",
+        "Please update the status of ticket {n} today.",
+        "Would you schedule a meeting on Wednesday at {h}pm to discuss the project?",
+        "The invoice is due on {m}/{d}, please confirm the payment.",
+        "Click here to open the request and approve it.",
+        "We have an urgent issue with the customer's system.",
+    ),
+}
+_SOCIAL = {
+    "pt": (
+        "Feliz aniversário! Tudo de bom para você.",
+        "Parabéns pela conquista, muito merecido!",
+        "Obrigado pelo almoço de ontem, foi ótimo.",
+        "Boas festas e um feliz ano novo a todos.",
+        "Só passando para dar um oi.",
+    ),
+    "en": (
+        "Happy birthday! All the best to you.",
+        "Congratulations on the award, well deserved!",
+        "Thanks for the lunch yesterday, it was great.",
+        "Happy holidays and a happy new year to everyone.",
+        "Just checking in to say hello.",
+    ),
+}
+_FILLER = {
+    "pt": (
+        "Segue abaixo o resumo das atividades da semana.",
+        "O time de suporte acompanhou os chamados abertos.",
+        "Conforme conversamos, o cliente aprovou a proposta inicial.",
+        "A equipe de vendas apresentou os números do trimestre.",
+        "Os dados foram extraídos do sistema na segunda-feira.",
+    ),
+    "en": (
+        "Below is the summary of this week's activities.",
+        "The support team followed up on the open cases.",
+        "As discussed, the customer approved the initial proposal.",
+        "The sales team presented the quarterly numbers.",
+        "The data was exported from the system on Monday.",
+    ),
+}
+_SIGNATURES = {
+    "pt": ("Atenciosamente,\nCarlos", "Abraços,\nMarina", "Obrigado,\nEquipe Financeiro"),
+    "en": ("Best regards,\nCarlos", "Cheers,\nMarina", "Thanks,\nFinance Team"),
+}
+_SHORT = {
+    "pt": ("urgente", "Obrigado!", "ok", "Pode verificar?", "Feliz natal!", "Segue anexo.", "oi kkk"),
+    "en": ("urgent", "Thanks!", "ok", "Can you check?", "Merry christmas!", "See attached.", "lol"),
+}
+_FEED_HEADERS = (
+    "Quora Digest", "Notícias em destaque", "LinkedIn", "Top stories for you", "Resumo da comunidade",
+)
+_FEED_ITEMS = {
+    "pt": (
+        "Qual é a melhor linguagem para começar a programar?",
+        "Como foi sua primeira entrevista de emprego?",
+        "João comentou na sua publicação",
+        "Maria e outras 12 pessoas reagiram",
+    ),
+    "en": (
+        "What is the best language to start programming?",
+        "How was your first job interview?",
+        "John commented on your post",
+        "Mary and 12 others reacted",
+    ),
+}
+_FEED_MARKERS = ("Ler mais", "Voto positivo", "Comentar", "Leia mais", "Compartilhar")
+_SPAM_LINES = (
+    "$$$ GANHE DINHEIRO AGORA $$$",
+    "!!! PROMOÇÃO IMPERDÍVEL !!! 90% OFF",
+    "*** YOU HAVE WON *** claim your prize ***",
+    "€€€ ofertas %%% exclusivas ### só hoje",
+    "💰💰💰 CLIQUE >>> http://promo.example.com/{n} <<<",
+    "visit www.deal{n}.example.com ### limited ###",
+    "aaaaaaaa ooooooo !!!!!!!!",
+)
+
+
+def _lang(rnd: random.Random) -> str:
+    return "pt" if rnd.random() < 0.6 else "en"
+
+
+def _fill(rnd: random.Random, template: str) -> str:
+    return template.format(n=rnd.randint(1000, 99999), h=rnd.randint(9, 18),
+                           d=rnd.randint(1, 28), m=rnd.randint(1, 12))
+
+
+def _short(rnd: random.Random) -> str:
+    return rnd.choice(_SHORT[_lang(rnd)])
+
+
+def _typical(rnd: random.Random) -> str:
+    lang = _lang(rnd)
+    productive = rnd.random() < 0.6
+    body: List[str] = []
+    for _ in range(rnd.randint(1, 4)):
+        body.append(rnd.choice(_FILLER[lang]))
+    sentences = _REQUESTS[lang] if productive else _SOCIAL[lang]
+    for _ in range(rnd.randint(1, 3)):
+        body.insert(rnd.randint(0, len(body)), _fill(rnd, rnd.choice(sentences)))
+    return "\n\n".join([rnd.choice(_GREETINGS[lang]), " ".join(body), rnd.choice(_SIGNATURES[lang])])
+
+
+def _feed(rnd: random.Random) -> str:
+    lang = _lang(rnd)
+    lines = [rnd.choice(_FEED_HEADERS)]
+    for _ in range(rnd.randint(3, 8)):
+        lines.append(rnd.choice(_FEED_ITEMS[lang]))
+        lines.extend(rnd.sample(_FEED_MARKERS, rnd.randint(1, 3)))
+    return "\n".join(lines)
+
+
+def _spammy(rnd: random.Random) -> str:
+    return "\n".join(_fill(rnd, rnd.choice(_SPAM_LINES)) for _ in range(rnd.randint(2, 6)))
+
+
+def _huge(rnd: random.Random) -> str:
+    parts: List[str] = []
+    size = 0
+    while size < HUGE_CHARS:
+        part = _typical(rnd)
+        parts.append(part)
+        size += len(part) + 2
+    return "\n\n".join(parts)[:HUGE_CHARS]
+
+
+_GENERATORS: Dict[str, Callable[[random.Random], str]] = {
+    "short": _short,
+    "typical": _typical,
+    "feed": _feed,
+    "spammy": _spammy,
+    "huge": _huge,
+}
+
+
+def generate(kind: str, count: int, seed: int = 0) -> List[str]:
+    """``count`` texts of ``kind``; identical for identical arguments."""
+    if kind not in _GENERATORS:
+        raise ValueError(f"unknown corpus kind {kind!r} (expected one of {KINDS})")
+    # a per-kind stream, so adding texts of one kind never shifts the others
+    rnd = random.Random(f"{seed}:{kind}")
+    return [_GENERATORS[kind](rnd) for _ in range(count)]
+
+
+def corpus(sizes: Dict[str, int], seed: int = 0) -> Dict[str, List[str]]:
+    """Texts for several kinds at once, e.g. ``corpus({"short": 64, "huge": 1})``."""
+    return {kind: generate(kind, n, seed) for kind, n in sizes.items()}
+
+
+def labeled(count: int, seed: int = 0) -> Tuple[List[str], List[str]]:
+    """Training texts and labels for the ML model benchmarks (requests vs social/feed/spam)."""
+    rnd = random.Random(f"{seed}:labeled")
+    texts: List[str] = []
+    labels: List[str] = []
+    for _ in range(count):
+        lang = _lang(rnd)
+        if rnd.random() < 0.5:
+            texts.append(_fill(rnd, rnd.choice(_REQUESTS[lang])) + " " + rnd.choice(_FILLER[lang]))
+            labels.append("Produtivo")
+        else:
+            maker: Sequence[Callable[[random.Random], str]] = (_feed, _spammy, lambda r: r.choice(_SOCIAL[lang]))
+            texts.append(rnd.choice(maker)(rnd))
+            labels.append("Improdutivo")
+    return texts, labels
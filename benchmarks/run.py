@@ -0,0 +1,288 @@
+"""Classifier micro-benchmarks with a stored baseline and a regression gate.
+
+Usage:
+    python -m benchmarks.run                        # run and print the table
+    python -m benchmarks.run --save-baseline        # store benchmarks/baseline.json
+    python -m benchmarks.run --compare              # fail (exit 1) on regressions
+    python -m benchmarks.run --only classify_text --kinds short,typical --quick
+
+Each case is ``<function or stage>/<corpus kind>``. A case calls the function
+on the texts of its kind in turn until ``--min-time`` seconds and
+``--min-calls`` calls have elapsed, and reports ops/sec and the p50/p99
+latency of single calls. The result cache is disabled and the ML fallback
+uses a model trained in-process on the synthetic corpus, so nothing is read
+from disk or the network.
+
+Each case runs in ``--repeat`` rounds and the fastest round counts, which
+filters out most scheduler and allocator noise. Raw ops/sec depend on the
+machine, so a fixed calibration workload is timed right before every round;
+the regression gate compares ops/sec divided by that calibration speed, which
+keeps a baseline recorded on one machine usable on another and absorbs CPU
+frequency changes during the run.
+A case regresses when its normalized throughput drops by more than
+``--threshold`` (default 0.25, i.e. 25%) and still does after ``--retries``
+re-measurements of just the regressed cases (a real slowdown persists, a
+noisy round does not). ``--quick`` runs are too short to
+gate on; they are for eyeballing a change.
+"""
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import time
+
+from benchmarks.corpus import KINDS, corpus, labeled
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+RESULTS_VERSION = 1
+DEFAULT_THRESHOLD = 0.25
+# regressed cases are measured again this many times before the gate fails
+DEFAULT_RETRIES = 2
+# texts per kind; a single huge text is enough (and each call takes ~1 s)
+CORPUS_SIZES = {"short": 64, "typical": 64, "feed": 32, "spammy": 32, "huge": 1}
+
+
+@dataclass
+class CaseResult:
+    calls: int
+    ops: float  # items per second in the fastest round
+    p50_us: float
+    p99_us: float
+    norm_ops: float  # ops / calibration speed (best round); what the gate compares
+
+
+@dataclass
+class Case:
+    name: str
+    kind: str
+    fn: Callable[[Any], Any]
+    inputs: Sequence[Any]
+    items_per_call: int = 1  # classify_batch handles many texts per call
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}/{self.kind}"
+
+
+def _percentile(sorted_ns: Sequence[int], q: float) -> float:
+    idx = min(len(sorted_ns) - 1, max(0, int(round(q * (len(sorted_ns) - 1)))))
+    return sorted_ns[idx] / 1000.0
+
+
+def calibrate(repeat: int = 3) -> float:
+    """Speed of a fixed pure-Python/regex workload (runs per second, best of ``repeat``)."""
+    words = ("por favor envie o relatório amanhã could you please confirm the meeting " * 20).split()
+    pattern = re.compile(r"\b(envie|confirm)\b")
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(200):
+            counts: Dict[str, int] = {}
+            for w in words:
+                counts[w.lower()] = counts.get(w.lower(), 0) + 1
+            pattern.findall(" ".join(words))
+        best = min(best, time.perf_counter() - t0)
+    return 1.0 / best
+
+
+def _timed_calls(case: Case, start: int, min_time: float, min_calls: int, max_calls: int) -> List[int]:
+    fn, inputs = case.fn, case.inputs
+    lat: List[int] = []
+    i = start
+    deadline = time.perf_counter() + min_time
+    while len(lat) < max_calls and (len(lat) < min_calls or time.perf_counter() < deadline):
+        x = inputs[i % len(inputs)]
+        t0 = time.perf_counter_ns()
+        fn(x)
+        lat.append(time.perf_counter_ns() - t0)
+        i += 1
+    return lat
+
+
+def measure(case: Case, min_time: float, min_calls: int, max_calls: int, repeat: int = 3) -> CaseResult:
+    """Time ``case`` in ``repeat`` rounds and keep the fastest one (like ``timeit``).
+
+    Each round is normalized by the calibration speed measured right before it;
+    the latency percentiles cover the calls of every round.
+    """
+    # one untimed pass warms lazy tables, regex caches and the matcher memo
+    for x in case.inputs[: min(len(case.inputs), 8)]:
+        case.fn(x)
+    all_lat: List[int] = []
+    best_ops = best_norm = 0.0
+    for _ in range(max(1, repeat)):
+        speed = calibrate()
+        lat = _timed_calls(case, len(all_lat), min_time / max(1, repeat), min_calls, max_calls)
+        total_s = sum(lat) / 1e9
+        ops = len(lat) * case.items_per_call / total_s if total_s > 0 else float("inf")
+        best_ops, best_norm = max(best_ops, ops), max(best_norm, ops / speed)
+        all_lat += lat
+    all_lat.sort()
+    return CaseResult(len(all_lat), round(best_ops, 2), round(_percentile(all_lat, 0.50), 1),
+                      round(_percentile(all_lat, 0.99), 1), round(best_norm, 6))
+
+
+def _trained_model(seed: int):
+    from app.nlp.classifier import EmailClassifier
+
+    texts, labels = labeled(400, seed)
+    model = EmailClassifier()
+    model.train(texts, labels)
+    return model
+
+
+def build_cases(texts: Dict[str, List[str]], model: Any) -> List[Case]:
+    from app.nlp import classifier as clf
+    from app.nlp.preprocess import preprocess_text
+
+    cases: List[Case] = []
+    for kind, items in texts.items():
+        scored = [(*clf._score_text(t), t) for t in items]
+        cases += [
+            # public entry points
+            Case("classify_text", kind, clf.classify_text, items),
+            Case("classify_text_with_confidence", kind, clf.classify_text_with_confidence, items),
+            Case("classify_text_html", kind, clf.classify_text_html, items),
+            Case("preprocess_text", kind, preprocess_text, items),
+            Case("EmailClassifier.classify", kind, model.classify, items),
+            # pipeline stages; each call analyzes its own copy of the text like the pipeline does
+            Case("stage.hard_filter", kind, clf._hard_filter, items),
+            Case("stage.score_text", kind, clf._score_text, items),
+            Case("stage.apply_overrides", kind, lambda a: clf._apply_overrides(*a), scored),
+            Case("stage.compute_confidence", kind, lambda a: clf._compute_confidence(*a[:3]), scored),
+            Case("stage.ml_fallback", kind, clf._try_ml_classify, items),
+        ]
+        if len(items) > 1:
+            batch = list(items[:32])
+            cases.append(Case("classify_batch", kind, clf.classify_batch, [batch], items_per_call=len(batch)))
+    return cases
+
+
+def run(only: Optional[Sequence[str]] = None, kinds: Sequence[str] = KINDS, seed: int = 0,
+        min_time: float = 1.0, min_calls: int = 2, max_calls: int = 100_000, repeat: int = 3,
+        progress: Optional[Callable[[str, CaseResult], None]] = None,
+        keys: Optional[Collection[str]] = None) -> Dict[str, Any]:
+    """Run the benchmarks and return a JSON-serializable results document.
+
+    ``only`` selects functions/stages by name (``"stage"`` selects every stage),
+    ``keys`` selects exact ``name/kind`` cases.
+    """
+    from app.nlp import classifier as clf
+
+    texts = corpus({k: CORPUS_SIZES[k] for k in kinds}, seed)
+    model = _trained_model(seed)
+    saved = clf._ml_clf, clf._result_cache, clf._result_cache_configured
+    # the ML fallback uses the in-process model (never one loaded from disk) and
+    # the result cache is off, so the computation is timed rather than cache hits
+    clf._ml_clf = model
+    clf.configure_result_cache(maxsize=0)
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for case in build_cases(texts, model):
+            if only and not any(case.name == o or case.name.startswith(o + ".") for o in only):
+                continue
+            if keys is not None and case.key not in keys:
+                continue
+            res = measure(case, min_time, min_calls, max_calls, repeat)
+            results[case.key] = asdict(res)
+            if progress:
+                progress(case.key, res)
+    finally:
+        clf._ml_clf, clf._result_cache, clf._result_cache_configured = saved
+    return {
+        "version": RESULTS_VERSION,
+        "seed": seed,
+        "calibration_ops": round(calibrate(), 3),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = DEFAULT_THRESHOLD) -> List[Tuple[str, float, float]]:
+    """Cases whose normalized throughput fell by more than ``threshold``: (key, baseline, current)."""
+    regressions: List[Tuple[str, float, float]] = []
+    base = baseline.get("results", {})
+    for key, res in current.get("results", {}).items():
+        old = base.get(key)
+        if not old or not old.get("norm_ops"):
+            continue
+        if res["norm_ops"] < old["norm_ops"] * (1.0 - threshold):
+            regressions.append((key, old["norm_ops"], res["norm_ops"]))
+    return regressions
+
+
+def _print_row(key: str, res: CaseResult) -> None:
+    print(f"{key:<48} {res.ops:>12.1f} {res.p50_us:>12.1f} {res.p99_us:>12.1f} {res.calls:>8}", flush=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--only", default="", help="comma-separated function/stage names (e.g. classify_text,stage)")
+    parser.add_argument("--kinds", default=",".join(KINDS), help="comma-separated corpus kinds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds per case (split over the rounds)")
+    parser.add_argument("--min-calls", type=int, default=2, help="calls per round, however long they take")
+    parser.add_argument("--repeat", type=int, default=3, help="rounds per case; the fastest counts")
+    parser.add_argument("--quick", action="store_true", help="short run (0.1 s, 1 round, 1 call per case)")
+    parser.add_argument("--json", dest="json_out", help="also write the results to this file")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH, help="store the results as the baseline")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help="compare with a baseline file")
+    parser.add_argument("--threshold", type=float,
+                        default=float(os.environ.get("BENCH_THRESHOLD", DEFAULT_THRESHOLD)),
+                        help="allowed throughput drop before failing (fraction, default 0.25)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help="re-measure regressed cases this many times before failing")
+    args = parser.parse_args(argv)
+
+    kinds = [k for k in args.kinds.split(",") if k]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        parser.error(f"unknown kinds: {sorted(unknown)}")
+    only = [o for o in args.only.split(",") if o]
+    min_time, min_calls, repeat = (0.1, 1, 1) if args.quick else (args.min_time, args.min_calls, args.repeat)
+
+    print(f"{'case':<48} {'ops/s':>12} {'p50 us':>12} {'p99 us':>12} {'calls':>8}")
+    settings = dict(seed=args.seed, min_time=min_time, min_calls=min_calls, repeat=repeat, progress=_print_row)
+    current = run(only, kinds, **settings)
+    print(f"calibration: {current['calibration_ops']:.1f} runs/s")
+
+    regressions: List[Tuple[str, float, float]] = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(current, baseline, args.threshold)
+        for _ in range(max(0, args.retries)):
+            if not regressions:
+                break
+            print(f"re-measuring {len(regressions)} regressed case(s)")
+            again = run(kinds=kinds, keys={key for key, _, _ in regressions}, **settings)
+            for key, res in again["results"].items():
+                if res["norm_ops"] > current["results"][key]["norm_ops"]:
+                    current["results"][key] = res
+            regressions = compare(current, baseline, args.threshold)
+
+    for path in (args.json_out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as fh:
+                json.dump(current, fh, indent=2, sort_keys=True)
+                fh.write("\n")
+            print("wrote", path)
+
+    if args.compare:
+        for key, old, new in regressions:
+            print(f"REGRESSION {key}: {old:.4f} -> {new:.4f} normalized ops ({(new / old - 1) * 100:+.1f}%)")
+        if regressions:
+            return 1
+        print(f"no regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""Convert the joblib model (email_classifier_model.pkl) to the compact mmap format.
+
+Usage: python -m scripts.convert_model [model.pkl] [out_dir]
+"""
+import sys
+
+from app.nlp.classifier import COMPACT_MODEL_PATH, MODEL_PATH, convert_model_to_compact
+
+src = sys.argv[1] if len(sys.argv) > 1 else MODEL_PATH
+dst = sys.argv[2] if len(sys.argv) > 2 else COMPACT_MODEL_PATH
+print('converted', src, '->', convert_model_to_compact(src, dst))
@@ -0,0 +1,13 @@
+"""Write the built-in classifier rules as a JSON rule pack (starting point for RULES_PATH).
+
+Usage: python -m scripts.export_rules [out.json]
+"""
+import json
+import sys
+
+from app.nlp.classifier import builtin_rule_pack
+
+out = sys.argv[1] if len(sys.argv) > 1 else 'rules.json'
+with open(out, 'w', encoding='utf-8') as fh:
+    json.dump(builtin_rule_pack().to_dict(), fh, ensure_ascii=False, indent=2)
+print('wrote', out)
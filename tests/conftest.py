@@ -10,6 +10,15 @@ if ROOT not in sys.path:
 from app.main import create_app
 from flask import Flask
 from flask.testing import FlaskClient
+@pytest.fixture(autouse=True)
+def _fresh_result_cache() -> Generator[None, None, None]:
+    # tests monkeypatch classifier internals; never serve a result computed under other patches
+    from app.nlp.classifier import clear_result_cache
+    clear_result_cache()
+    yield
+    clear_result_cache()
+
+
 @pytest.fixture
 def app() -> Generator[Flask, None, None]:
     app = create_app()
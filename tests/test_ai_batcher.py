@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai import session as session_mod
+from app.ai import singleflight
+from app.ai.batcher import MicroBatcher
+from app.ai.client import AIClient
+from app.ai.deadline import Deadline
+from app.ai.scheduler import BULK, INTERACTIVE
+
+
+def test_groups_flush_on_size_or_wait_and_fan_out_in_order():
+    sent = []
+
+    def send(key, items):
+        sent.append((key, list(items)))
+        return [f"{key}:{item}" for item in items]
+
+    batcher = MicroBatcher(send, max_batch=3, max_wait=0.05)
+    futures = [batcher.submit("a", i) for i in range(4)] + [batcher.submit("b", 9)]
+    wait(futures, timeout=5)
+    assert [f.result() for f in futures] == ["a:0", "a:1", "a:2", "a:3", "b:9"]
+    # the first three went out as soon as the batch was full, the rest after max_wait
+    assert sorted(sent) == [("a", [0, 1, 2]), ("a", [3]), ("b", [9])]
+    assert batcher.stats() == {"batches": 3, "items": 5, "avg_batch": 1.67}
+
+
+def test_send_failure_fails_the_whole_batch_and_skips_cancelled_callers():
+    sent = []
+
+    def send(key, items):
+        sent.append(list(items))
+        raise RuntimeError("upstream down")
+
+    batcher = MicroBatcher(send, max_batch=10, max_wait=0.05)
+    gave_up = batcher.submit("k", "x")
+    gave_up.cancel()
+    futures = [batcher.submit("k", "y"), batcher.submit("k", "z")]
+    wait(futures, timeout=5)
+    assert all(isinstance(f.exception(), RuntimeError) for f in futures)
+    assert sent == [["y", "z"]]
+
+
+class _ZeroShotHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        inputs = payload["inputs"]
+        self.server.requests.append(inputs)
+
+        def classify(text):
+            first = "Improdutivo" if "aniversário" in text else "Produtivo"
+            return {"sequence": text, "labels": [first, "Produtivo" if first == "Improdutivo" else "Improdutivo"],
+                    "scores": [0.9, 0.1]}
+
+        time.sleep(0.05)
+        if isinstance(inputs, list) and self.server.batching:
+            body = [classify(t) for t in inputs]
+        else:
+            text = inputs["text"] if isinstance(inputs, dict) else inputs if isinstance(inputs, str) else inputs[0]
+            body = classify(text)
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mnli_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ZeroShotHandler)
+    server.requests, server.batching = [], True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("HF_MODEL", "facebook/bart-large-mnli")
+    monkeypatch.setenv("HF_BATCH_SIZE", "8")
+    monkeypatch.setenv("HF_BATCH_WAIT_MS", "100")
+    monkeypatch.setattr(client_mod, "_batcher", None)
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)
+    monkeypatch.setattr(singleflight, "_flight", None)
+    monkeypatch.setattr(singleflight, "_flight_configured", False)
+    session_mod.reset_session()
+    yield server
+    session_mod.reset_session()
+    server.shutdown()
+    server.server_close()
+
+
+EMAILS = [f"Feliz aniversário, equipe {i}!" if i % 3 == 0 else f"Por favor, envie o relatório {i}." for i in range(12)]
+EXPECTED = ["Improdutivo" if i % 3 == 0 else "Produtivo" for i in range(12)]
+
+
+def test_inbox_is_classified_in_batched_requests(mnli_server):
+    assert AIClient().classify_emails(EMAILS) == EXPECTED
+    assert sum(len(r) if isinstance(r, list) else 1 for r in mnli_server.requests) == 12
+    # 12 emails with batches of up to 8: two requests instead of twelve
+    assert len(mnli_server.requests) == 2
+    assert all(isinstance(r, list) for r in mnli_server.requests)
+
+
+def test_model_without_batch_support_falls_back_to_single_requests(mnli_server):
+    mnli_server.batching = False
+    assert AIClient().classify_emails(EMAILS[:4]) == EXPECTED[:4]
+    assert len([r for r in mnli_server.requests if not isinstance(r, list)]) == 4
+
+
+def test_batching_can_be_disabled(mnli_server, monkeypatch):
+    monkeypatch.setenv("HF_BATCH_SIZE", "1")
+    assert AIClient().classify_emails(EMAILS[:3]) == EXPECTED[:3]
+    assert sorted(r["text"] for r in mnli_server.requests) == sorted(EMAILS[:3])
+
+
+def test_clients_and_budgets_share_a_batch_with_the_tightest_timeout(mnli_server, monkeypatch):
+    sent = []
+    schedule = client_mod._schedule
+
+    def spy(op, model, fn, payloads, *args, **kwargs):
+        sent.append((len(payloads), args[-1]))
+        return schedule(op, model, fn, payloads, *args, **kwargs)
+
+    monkeypatch.setattr(client_mod, "_schedule", spy)
+    budgets = [Deadline(30), Deadline(5)]
+    with ThreadPoolExecutor(2) as pool:
+        labels = list(pool.map(lambda i: AIClient().classify_email(EMAILS[i + 1], budgets[i]), range(2)))
+    assert labels == EXPECTED[1:3]
+    assert len(mnli_server.requests) == 1 and len(sent) == 1
+    assert sent[0][0] == 2 and sent[0][1] <= 5
+
+
+def test_batches_keep_the_bulk_priority_of_their_callers(mnli_server, monkeypatch):
+    priorities = []
+    schedule = client_mod._schedule
+
+    def spy(op, model, fn, *args, priority=None):
+        priorities.append(priority)
+        return schedule(op, model, fn, *args, priority=priority)
+
+    monkeypatch.setattr(client_mod, "_schedule", spy)
+    assert AIClient().classify_emails(EMAILS[:4]) == EXPECTED[:4]
+    assert priorities and set(priorities) == {BULK}
+    priorities.clear()
+    assert AIClient().classify_email(EMAILS[5]) == EXPECTED[5]
+    assert priorities == [INTERACTIVE]
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai import session as session_mod
+from app.ai import singleflight
+from app.ai.client import AIClient
+from app.ai.deadline import Deadline
+from app.utils import metrics
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.paths.append(self.path)
+        time.sleep(2)
+        data = json.dumps([{"generated_text": "Tarde demais."}]).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except OSError:
+            pass  # the client gave up
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowHandler)
+    server.daemon_threads = True
+    server.paths = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("HF_MODEL", "acme/slow")
+    monkeypatch.setenv("HF_RETRIES", "0")
+    monkeypatch.setenv("HF_TIMEOUT", "5")
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)
+    monkeypatch.setattr(singleflight, "_flight", None)
+    monkeypatch.setattr(singleflight, "_flight_configured", False)
+    monkeypatch.setattr(metrics, "_registry", metrics._registry)
+    metrics.configure_metrics()
+    session_mod.reset_session()
+    yield server
+    session_mod.reset_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_deadline_bounds_generation_and_skips_later_candidates(slow_server):
+    started = time.monotonic()
+    reply = AIClient().generate_response({}, {}, category="Produtivo", original_text="Preciso do relatório.",
+                                         deadline=Deadline(0.5))
+    # one HF_TIMEOUT (5s) per candidate used to be possible; the whole call now fits the budget
+    assert time.monotonic() - started < 1.5
+    assert reply == client_mod._canned_reply("Produtivo")
+    assert slow_server.paths == ["/acme/slow"]
+    out = metrics.render()
+    assert 'automail_llm_requests_total{op="generate",model="acme/slow",outcome="deadline"} 1' in out
+    # running out of budget says nothing about the model's health
+    assert health.get_tracker().snapshot()["acme/slow"]["calls"] == 0
+
+
+def test_deadline_falls_back_to_local_classifier(slow_server):
+    text = "Por favor, envie o relatório de vendas até sexta."
+    started = time.monotonic()
+    label = AIClient().classify_email(text, deadline=Deadline(0.5))
+    assert time.monotonic() - started < 1.5
+    assert label == client_mod.nlp_classify_email(text)
+    assert len(slow_server.paths) == 1
+
+
+def test_deadline_bounds_hedged_calls(slow_server, monkeypatch):
+    monkeypatch.setenv("HF_ASYNC", "1")
+    monkeypatch.setenv("HF_HEDGE_DELAY", "0.1")
+    started = time.monotonic()
+    reply = AIClient().generate_response({}, {}, category="Produtivo", original_text="Pode confirmar?",
+                                         deadline=Deadline(0.6))
+    assert time.monotonic() - started < 1.5
+    assert reply == client_mod._canned_reply("Produtivo")
+
+
+def test_deadline_remaining_and_timeout():
+    assert Deadline(0).remaining() is None and not Deadline(None).expired
+    assert Deadline(0).timeout(12.0) == 12.0
+    deadline = Deadline(0.05)
+    assert deadline.timeout(12.0) <= 0.05
+    time.sleep(0.06)
+    assert deadline.expired and deadline.remaining() == 0.0
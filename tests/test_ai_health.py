@@ -0,0 +1,75 @@
+from app.ai.health import CLOSED, HALF_OPEN, OPEN, HealthTracker
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_then_half_open_probe_decides():
+    clock = _Clock()
+    tracker = HealthTracker(failures=3, cooldown=60, clock=clock)
+    for _ in range(2):
+        tracker.record("m", ok=False)
+    assert tracker.allow("m")
+    tracker.record("m", ok=False)
+    assert not tracker.allow("m")
+    assert tracker.snapshot()["m"]["state"] == OPEN
+
+    clock.now += 61
+    assert tracker.allow("m")  # the half-open probe
+    assert not tracker.allow("m")  # only one at a time
+    assert tracker.snapshot()["m"]["state"] == HALF_OPEN
+    tracker.record("m", ok=False)  # a failed probe re-opens at once
+    assert not tracker.allow("m")
+
+    clock.now += 61
+    assert tracker.allow("m")
+    tracker.record("m", ok=True, latency=0.2)
+    assert tracker.snapshot()["m"]["state"] == CLOSED
+    assert tracker.allow("m") and tracker.allow("m")
+
+
+def test_not_found_opens_immediately_and_lost_probes_expire():
+    clock = _Clock()
+    tracker = HealthTracker(failures=3, cooldown=10, clock=clock)
+    tracker.record("gone", ok=False, hard=True)
+    assert tracker.order(["gone", "other"]) == ["other"]
+    clock.now += 11
+    assert tracker.allow("gone")  # probe claimed but never reported (e.g. cancelled)
+    clock.now += 5
+    assert not tracker.allow("gone")
+    clock.now += 6
+    assert tracker.allow("gone")
+
+
+def test_candidates_are_ordered_by_expected_cost():
+    tracker = HealthTracker(alpha=0.5)
+    tracker.record("slow", ok=True, latency=4.0)
+    tracker.record("fast", ok=True, latency=0.5)
+    tracker.record("flaky", ok=True, latency=0.3)  # cost 0.3 / 0.5 success = 0.6
+    tracker.record("flaky", ok=False)
+    tracker.record("fast", ok=True, latency=1.5)  # EWMA: 0.5 * 1.5 + 0.5 * 0.5 = 1.0
+    assert tracker.snapshot()["fast"]["ewma_latency_ms"] == 1000.0
+    # unknown models are costed at the median latency and keep their relative order
+    assert tracker.order(["slow", "new-a", "flaky", "fast", "new-b"]) == ["flaky", "new-a", "fast", "new-b", "slow"]
+    assert HealthTracker(reorder=False).order(["b", "a"]) == ["b", "a"]
+
+
+def test_listing_an_expired_open_model_does_not_claim_its_probe():
+    clock = _Clock()
+    tracker = HealthTracker(failures=1, cooldown=10, clock=clock)
+    tracker.record("healthy", ok=True, latency=0.1)
+    tracker.record("fallback", ok=False)
+    clock.now += 11
+    # listed after a healthy model that answers: the fallback is never tried
+    assert tracker.order(["healthy", "fallback"]) == ["healthy", "fallback"]
+    assert tracker.snapshot()["fallback"]["state"] == OPEN
+    clock.now += 1
+    assert tracker.is_available("fallback")
+    assert tracker.allow("fallback")  # the probe is still there for the next request that needs it
+    assert tracker.snapshot()["fallback"]["state"] == HALF_OPEN
+    assert not tracker.is_available("fallback")
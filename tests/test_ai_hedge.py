@@ -0,0 +1,129 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai import hedge
+from app.ai import session as session_mod
+from app.ai.client import AIClient
+from app.ai.scheduler import BULK, INTERACTIVE, bulk, current_priority
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.paths.append(self.path)
+        delay, status, body = self.server.models.get(self.path, (0, 404, {"error": "not found"}))
+        time.sleep(delay)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def hf_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.paths, server.models = [], {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("HF_MODEL", "acme/slow")
+    monkeypatch.setenv("HF_RETRIES", "0")
+    monkeypatch.setenv("HF_TIMEOUT", "5")
+    monkeypatch.setenv("HF_ASYNC", "1")
+    monkeypatch.setenv("HF_HEDGE_DELAY", "0.2")
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)  # fresh breaker state per test
+    session_mod.reset_session()
+    yield server
+    session_mod.reset_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_work_on_the_loop_keeps_the_callers_priority():
+    async def attempt():
+        return current_priority(), await hedge.call(1.0, current_priority)
+
+    async def raced():
+        return await hedge.race([attempt], delay=0)
+
+    with bulk():
+        assert hedge.run_sync(raced()) == (BULK, BULK)
+    assert hedge.run_sync(raced()) == (INTERACTIVE, INTERACTIVE)
+
+
+def test_race_hedges_after_delay_and_cancels_the_rest():
+    started, cancelled = [], []
+
+    def attempt(name, seconds, result):
+        async def run():
+            started.append(name)
+            try:
+                await asyncio.sleep(seconds)
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+            return result
+        return run
+
+    async def scenario(delay):
+        started.clear()
+        cancelled.clear()
+        return await hedge.race([attempt("slow", 1.0, "a"), attempt("fails", 0.0, None),
+                                 attempt("fast", 0.05, "c"), attempt("unused", 0.0, "d")], delay=delay)
+
+    assert asyncio.run(scenario(0.1)) == "c"
+    # "fails" is replaced by "fast" immediately; "unused" is never needed
+    assert started == ["slow", "fails", "fast"]
+    assert cancelled == ["slow"]
+    assert asyncio.run(scenario(None)) == "a"
+    assert started == ["slow"]
+
+
+def test_slow_model_is_hedged_by_the_next_candidate(hf_server):
+    hf_server.models["/acme/slow"] = (3, 200, [{"generated_text": "Lenta."}])
+    hf_server.models["/meta-llama/Llama-3.1-8B-Instruct"] = (0, 200, [{"generated_text": "Rápida."}])
+    start = time.monotonic()
+    reply = AIClient().generate_response({}, {}, category="Produtivo", original_text="Preciso do relatório.")
+    assert reply == "Rápida."
+    assert time.monotonic() - start < 2
+    assert hf_server.paths == ["/acme/slow", "/meta-llama/Llama-3.1-8B-Instruct"]
+
+
+def test_404_and_503_candidates_are_replaced_without_waiting(hf_server, monkeypatch):
+    monkeypatch.setenv("HF_HEDGE_DELAY", "10")  # waiting for the hedge delay would be far too slow
+    hf_server.models["/acme/slow"] = (0, 404, {"error": "not found"})
+    hf_server.models["/facebook/bart-large-mnli"] = (0, 503, {"error": "loading"})
+    hf_server.models["/meta-llama/Llama-3.1-8B-Instruct"] = (0, 200, {"labels": ["Improdutivo", "Produtivo"]})
+    start = time.monotonic()
+    assert AIClient().classify_email("Feliz aniversário!") == "Improdutivo"
+    assert time.monotonic() - start < 2
+    assert hf_server.paths == ["/acme/slow", "/facebook/bart-large-mnli", "/meta-llama/Llama-3.1-8B-Instruct"]
+
+
+def test_all_candidates_failing_falls_back(hf_server):
+    assert AIClient().generate_response({}, {}, category="Produtivo", original_text="Oi").startswith("Obrigado pelo contato")
+    assert AIClient().classify_email("Por favor, envie o relatório até amanhã.") in ("Produtivo", "Improdutivo")
+
+
+def test_run_sync_refuses_to_block_a_running_loop():
+    async def outer():
+        with pytest.raises(RuntimeError):
+            hedge.run_sync(asyncio.sleep(0))
+
+    asyncio.run(outer())
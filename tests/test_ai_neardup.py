@@ -0,0 +1,121 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai import neardup
+from app.ai import session as session_mod
+from app.ai import singleflight
+from app.ai.client import AIClient
+from app.ai.neardup import NearDuplicateIndex
+from app.utils import metrics
+
+ANA = ("Olá Ana Souza, sua matrícula 20231234 no curso Cálculo I foi confirmada. "
+       "Acesse minhas matrículas para ver o horário da turma 3 a partir de 12/05/2024.")
+BRUNO = ("Olá Bruno Lima, sua matrícula 20239876 no curso Cálculo I foi confirmada. "
+         "Acesse minhas matrículas para ver o horário da turma 7 a partir de 14/05/2024.")
+REPLY = "Olá Ana, recebemos a confirmação da matrícula 20231234 na turma 3. Qualquer dúvida, estamos à disposição."
+
+
+def test_templated_email_reuses_the_reply_with_its_own_names_and_numbers():
+    index = NearDuplicateIndex()
+    index.add(ANA, "Produtivo", REPLY)
+    assert index.lookup(BRUNO, "Produtivo") == (
+        "Olá Bruno, recebemos a confirmação da matrícula 20239876 na turma 7. Qualquer dúvida, estamos à disposição.")
+    # a different message or a different decision never reuses it
+    assert index.lookup(BRUNO.replace("foi confirmada", "foi cancelada"), "Produtivo") is None
+    assert index.lookup(BRUNO, "Improdutivo") is None
+    assert index.lookup("Bom dia a todos, segue a pauta da reunião de amanhã sobre o orçamento anual.", "Produtivo") is None
+    stats = index.stats()
+    assert stats["hits"] == 1 and stats["category_mismatch"] == 1 and stats["hit_rate"] == 0.25
+
+
+def test_only_numbers_addresses_links_and_the_greeting_name_may_differ():
+    ticket = ("Olá Ana Souza,\nSeu chamado 1234 sobre o acesso ao portal https://suporte.acme.com/t/1234 "
+              "foi analisado pela equipe de suporte. Resultado: {}.")
+    index = NearDuplicateIndex()
+    index.add(ticket.format("Aprovado"), "Produtivo", "Olá Ana, seu chamado 1234 foi Aprovado, parabéns.")
+    bruno = ticket.format("Aprovado").replace("Ana Souza", "Bruno").replace("1234", "9999")
+    assert index.lookup(bruno, "Produtivo") == "Olá Bruno, seu chamado 9999 foi Aprovado, parabéns."
+    # a capitalized status word is part of the message, not a slot
+    assert index.lookup(bruno.replace("Aprovado", "Reprovado"), "Produtivo") is None
+    assert index.lookup(bruno.replace("equipe de suporte", "equipe de Suporte"), "Produtivo") is not None
+
+
+def test_long_emails_are_never_reused():
+    prefix = " ".join(f"Item {k} da pauta da reunião de planejamento foi revisado pela equipe." for k in range(60))
+    index = NearDuplicateIndex()
+    index.add(prefix + " Reunião confirmada.", "Produtivo", "Reunião confirmada.")
+    assert len(index) == 0
+    assert index.lookup(prefix + " Reunião cancelada, favor estornar o pagamento.", "Produtivo") is None
+
+
+def test_index_is_bounded_and_persisted(tmp_path):
+    path = str(tmp_path / "neardup.sqlite")
+    other_worker = NearDuplicateIndex(path=path, sync_interval=0)
+    index = NearDuplicateIndex(maxsize=3, path=path)
+    emails = [f"Chamado {i}: o sistema de {topic} está fora do ar desde cedo, favor verificar com a equipe."
+              for i, topic in enumerate(["vendas", "estoque", "compras", "folha", "ponto"])]
+    for email in emails:
+        index.add(email, "Produtivo", "Recebido, vamos verificar.")
+    assert len(index) == 3
+    assert index.lookup(emails[0], "Produtivo") is None  # evicted
+    assert index.lookup(emails[4], "Produtivo") == "Recebido, vamos verificar."
+    # another worker picks the entries up from the shared file, and so does a restart
+    assert other_worker.lookup(emails[4], "Produtivo") == "Recebido, vamos verificar."
+    assert NearDuplicateIndex(path=path).lookup(emails[3], "Produtivo") == "Recebido, vamos verificar."
+
+
+class _GenerateHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.calls += 1
+        data = json.dumps([{"generated_text": REPLY}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def hf_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _GenerateHandler)
+    server.calls = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("HF_MODEL", "acme/gen")
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)
+    monkeypatch.setattr(singleflight, "_flight", None)
+    monkeypatch.setattr(singleflight, "_flight_configured", False)
+    monkeypatch.setenv("LLM_NEARDUP", "1")
+    monkeypatch.setattr(neardup, "_index", None)
+    monkeypatch.setattr(neardup, "_index_configured", False)
+    monkeypatch.setattr(metrics, "_registry", metrics._registry)
+    metrics.configure_metrics()
+    session_mod.reset_session()
+    yield server
+    session_mod.reset_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_generate_response_skips_the_llm_for_near_duplicates(hf_server):
+    client = AIClient()
+    assert client.generate_response({}, {}, category="Produtivo", original_text=ANA) == REPLY
+    reply = client.generate_response({}, {}, category="Produtivo", original_text=BRUNO)
+    assert reply.startswith("Olá Bruno, recebemos a confirmação da matrícula 20239876 na turma 7.")
+    assert hf_server.calls == 1
+    assert 'automail_llm_requests_total{op="generate",model="acme/gen",outcome="near_duplicate"} 1' in metrics.render()
+    assert neardup.neardup_stats()["hit_rate"] == 0.5
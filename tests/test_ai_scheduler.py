@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai import neardup
+from app.ai import scheduler as scheduler_mod
+from app.ai import session as session_mod
+from app.ai import singleflight
+from app.ai.client import AIClient
+from app.ai.scheduler import BULK, LLMSaturated, LLMScheduler
+from app.main import create_app
+from app.utils import metrics
+
+
+class _Upstream429(Exception):
+    class response:
+        status_code = 429
+        headers = {"Retry-After": "30"}
+
+
+def _blocked(sched, model="m"):
+    """Occupy the (single) worker until the returned event is set."""
+    release, started = threading.Event(), threading.Event()
+    sched.submit(model, lambda: started.set() or release.wait(5))
+    assert started.wait(5)
+    return release
+
+
+def test_interactive_calls_run_before_queued_bulk_calls():
+    sched = LLMScheduler(workers=1, queue_size=8)
+    release = _blocked(sched)
+    order = []
+    futures = [sched.submit("m", order.append, f"bulk{i}", priority=BULK) for i in range(3)]
+    futures.append(sched.submit("m", order.append, "ui"))
+    release.set()
+    for f in futures:
+        f.result(5)
+    assert order == ["ui", "bulk0", "bulk1", "bulk2"]
+
+
+def test_full_queue_rejects_interactive_calls_and_holds_back_bulk_ones():
+    sched = LLMScheduler(workers=1, queue_size=2)
+    release = _blocked(sched)
+    sched.submit("m", lambda: "a")
+    sched.submit("m", lambda: "b")
+    with pytest.raises(LLMSaturated) as exc:
+        sched.submit("m", lambda: "c")
+    assert exc.value.reason == "queue_full" and exc.value.retry_after >= 1
+    # bulk work may only use half of the queue: it waits for room instead of failing
+    waited = []
+    submitter = threading.Thread(target=lambda: waited.append(sched.submit("m", lambda: "bulk", priority=BULK)))
+    submitter.start()
+    time.sleep(0.1)
+    assert not waited
+    release.set()
+    submitter.join(5)
+    assert waited[0].result(5) == "bulk"
+    assert sched.stats()["rejected"] == {"queue_full": 1}
+
+
+def test_token_bucket_spaces_calls_per_model_and_rejects_long_waits():
+    sched = LLMScheduler(workers=4, queue_size=8, rate=10, burst=1, max_wait=0.5)
+    started = time.monotonic()
+    times = [sched.submit("m", time.monotonic) for _ in range(3)]
+    other = sched.submit("other", time.monotonic)
+    ran = [f.result(5) - started for f in times]
+    assert ran[0] < 0.05 and ran[1] >= 0.09 and ran[2] >= 0.19
+    assert other.result(5) - started < 0.05  # each model has its own bucket
+    slow = LLMScheduler(workers=1, rate=1, burst=1, max_wait=0.5)
+    slow.submit("m", lambda: None)
+    with pytest.raises(LLMSaturated) as exc:
+        slow.submit("m", lambda: None)
+    assert exc.value.reason == "rate_limited" and 0.5 < exc.value.retry_after <= 1
+
+
+def test_upstream_429_pauses_the_model():
+    sched = LLMScheduler(workers=1, max_wait=5)
+
+    def rate_limited():
+        raise _Upstream429()
+
+    with pytest.raises(_Upstream429):
+        sched.submit("m", rate_limited).result(5)
+    with pytest.raises(LLMSaturated) as exc:
+        sched.submit("m", lambda: None)
+    assert exc.value.retry_after > 25
+    assert sched.submit("other", lambda: "ok").result(5) == "ok"
+
+
+def test_saturated_client_call_fails_fast_and_routes_answer_429(monkeypatch):
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", "http://127.0.0.1:9")
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)
+    monkeypatch.setattr(singleflight, "_flight", None)
+    monkeypatch.setattr(singleflight, "_flight_configured", False)
+    monkeypatch.setattr(scheduler_mod, "_scheduler", None)
+    monkeypatch.setattr(metrics, "_registry", metrics._registry)
+    metrics.configure_metrics()
+    sched = scheduler_mod.configure_scheduler(workers=1, queue_size=1)
+    release = _blocked(sched, "other")
+    sched.submit("other", lambda: None)
+    try:
+        started = time.monotonic()
+        with pytest.raises(LLMSaturated):
+            AIClient().generate_response({}, {}, category="Produtivo", original_text="Preciso do relatório.")
+        assert time.monotonic() - started < 1
+        assert 'outcome="saturated"' in metrics.render()
+
+        monkeypatch.setitem(os.environ, "APP_CONFIG", "testing")
+        app = create_app()
+        app.config["ENABLE_LLM"] = True
+        app.config["ALLOW_UI_LLM_TOGGLE"] = True
+        client = app.test_client()
+        for route in ("/classify-llm", "/classify-llm-stream"):
+            resp = client.post(route, json={"text": "Por favor, envie o relatório até sexta."})
+            assert resp.status_code == 429
+            assert int(resp.headers["Retry-After"]) >= 1
+        assert client.get("/_health").get_json()["llm_scheduler"]["rejected"]["queue_full"] >= 3
+    finally:
+        release.set()
+
+
+class _BusyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(429 if self.path == "/acme/busy" else 404)
+        self.send_header("Retry-After", "30")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_upstream_429_on_the_stream_pauses_the_model(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _BusyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("HF_MODEL", "acme/busy")
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)
+    monkeypatch.setattr(neardup, "_index", None)
+    monkeypatch.setattr(neardup, "_index_configured", True)
+    monkeypatch.setattr(scheduler_mod, "_scheduler", None)
+    sched = scheduler_mod.configure_scheduler(workers=1, max_wait=5)
+    session_mod.reset_session()
+    try:
+        started = time.monotonic()
+        assert list(AIClient().stream_response("Produtivo", "Preciso do relatório."))  # canned reply
+        assert time.monotonic() - started < 5
+        with pytest.raises(LLMSaturated) as exc:
+            sched.submit("acme/busy", lambda: None)
+        assert exc.value.reason == "rate_limited" and exc.value.retry_after > 25
+    finally:
+        session_mod.reset_session()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai import session as session_mod
+from app.ai.client import AIClient
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        server.connections.add(self.client_address)
+        server.paths.append(self.path)
+        status, body = server.responses.get(self.path, [(404, {"error": "not found"})])[0]
+        if len(server.responses.get(self.path, [])) > 1:
+            server.responses[self.path].pop(0)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        if status == 503:
+            self.send_header("Retry-After", server.retry_after)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def hf_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.connections, server.paths, server.responses = set(), [], {}
+    server.retry_after = "0"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("HF_MODEL", "acme/missing")
+    monkeypatch.setenv("HF_RETRY_BACKOFF", "0")
+    # a fresh response cache per test; the process-wide one is restored afterwards
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", False)
+    client_mod.configure_llm_cache()
+    monkeypatch.setattr(health, "_tracker", None)  # fresh breaker state per test
+    session_mod.reset_session()
+    yield server
+    session_mod.reset_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_is_shared_and_retries_429_and_503():
+    first = session_mod.get_session()
+    assert session_mod.get_session() is first
+    retry = first.get_adapter("https://example.com").max_retries
+    assert set(retry.status_forcelist) == {429, 503}
+    assert "POST" in retry.allowed_methods
+
+
+def test_candidates_reuse_one_pooled_connection(hf_server):
+    hf_server.responses["/meta-llama/Llama-3.1-8B-Instruct"] = [(200, [{"generated_text": "Resposta pronta."}])]
+    reply = AIClient().generate_response({}, {}, category="Produtivo", original_text="Preciso do relatório.")
+    assert reply == "Resposta pronta."
+    # the first candidate 404s, the next one is served over the same kept-alive connection
+    assert hf_server.paths == ["/acme/missing", "/meta-llama/Llama-3.1-8B-Instruct"]
+    assert len(hf_server.connections) == 1
+
+
+def test_503_is_retried_before_falling_back(hf_server):
+    hf_server.responses["/acme/missing"] = [(503, {"error": "loading"}), (200, [{"generated_text": "Ok!"}])]
+    reply = AIClient().generate_response({}, {}, category="Produtivo", original_text="Pode confirmar?")
+    assert reply == "Ok!"
+    assert hf_server.paths == ["/acme/missing", "/acme/missing"]
+
+
+def test_retries_stay_within_the_call_budget(hf_server):
+    url = f"http://127.0.0.1:{hf_server.server_address[1]}/acme/missing"
+    hf_server.retry_after = "30"
+    hf_server.responses["/acme/missing"] = [(503, {"error": "loading"}), (200, {"ok": True})]
+    started = time.monotonic()
+    with session_mod.call_budget(2.0):
+        r = session_mod.get_session().post(url, json={}, timeout=2.0)
+    # a Retry-After longer than the budget is not waited for: the 503 comes back at once
+    assert r.status_code == 503 and time.monotonic() - started < 1.0
+    assert hf_server.paths == ["/acme/missing"]
+
+    hf_server.retry_after = "0"
+    with session_mod.call_budget(2.0):
+        assert session_mod.get_session().post(url, json={}, timeout=2.0).status_code == 200
+
+
+def test_repeated_prompts_are_served_from_the_llm_cache(hf_server):
+    hf_server.responses["/acme/missing"] = [(200, [{"generated_text": "Resposta pronta."}])]
+    client = AIClient()
+    for _ in range(3):
+        assert client.generate_response({}, {}, category="Produtivo", original_text="Preciso do relatório.") == "Resposta pronta."
+    hf_server.responses["/acme/missing"] = [(200, {"labels": ["Improdutivo", "Produtivo"]})]
+    assert AIClient().classify_email("Feliz aniversário!") == "Improdutivo"
+    assert AIClient().classify_email("Feliz aniversário!") == "Improdutivo"
+    assert hf_server.paths == ["/acme/missing", "/acme/missing"]
+    stats = client_mod.llm_cache_stats()
+    assert (stats["hits"], stats["misses"]) == (3, 2)
+    # a different prompt is a different key
+    client.generate_response({}, {}, category="Improdutivo", original_text="Preciso do relatório.")
+    assert len(hf_server.paths) == 3
+
+
+def test_failures_are_not_cached(hf_server):
+    hf_server.responses["/acme/missing"] = [(500, {"error": "boom"}), (200, [{"generated_text": "Ok!"}])]
+    hf_server.responses["/meta-llama/Llama-3.1-8B-Instruct"] = [(500, {"error": "boom"})]
+    hf_server.responses["/meta-llama/Llama-3.1-70B-Instruct"] = [(500, {"error": "boom"})]
+    canned = AIClient().generate_response({}, {}, category="Produtivo", original_text="Pode confirmar?")
+    assert canned.startswith("Obrigado pelo contato")
+    assert AIClient().generate_response({}, {}, category="Produtivo", original_text="Pode confirmar?") == "Ok!"
+
+
+def test_sqlite_backend_is_shared_and_survives_restarts(hf_server, tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    client_mod.configure_llm_cache(path=path)
+    hf_server.responses["/acme/missing"] = [(200, [{"generated_text": "Resposta pronta."}])]
+    AIClient().generate_response({}, {}, category="Produtivo", original_text="Preciso do relatório.")
+    # a new process (or another worker) starts with an empty memory tier
+    client_mod.configure_llm_cache(path=path)
+    hf_server.responses["/acme/missing"] = [(200, [{"generated_text": "Outra resposta."}])]
+    reply = AIClient().generate_response({}, {}, category="Produtivo", original_text="Preciso do relatório.")
+    assert reply == "Resposta pronta."
+    assert len(hf_server.paths) == 1
+    assert client_mod.llm_cache_stats()["shared"]["hits"] == 1
+
+
+def test_dead_model_is_skipped_on_later_requests(hf_server):
+    hf_server.responses["/meta-llama/Llama-3.1-8B-Instruct"] = [(200, [{"generated_text": "Resposta pronta."}])]
+    client = AIClient()
+    client.generate_response({}, {}, category="Produtivo", original_text="Preciso do relatório.")
+    client.generate_response({}, {}, category="Produtivo", original_text="Pode confirmar?")
+    # the 404 opened acme/missing's breaker: the second request goes straight to the live model
+    assert hf_server.paths == ["/acme/missing", "/meta-llama/Llama-3.1-8B-Instruct", "/meta-llama/Llama-3.1-8B-Instruct"]
+    assert health.health_stats()["acme/missing"]["state"] == "open"
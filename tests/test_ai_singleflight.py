@@ -0,0 +1,162 @@
+import json
+import multiprocessing
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai import session as session_mod
+from app.ai import singleflight
+from app.ai.client import AIClient
+from app.ai.singleflight import SingleFlight
+from app.utils import metrics
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.calls += 1
+        time.sleep(0.4)
+        data = json.dumps([{"generated_text": "Recebido, obrigado."}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def hf_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowHandler)
+    server.calls, server.lock = 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("HF_MODEL", "acme/model")
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)
+    monkeypatch.setattr(singleflight, "_flight", None)
+    monkeypatch.setattr(singleflight, "_flight_configured", False)
+    monkeypatch.setattr(metrics, "_registry", metrics._registry)
+    metrics.configure_metrics()
+    session_mod.reset_session()
+    yield server
+    session_mod.reset_session()
+    server.shutdown()
+    server.server_close()
+
+
+def _burst(n, fn):
+    barrier = threading.Barrier(n)
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(fn())
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results
+
+
+def test_burst_of_identical_requests_makes_one_upstream_call(hf_server):
+    client = AIClient()
+    replies = _burst(8, lambda: client.generate_response({}, {}, category="Produtivo", original_text="Matrícula confirmada."))
+    assert replies == ["Recebido, obrigado."] * 8
+    assert hf_server.calls == 1
+    assert 'automail_llm_requests_total{op="generate",model="acme/model",outcome="coalesced"} 7' in metrics.render()
+    # once the leader is done the key is free again: no stale sharing
+    client.generate_response({}, {}, category="Produtivo", original_text="Matrícula confirmada.")
+    assert hf_server.calls == 2
+
+
+def test_different_prompts_are_not_coalesced(hf_server):
+    texts = iter(f"Pedido {i}" for i in range(4))
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            text = next(texts)
+        return AIClient().generate_response({}, {}, category="Produtivo", original_text=text)
+
+    _burst(4, call)
+    assert hf_server.calls == 4
+
+
+def test_leader_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def boom():
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", boom)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join(5)
+    assert errors == ["upstream down"] * 4
+    assert flight.in_flight() == 0
+
+
+def _worker(results, go):
+    go.wait(10)
+    results.put(AIClient().generate_response({}, {}, category="Produtivo", original_text="Matrícula confirmada."))
+
+
+def test_workers_share_one_call_through_lock_files_and_the_shared_cache(hf_server, tmp_path):
+    client_mod.configure_llm_cache(path=str(tmp_path / "llm.sqlite"))
+    singleflight.configure_singleflight(lock_dir=str(tmp_path / "locks"))
+    ctx = multiprocessing.get_context("fork")
+    results, go = ctx.Queue(), ctx.Event()
+    workers = [ctx.Process(target=_worker, args=(results, go)) for _ in range(3)]
+    for w in workers:
+        w.start()
+    go.set()
+    replies = [results.get(timeout=20) for _ in workers]
+    for w in workers:
+        w.join(10)
+    assert replies == ["Recebido, obrigado."] * 3
+    assert hf_server.calls == 1
+
+
+def test_follower_stops_waiting_at_its_deadline():
+    from concurrent.futures import TimeoutError as FutureTimeout
+
+    flight, release = SingleFlight(), threading.Event()
+    leader = threading.Thread(target=flight.do, args=("k", lambda: release.wait(5) and "done"))
+    leader.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    with pytest.raises(FutureTimeout):
+        flight.do("k", lambda: "never", timeout=0.1)
+    assert time.monotonic() - started < 1
+    release.set()
+    leader.join()
+    assert flight.do("k", lambda: "again") == ("again", False)
@@ -0,0 +1,44 @@
+from app.nlp.classifier import classify_batch, classify_text_result
+
+SAMPLES = [
+    "",
+    "   ",
+    "Por favor, envie o relatório até amanhã.",
+    "Feliz aniversário! Tudo de bom.",
+    "Hi, can you update the status of the ticket?",
+    "Bom dia! Poderia revisar o anexo e confirmar a reunião dia 12 às 15h?",
+    "Ler mais\nVoto positivo\nComentar\nLer mais",
+    "visit http://a.com and www.b.com now",
+    "Clique aqui para acessar https://x.com/pedido e confirme",
+    "Obrigado, atenciosamente",
+    "batata frita javascript",
+    "!!! ??? ...",
+]
+
+
+def test_classify_batch_matches_single_text_results():
+    assert classify_batch(SAMPLES) == [classify_text_result(t) for t in SAMPLES]
+
+
+def test_classify_batch_respects_ml_threshold():
+    single = [classify_text_result(t, ml_threshold=0.0) for t in SAMPLES]
+    assert classify_batch(SAMPLES, ml_threshold=0.0) == single
+    assert classify_batch([]) == []
+
+
+def test_classify_batch_sends_low_confidence_items_to_ml_together(monkeypatch):
+    from app.nlp import classifier
+
+    calls = []
+
+    def fake_batch(texts):
+        calls.append(list(texts))
+        return [("Produtivo", 0.91)] * len(texts)
+
+    monkeypatch.setattr(classifier, "_try_ml_classify_batch", fake_batch)
+    results = classify_batch(SAMPLES, ml_threshold=1.01)
+    # one model call for every item that reached the ML fallback
+    assert len(calls) == 1
+    ml_rows = [r for r in results if r.used_ml]
+    assert len(calls[0]) == len(ml_rows) > 1
+    assert all(r.reason == "ml_fallback" and r.confidence == 0.91 for r in ml_rows)
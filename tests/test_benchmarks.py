@@ -0,0 +1,30 @@
+from benchmarks import run as bench
+from benchmarks.corpus import HUGE_CHARS, KINDS, generate
+
+
+def test_corpus_is_reproducible():
+    for kind in KINDS[:-1]:
+        assert generate(kind, 20, seed=3) == generate(kind, 20, seed=3)
+        assert generate(kind, 20, seed=3) != generate(kind, 20, seed=4)
+    # more texts of a kind extend the sequence instead of reshuffling it
+    assert generate("typical", 30)[:10] == generate("typical", 10)
+    huge = generate("huge", 1)[0]
+    assert len(huge) == HUGE_CHARS
+
+
+def test_run_reports_throughput_and_latency():
+    results = bench.run(kinds=["short"], min_time=0.0, min_calls=3, repeat=1,
+                        keys={"classify_text/short", "stage.score_text/short"})
+    assert set(results["results"]) == {"classify_text/short", "stage.score_text/short"}
+    for res in results["results"].values():
+        assert res["calls"] == 3
+        assert res["ops"] > 0 and res["norm_ops"] > 0
+        assert 0 < res["p50_us"] <= res["p99_us"]
+
+
+def test_compare_flags_only_drops_beyond_threshold():
+    baseline = {"results": {"a/short": {"norm_ops": 100.0}, "b/short": {"norm_ops": 100.0}}}
+    current = {"results": {"a/short": {"norm_ops": 80.0}, "b/short": {"norm_ops": 70.0},
+                           "new/short": {"norm_ops": 1.0}}}
+    assert bench.compare(current, baseline, threshold=0.25) == [("b/short", 100.0, 70.0)]
+    assert bench.compare(current, baseline, threshold=0.35) == []
@@ -0,0 +1,47 @@
+import random
+import re
+
+from app.nlp import charstats
+
+ALLOWED = frozenset(".,:;()-\"'<>@/\\\n\r\t")
+GARBLED_TOKEN_RE = re.compile(r"[a-zA-Zçáéíóúâêîôûãõàèìòù]+")
+VOWELS = frozenset("aeiouáéíóúâêîôûãõàèìòù")
+CLUSTER_RE = re.compile(r"[bcdfghjklmnpqrstvwxyz]{4,}", re.IGNORECASE)
+
+
+def _reference_spam(t):
+    # the per-character loops the spam filter used before
+    tokens = re.findall(r"\w+", t)
+    symbols = sum(1 for c in t if not c.isalnum() and c not in ALLOWED and not c.isspace())
+    return (len(t), symbols, len(tokens), sum(1 for w in tokens if len(w) <= 2))
+
+
+def _reference_garble(t):
+    tokens = GARBLED_TOKEN_RE.findall(t)
+    garbled = 0
+    for w in tokens:
+        if sum(1 for ch in w if ch in VOWELS) / max(1, len(w)) < 0.35:
+            garbled += 1
+        elif CLUSTER_RE.search(w) and len(w) >= 5:
+            garbled += 1
+    return (len(tokens), garbled)
+
+
+def _random_texts(n, seed=0):
+    rnd = random.Random(seed)
+    pool = list("abcdefghijklmnopqrstuvwxyzçáéíóúãõñüK_ 0123456789!?.,;:@#$%&*()[]{}\n\t") + \
+        ["K", "ſ", "😀", "𝔘", "\u0301", "²", "Ⅰ", "ß"]
+    return ["".join(rnd.choice(pool) for _ in range(rnd.randint(0, 60))) for _ in range(n)]
+
+
+def test_stats_match_per_character_reference():
+    for t in _random_texts(3000):
+        assert tuple(charstats.spam_stats(t)) == _reference_spam(t), t
+        assert tuple(charstats.garble_stats(t)) == _reference_garble(t), t
+
+
+def test_batch_stats_match_single_text_stats():
+    texts = _random_texts(300, seed=1) + ["", "sdfghjk qwrtp", "ok ok ok"]
+    assert charstats.spam_stats_batch(texts) == [charstats.spam_stats(t) for t in texts]
+    assert charstats.garble_stats_batch(texts) == [charstats.garble_stats(t) for t in texts]
+    assert charstats.spam_stats_batch([]) == []
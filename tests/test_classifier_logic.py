@@ -19,3 +19,28 @@ def test_classify_confidence_and_ml_flag():
     assert label in ("Produtivo", "Improdutivo")
     assert 0.0 <= conf <= 1.0
     assert isinstance(used_ml, bool)
+
+
+def test_classify_text_result_matches_tuple_api():
+    import app.nlp.classifier as classifier
+    txt = "Por favor, confirme a reunião amanhã às 15h."
+    result = classifier.classify_text_result(txt)
+    assert result.as_tuple() == classify_text_with_confidence(txt)
+    assert result.reason == classifier.get_last_decision_reason()
+    assert result.details.get("action_verb")
+    assert "score-panel" in result.render_html()
+
+
+def test_classify_route_scores_once(client, monkeypatch):
+    import app.nlp.classifier as classifier
+    calls = []
+    real = classifier._score_text
+
+    def counting(doc):
+        calls.append(doc)
+        return real(doc)
+
+    monkeypatch.setattr(classifier, "_score_text", counting)
+    resp = client.post('/classify', data={'text': 'Por favor, envie o relatório até amanhã.'})
+    assert resp.status_code == 200
+    assert len(calls) == 1
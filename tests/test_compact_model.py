@@ -0,0 +1,46 @@
+import numpy as np
+
+import app.nlp.classifier as classifier
+from app.nlp.classifier import EmailClassifier, convert_model_to_compact
+from app.nlp.compact_model import CompactNBModel
+
+EMAILS = [
+    "Por favor envie o relatório até amanhã",
+    "Preciso que revise o contrato anexo",
+    "Poderia confirmar a reunião de segunda?",
+    "Feliz aniversário, tudo de bom",
+    "Obrigado pela mensagem, abraços",
+    "Parabéns pelo resultado, boa sorte",
+]
+LABELS = ["Produtivo", "Produtivo", "Produtivo", "Improdutivo", "Improdutivo", "Improdutivo"]
+
+
+def _trained() -> EmailClassifier:
+    clf = EmailClassifier()
+    clf.train(EMAILS, LABELS)
+    return clf
+
+
+def test_compact_model_matches_sklearn(tmp_path):
+    clf = _trained()
+    pkl = str(tmp_path / "model.pkl")
+    clf.save_model(pkl)
+    out = convert_model_to_compact(pkl, str(tmp_path / "model.compact"))
+    compact = CompactNBModel(out)
+    assert isinstance(compact.vocab, np.memmap)
+
+    probe = EMAILS + ["envie o anexo por favor", "tudo de bom e abraços", "palavras totalmente novas", ""]
+    assert compact.predict(probe) == [clf.classify(t) for t in probe]
+    expected = clf.classifier.predict_proba(clf.vectorizer.transform(probe))
+    assert np.allclose(compact.predict_proba(probe), expected, atol=1e-5)
+
+
+def test_loader_prefers_compact_model(tmp_path, monkeypatch):
+    out = str(tmp_path / "model.compact")
+    _trained().save_compact(out)
+    monkeypatch.setattr(classifier, "COMPACT_MODEL_PATH", out)
+    monkeypatch.setattr(classifier, "_ml_clf", None)
+    monkeypatch.setenv("LOAD_MODEL", "1")
+    classifier._load_ml_model_if_requested()
+    assert isinstance(classifier._ml_clf, CompactNBModel)
+    assert classifier._try_ml_classify("Por favor envie o relatório")[0] == "Produtivo"
@@ -9,9 +9,9 @@ def _fake_score_text(t: str) -> Tuple[float, float, Dict[str, Any]]:
 def _fake_looks_spammy(t: str) -> bool:
     return False
 
-def fake_ml(t: str) -> str:
-    # return a label string consistent with classifier expectation
-    return "Improdutivo"
+def fake_ml(t: str) -> Tuple[str, float]:
+    # (label, probability) as returned by the ML fallback
+    return ("Improdutivo", 0.82)
 
 
 def test_high_confidence_heuristic():
@@ -52,4 +52,5 @@ def test_low_confidence_ml_fallback(monkeypatch: pytest.MonkeyPatch):
     label, conf, used_ml = classify_text_with_confidence(text)
     assert used_ml is True
     assert label == "Improdutivo"
-    assert conf >= 0.75
+    # confidence comes from the model probability, not a fixed floor
+    assert conf == 0.82
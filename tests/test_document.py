@@ -0,0 +1,42 @@
+import app.nlp.classifier as classifier
+from app.nlp.document import AnalyzedDocument, as_document
+
+
+TEXT = "Por favor, revise o anexo.\nPoderia confirmar a reunião amanhã às 15h? http://exemplo.com/pedido"
+
+
+def test_stages_accept_documents_and_strings_alike():
+    doc = AnalyzedDocument(TEXT)
+    assert classifier._score_text(doc) == classifier._score_text(TEXT)
+    assert classifier._looks_spammy(doc) == classifier._looks_spammy(TEXT)
+    assert classifier._looks_like_feed(doc) == classifier._looks_like_feed(TEXT)
+    assert classifier._keyword_fallback(doc) == classifier._keyword_fallback(TEXT)
+
+
+def test_document_views_are_computed_once(monkeypatch):
+    calls = []
+    real = classifier._detect_actionable
+
+    def counting(doc):
+        calls.append(doc)
+        return real(doc)
+
+    monkeypatch.setattr(classifier, "_detect_actionable", counting)
+    doc = as_document(TEXT)
+    assert as_document(doc) is doc
+    assert doc.tokens is doc.tokens
+    assert classifier._contains_actionable_elements(doc) is True
+    assert classifier._contains_actionable_elements(doc) is True
+    assert len(calls) == 1
+
+
+def test_iter_windows_covers_text_and_cuts_at_newlines():
+    from app.nlp.document import iter_windows
+
+    text = "\n".join(f"linha {i} com algumas palavras" for i in range(500))
+    windows = list(iter_windows(text, 1000))
+    assert "".join(chunk for _, chunk in windows) == text
+    assert all(chunk.endswith("\n") for _, chunk in windows[:-1])
+    assert all(len(chunk) <= 1000 for _, chunk in windows)
+    limited = "".join(chunk for _, chunk in iter_windows(text, 1000, limit=2500))
+    assert text.startswith(limited) and len(limited) <= 2500
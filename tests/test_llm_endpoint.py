@@ -25,7 +25,10 @@ def test_llm_endpoint_success_with_mocked_llm(monkeypatch):
     import importlib
     routes_mod = importlib.import_module('app.routes')
 
-    def fake_generate_response(category, text):
+    deadlines = []
+
+    def fake_generate_response(category, text, deadline=None):
+        deadlines.append(deadline)
         return "Assistant reply: classified as Produtivo"
 
     monkeypatch.setattr(routes_mod, "generate_response", fake_generate_response, raising=False)
@@ -36,6 +39,8 @@ def test_llm_endpoint_success_with_mocked_llm(monkeypatch):
     data = resp.get_json()
     assert data.get("llm_used") is True
     assert "Assistant reply" in data.get("llm_reply", "")
+    # the route hands its LLM_DEADLINE budget down to the client
+    assert deadlines[0].budget == app.config["LLM_DEADLINE"]
 
 
 def test_llm_endpoint_bad_request_no_text(monkeypatch):
@@ -46,7 +51,7 @@ def test_llm_endpoint_bad_request_no_text(monkeypatch):
 
     import importlib
     routes_mod = importlib.import_module('app.routes')
-    monkeypatch.setattr(routes_mod, "generate_response", lambda c, t: "x", raising=False)
+    monkeypatch.setattr(routes_mod, "generate_response", lambda c, t, deadline=None: "x", raising=False)
 
     client = app.test_client()
     resp = client.post("/classify-llm", json={})
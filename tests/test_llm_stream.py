@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai import session as session_mod
+from app.ai.client import AIClient
+from app.main import create_app
+from app.utils import metrics
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        server = self.server
+        server.paths.append(self.path)
+        model = server.models.get(self.path)
+        if model is None:
+            body = b'{"error": "not found"}'
+            self.send_response(404)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        kind, tokens = model
+        assert request.get("stream") is True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if kind != "json" else "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if kind == "json":
+            self._chunk(json.dumps([{"generated_text": "".join(tokens)}]).encode())
+        for i, token in enumerate(tokens if kind != "json" else []):
+            if token is None:
+                self._chunk(b'data: {"error": "overloaded"}\n\n')
+                break
+            if kind == "tgi":
+                event = {"token": {"text": token, "special": False}, "generated_text": None}
+            else:
+                event = {"choices": [{"delta": {"content": token}}]}
+            self._chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+            if i == 0:
+                server.first_sent.set()
+                server.release.wait(5)  # hold the rest until the test has read the first token
+        else:
+            if kind == "openai":
+                self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stream_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StreamHandler)
+    server.paths, server.models = [], {}
+    server.first_sent, server.release = threading.Event(), threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("HF_MODEL", "acme/missing")
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)
+    monkeypatch.setattr(metrics, "_registry", metrics._registry)
+    metrics.configure_metrics()
+    session_mod.reset_session()
+    yield server
+    server.release.set()
+    session_mod.reset_session()
+    server.shutdown()
+    server.server_close()
+
+
+def test_tokens_are_forwarded_as_they_arrive(stream_server):
+    stream_server.models["/meta-llama/Llama-3.1-8B-Instruct"] = ("tgi", ["Olá", ", recebido", "."])
+    chunks = AIClient().stream_response("Produtivo", "Preciso do relatório.")
+    # the first token reaches us while the backend is still holding the rest of the reply
+    assert next(chunks) == "Olá"
+    assert stream_server.first_sent.is_set() and not stream_server.release.is_set()
+    stream_server.release.set()
+    assert list(chunks) == [", recebido", "."]
+    assert stream_server.paths == ["/acme/missing", "/meta-llama/Llama-3.1-8B-Instruct"]
+    out = metrics.render()
+    assert 'automail_llm_ttft_seconds_count{model="meta-llama/Llama-3.1-8B-Instruct"} 1' in out
+
+
+def test_openai_style_and_non_streaming_backends(stream_server):
+    stream_server.release.set()
+    stream_server.models["/acme/missing"] = ("openai", ["Certo", "!"])
+    assert "".join(AIClient().stream_response("Produtivo", "Pode confirmar?")) == "Certo!"
+    stream_server.models["/acme/missing"] = ("json", ["Resposta", " inteira."])
+    assert list(AIClient().stream_response("Produtivo", "Outra mensagem")) == ["Resposta inteira."]
+
+
+def test_failure_after_first_token_does_not_switch_models(stream_server):
+    stream_server.release.set()
+    stream_server.models["/acme/missing"] = ("tgi", ["Começo", None])
+    stream_server.models["/meta-llama/Llama-3.1-8B-Instruct"] = ("tgi", ["Outra"])
+    assert list(AIClient().stream_response("Produtivo", "Preciso do relatório.")) == ["Começo"]
+    assert stream_server.paths == ["/acme/missing"]
+
+
+def test_stream_route_forwards_backend_chunks(stream_server, monkeypatch):
+    stream_server.release.set()
+    stream_server.models["/acme/missing"] = ("tgi", ["Obrigado", " pelo", " aviso."])
+    monkeypatch.setitem(os.environ, "APP_CONFIG", "testing")
+    app = create_app()
+    app.config["ENABLE_LLM"] = True
+    app.config["ALLOW_UI_LLM_TOGGLE"] = True
+    resp = app.test_client().post("/classify-llm-stream", json={"text": "Por favor, envie o relatório."}, buffered=False)
+    assert resp.status_code == 200
+    assert resp.headers["X-Accel-Buffering"] == "no"
+    assert list(resp.response) == [b"Obrigado", b" pelo", b" aviso."]
+
+
+def test_stream_opened_after_the_attempt_timed_out_is_closed(stream_server, monkeypatch):
+    stream_server.release.set()
+    stream_server.models["/meta-llama/Llama-3.1-8B-Instruct"] = ("tgi", ["Seguimos", "."])
+    monkeypatch.setenv("HF_TIMEOUT", "0.2")
+    opened, closed = threading.Event(), threading.Event()
+    real_open = AIClient._hf_open_stream
+
+    class _LateResponse:
+        status_code = 200
+
+        def close(self):
+            closed.set()
+
+    def slow_open(self, model_name, *args):
+        if model_name != "acme/missing":
+            return real_open(self, model_name, *args)
+        opened.wait(5)  # still connecting when the attempt gives up on it
+        return _LateResponse()
+
+    monkeypatch.setattr(AIClient, "_hf_open_stream", slow_open)
+    assert list(AIClient().stream_response("Produtivo", "Preciso do relatório.")) == ["Seguimos", "."]
+    assert not closed.is_set()
+    opened.set()
+    assert closed.wait(2)
+
+
+def test_module_helpers_read_the_hf_config_on_every_call(stream_server, monkeypatch):
+    stream_server.release.set()
+    stream_server.models["/acme/first"] = ("tgi", ["Um"])
+    stream_server.models["/acme/second"] = ("tgi", ["Dois"])
+    monkeypatch.setenv("HF_MODEL", "acme/first")
+    assert list(client_mod.stream_response("Produtivo", "Preciso do relatório.")) == ["Um"]
+    monkeypatch.setenv("HF_MODEL", "acme/second")
+    assert list(client_mod.stream_response("Produtivo", "Preciso do relatório.")) == ["Dois"]
+    assert stream_server.paths == ["/acme/first", "/acme/second"]
+
+
+def test_unused_fallback_keeps_its_probe(stream_server):
+    stream_server.release.set()
+    stream_server.models["/acme/missing"] = ("tgi", ["Pronto"])
+    clock = [1000.0]
+    tracker = health.configure_health(failures=1, cooldown=10, clock=lambda: clock[0])
+    tracker.record("meta-llama/Llama-3.1-8B-Instruct", ok=False)
+    clock[0] += 11
+    assert list(AIClient().stream_response("Produtivo", "Preciso do relatório.")) == ["Pronto"]
+    assert tracker.snapshot()["meta-llama/Llama-3.1-8B-Instruct"]["state"] == "open"
+    assert tracker.allow("meta-llama/Llama-3.1-8B-Instruct")
@@ -0,0 +1,83 @@
+import app.nlp.classifier as classifier
+
+PARAGRAPHS = [
+    "Bom dia equipe, segue o resumo da reunião de ontem sobre o projeto.",
+    "Por favor, revisem o relatório e confirmem o prazo até sexta.",
+    "Obrigado a todos, abraços e boa sorte.",
+    "O cronograma do trimestre continua o mesmo e não há pendências novas.",
+]
+
+
+def _long_text(n: int = 300) -> str:
+    # long lines, so the head window doesn't look like a feed of short headlines
+    return "\n".join(" ".join(PARAGRAPHS) for _ in range(n))
+
+
+def _uncapped(monkeypatch):
+    monkeypatch.setattr(classifier, "MAX_SCORED_CHARS", 0)
+    monkeypatch.setattr(classifier, "MAX_SCORING_CPU_MS", 0)
+
+
+def test_windowed_scores_match_whole_text_scoring(monkeypatch):
+    _uncapped(monkeypatch)
+    text = _long_text()
+    assert classifier._is_long(text)
+    ws = classifier._score_windows(text, classifier._get_rules())
+    prod, imp, details = classifier._score_text(text)
+    assert (ws.prod_score, ws.imp_score, ws.details) == (prod, imp, details)
+    assert (ws.decision, ws.reason) == classifier._apply_overrides(prod, imp, details, text)
+    assert ws.stop == "" and ws.scored_chars == len(text)
+
+
+def test_actionable_element_stops_scoring_early(monkeypatch):
+    _uncapped(monkeypatch)
+    text = "Acesse https://exemplo.com/pedido para confirmar.\n" + _long_text()
+    result = classifier.classify_text_result(text, ml_threshold=0.0)
+    assert result.decision == "Produtivo"
+    assert result.reason == "contains_action:early_exit"
+    assert result.prod_score < classifier._score_text(text)[0]
+
+
+def test_character_and_cpu_caps_truncate(monkeypatch):
+    text = _long_text(1000)
+    monkeypatch.setattr(classifier, "MAX_SCORING_CPU_MS", 0)
+    monkeypatch.setattr(classifier, "MAX_SCORED_CHARS", 30000)
+    ws = classifier._score_windows(text, classifier._get_rules())
+    assert ws.stop == "truncated" and ws.scored_chars <= 30000
+
+    monkeypatch.setattr(classifier, "MAX_SCORED_CHARS", 0)
+    monkeypatch.setattr(classifier, "MAX_SCORING_CPU_MS", 1e-6)
+    result = classifier.classify_text_result(text, ml_threshold=0.0)
+    assert result.reason.endswith(":truncated")
+
+
+def test_low_confidence_long_text_still_needs_review(monkeypatch):
+    monkeypatch.setattr(classifier, "_try_ml_classify", lambda t: None)
+    monkeypatch.setattr(classifier, "MAX_SCORED_CHARS", 30000)
+    result = classifier.classify_text_result(_long_text(1000), ml_threshold=1.01)
+    assert result.reason == "needs_human_review:truncated"
+    assert result.needs_review
+
+
+def test_no_early_exit_while_the_rest_can_cross_the_review_threshold(monkeypatch):
+    _uncapped(monkeypatch)
+    chatter = "Obrigado a todos, abraços e boa sorte. Feliz aniversário e parabéns pelo resultado do time. " * 3
+    text = "Acesse https://exemplo.com/pedido.\n" + "\n".join([chatter] * 400)
+    # the signal boost alone (work context only) stays below 0.45: the whole text is read
+    ws = classifier._score_windows(text, classifier._get_rules(), ml_threshold=0.45)
+    assert ws.stop == "" and ws.scored_chars == len(text)
+    assert classifier._score_windows(text, classifier._get_rules()).stop == "early_exit"
+
+
+def test_classify_text_scores_long_text_in_bounded_windows(monkeypatch):
+    monkeypatch.setattr(classifier, "MAX_SCORING_CPU_MS", 0)
+    monkeypatch.setattr(classifier, "MAX_SCORED_CHARS", 30000)
+    monkeypatch.setattr(classifier, "_score_text", lambda doc: (_ for _ in ()).throw(AssertionError("whole text scored")))
+    assert classifier.classify_email(_long_text(1000)) == "Produtivo"
+    assert classifier.get_last_decision_reason().endswith(":truncated")
+
+
+def test_missing_text_is_still_improdutivo():
+    assert classifier.classify_text(None) == "Improdutivo"
+    assert classifier.classify_email(None) == "Improdutivo"
+    assert classifier.classify_text("   ") == "Improdutivo"
@@ -0,0 +1,52 @@
+import re
+
+import app.nlp.classifier as classifier
+from app.nlp.matcher import KeywordMatcher, normalize_for_matching
+
+
+def _naive_counts(text: str):
+    # reference implementation: the original per-keyword loops
+    t_norm = normalize_for_matching(text)
+    tokens = re.findall(r"\w+", t_norm)
+    action = sum(1 for stem in classifier.ACTION_VERBS for tok in tokens if stem in tok)
+
+    def kw(keywords):
+        total = 0
+        for k in keywords:
+            kk = normalize_for_matching(k)
+            if " " in kk:
+                total += 1 if kk in t_norm else 0
+            else:
+                total += tokens.count(kk)
+        return total
+
+    return action, kw(classifier._COMBINED_PRODUCTIVE_KEYWORDS), kw(classifier._COMBINED_UNPRODUCTIVE_KEYWORDS)
+
+
+def test_matcher_counts_match_naive_loops():
+    samples = [
+        "Por favor, atualize o status do ticket e envie o relatório até amanhã.",
+        "Bom dia! Boa tarde, follow-up da reunião. Obrigado, atenciosamente. Thanks thanks",
+        "Minhas matrículas: confirme a inscrição; revisão e aprovação pendentes.",
+        "",
+    ]
+    matcher = classifier._get_matcher()
+    for text in samples:
+        t_norm = normalize_for_matching(text)
+        counts = matcher.count(t_norm, re.findall(r"\w+", t_norm))
+        assert tuple(counts) == _naive_counts(text)
+
+
+def test_matcher_keeps_multiplicity_of_colliding_keywords():
+    m = KeywordMatcher({"reunião", "reuniao", "bom dia"}, set(), set())
+    counts = m.count("reuniao bom dia reuniao", ["reuniao", "bom", "dia", "reuniao"])
+    assert counts.productive == 5
+
+
+def test_matcher_rebuilds_when_rules_change(monkeypatch):
+    before = classifier._get_matcher()
+    monkeypatch.setattr(classifier, "ACTION_VERBS", classifier.ACTION_VERBS | {"batata"})
+    after = classifier._get_matcher()
+    assert after is not before
+    assert after.fingerprint != before.fingerprint
+    assert classifier._score_text("batata frita")[2].get("action_verb") == 1
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import app.nlp.classifier as classifier
+from app.utils import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # a private registry per test; the process-wide one is restored afterwards
+    monkeypatch.setattr(metrics, "_registry", metrics._registry)
+    return metrics.configure_metrics()
+
+
+def _value(text, series):
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_prometheus_text_format(registry):
+    metrics.observe_stage("score_text", 0.0003)
+    metrics.observe_stage("score_text", 2.0)
+    metrics.count_decision("keyword_fallback (12 tokens)")
+    metrics.count_decision("needs_human_review:truncated")
+    metrics.count_llm_request("classify", 'org/"model"', "timeout")
+    out = metrics.render()
+    assert "# TYPE automail_stage_seconds histogram" in out
+    assert _value(out, 'automail_stage_seconds_bucket{stage="score_text",le="0.00025"}') == 0
+    assert _value(out, 'automail_stage_seconds_bucket{stage="score_text",le="0.0005"}') == 1
+    assert _value(out, 'automail_stage_seconds_bucket{stage="score_text",le="+Inf"}') == 2
+    assert _value(out, 'automail_stage_seconds_count{stage="score_text"}') == 2
+    assert _value(out, 'automail_decisions_total{reason="keyword_fallback"}') == 1
+    assert _value(out, 'automail_decisions_total{reason="needs_human_review"}') == 1
+    assert _value(out, 'automail_llm_requests_total{op="classify",model="org/\\"model\\"",outcome="timeout"}') == 1
+
+
+def test_classifier_records_stages_decisions_and_ml_fallback(registry, monkeypatch):
+    monkeypatch.setattr(classifier, "_ml_clf", None)
+    monkeypatch.setattr(classifier, "_result_cache", None)
+    monkeypatch.setattr(classifier, "_result_cache_configured", True)
+    classifier.classify_text_result("Por favor, envie o relatório até amanhã.")
+    classifier.classify_text_result("oi kkk testando", ml_threshold=1.01)
+    classifier.classify_batch(["Ler mais\nVoto positivo\nComentar\nLer mais", "Feliz aniversário!"])
+    out = metrics.render()
+    for stage in ("hard_filter", "score_text", "apply_overrides"):
+        assert _value(out, f'automail_stage_seconds_count{{stage="{stage}"}}') >= 1
+    reasons = [line for line in out.splitlines() if line.startswith("automail_decisions_total{")]
+    assert sum(float(line.rsplit(" ", 1)[1]) for line in reasons) == 4
+    assert _value(out, 'automail_decisions_total{reason="hard_filter_spam_or_garbled_or_feed"}') == 1
+    assert _value(out, 'automail_ml_fallback_total{outcome="unavailable"}') >= 1
+
+
+def _worker(directory, n, done):
+    metrics.configure_metrics(directory)
+    for _ in range(n):
+        metrics.count_decision("score_majority")
+    metrics.observe_stage("score_text", 0.001)
+    metrics.get_registry().flush()
+    if done is not None:
+        done.wait(10)
+
+
+def test_values_are_summed_across_worker_processes(registry, tmp_path):
+    directory = str(tmp_path / "metrics")
+    ctx = multiprocessing.get_context("fork")
+    done = ctx.Event()
+    live = ctx.Process(target=_worker, args=(directory, 3, done))
+    exited = ctx.Process(target=_worker, args=(directory, 5, None))
+    live.start()
+    exited.start()
+    exited.join(10)
+
+    mine = metrics.configure_metrics(directory)
+    metrics.count_decision("score_majority")
+    try:
+        # wait until the live worker has written its snapshot
+        for _ in range(200):
+            out = mine.render()
+            if _value(out, 'automail_decisions_total{reason="score_majority"}') == 9:
+                break
+            time.sleep(0.05)
+        assert _value(out, 'automail_decisions_total{reason="score_majority"}') == 9
+        assert _value(out, 'automail_stage_seconds_count{stage="score_text"}') == 2
+    finally:
+        done.set()
+        live.join(10)
+    # exited workers are folded into the archive: totals never go backwards
+    out = mine.render()
+    assert _value(out, 'automail_decisions_total{reason="score_majority"}') == 9
+    assert {p.name for p in (tmp_path / "metrics").glob("metrics_*.json")} == {
+        "metrics_archive.json", f"metrics_{os.getpid()}.json"}
+
+
+def test_metrics_route(client, registry):
+    client.post("/classify", data={"text": "Por favor, envie o relatório até amanhã."})
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+    body = resp.get_data(as_text=True)
+    assert "# TYPE automail_decisions_total counter" in body
+    assert _value(body, 'automail_stage_seconds_count{stage="sanitize"}') == 1
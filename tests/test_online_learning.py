@@ -0,0 +1,79 @@
+import importlib
+
+import app.nlp.classifier as classifier
+from app.nlp import online
+from app.nlp.online import FeedbackStore, OnlineEmailClassifier, OnlineLearner
+
+PRODUCTIVE = ["Por favor envie o relatório", "Preciso que revise o contrato", "Confirme a reunião de amanhã"]
+UNPRODUCTIVE = ["Feliz aniversário, abraços", "Parabéns pelo resultado", "Obrigado e boa sorte"]
+
+
+def _learner(tmp_path, batch_size=2) -> OnlineLearner:
+    store = FeedbackStore(str(tmp_path / "feedback.sqlite"))
+    return OnlineLearner(store, str(tmp_path / "online.joblib"), batch_size=batch_size, n_features=2 ** 12)
+
+
+def test_partial_fit_learns_incrementally():
+    model = OnlineEmailClassifier(n_features=2 ** 12)
+    model.partial_fit(PRODUCTIVE[:1], ["Produtivo"])
+    model.partial_fit(UNPRODUCTIVE[:1], ["Improdutivo"])
+    model.partial_fit(PRODUCTIVE[1:] + UNPRODUCTIVE[1:], ["Produtivo"] * 2 + ["Improdutivo"] * 2)
+    assert model.n_seen == 6
+    assert model.classify("envie o relatório por favor") == "Produtivo"
+    assert model.classify("parabéns e abraços") == "Improdutivo"
+
+
+def test_learner_trains_in_batches_and_persists(tmp_path):
+    learner = _learner(tmp_path, batch_size=4)
+    for text in PRODUCTIVE[:2] + UNPRODUCTIVE[:1]:
+        label = "Produtivo" if text in PRODUCTIVE else "Improdutivo"
+        assert learner.record(text, label)["trained"] == 0
+    assert learner.record(UNPRODUCTIVE[1], "Improdutivo")["trained"] == 4
+    assert learner.store.stats() == {"total": 4, "pending": 0}
+
+    # a second learner (e.g. another worker) sees the saved model
+    other = _learner(tmp_path)
+    assert other.model.n_seen == 4
+    assert other.model.classify("revise o contrato") == "Produtivo"
+
+
+def test_failed_update_keeps_feedback_pending_and_live_model_untouched(tmp_path, monkeypatch):
+    learner = _learner(tmp_path, batch_size=2)
+    learner.record(PRODUCTIVE[0], "Produtivo")
+    live = learner.model
+
+    def broken_save(self, path):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(OnlineEmailClassifier, "save", broken_save)
+    assert learner.record(UNPRODUCTIVE[0], "Improdutivo")["trained"] == 0
+    assert learner.model is live and live.n_seen == 0
+    assert learner.store.pending_count() == 2
+
+    monkeypatch.undo()
+    assert learner.train_pending() == 2
+    assert learner.model is not live and learner.model.n_seen == 2
+    assert learner.store.stats() == {"total": 2, "pending": 0}
+
+
+def test_online_mode_uses_feedback_model(tmp_path, monkeypatch):
+    learner = _learner(tmp_path, batch_size=6)
+    for text in PRODUCTIVE:
+        learner.record(text, "Produtivo")
+    for text in UNPRODUCTIVE:
+        learner.record(text, "Improdutivo")
+    monkeypatch.setattr(online, "_learner", learner)
+    monkeypatch.setattr(classifier, "_ml_clf", None)
+    monkeypatch.setenv("LOAD_MODEL", "1")
+    monkeypatch.setenv("ML_MODE", "online")
+    assert classifier._try_ml_classify("parabéns, abraços")[0] == "Improdutivo"
+
+
+def test_feedback_endpoint(client, tmp_path, monkeypatch):
+    learner = _learner(tmp_path, batch_size=10)
+    monkeypatch.setattr(importlib.import_module("app.routes"), "get_learner", lambda: learner)
+    r = client.post("/feedback", json={"text": "Por favor revise", "label": "Produtivo", "predicted": "Improdutivo"})
+    assert r.status_code == 200
+    assert r.get_json()["stored"] is True
+    assert client.post("/feedback", json={"text": "x", "label": "talvez"}).status_code == 400
+    assert learner.store.stats()["pending"] == 1
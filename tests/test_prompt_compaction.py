@@ -0,0 +1,88 @@
+import os
+
+from app.ai import client as client_mod
+from app.ai import health
+from app.ai.client import AIClient, _classification_request
+from app.main import create_app
+from app.nlp.classifier import classify_email
+from app.nlp.compaction import compact_prompt, estimate_tokens, strip_boilerplate
+
+REPLY = """Oi Ana,
+
+Por favor, envie o relatório de vendas até sexta às 15h.
+
+Atenciosamente,
+Carlos Souza
+Gerente Comercial | ACME Ltda
+Enviado do meu iPhone
+
+Em seg., 3 de jun. de 2024 às 10:12, Ana Lima <ana@acme.com> escreveu:
+> Carlos, segue a planilha do mês passado.
+> Qualquer dúvida estou à disposição.
+"""
+
+FILLER = ("A equipe passou a semana revendo o layout das salas e comentando sobre o café novo da copa, "
+          "que foi bem recebido por quase todos. ")
+
+
+def test_quoted_thread_signature_and_boilerplate_are_dropped():
+    assert strip_boilerplate(REPLY) == "Oi Ana,\n\nPor favor, envie o relatório de vendas até sexta às 15h."
+    outlook = "Pode confirmar a reunião de amanhã?\n\nDe: Ana Lima\nEnviado: segunda-feira\nPara: Carlos\nAssunto: Reunião\n\nTexto antigo."
+    assert strip_boilerplate(outlook) == "Pode confirmar a reunião de amanhã?"
+    assert compact_prompt("Feliz aniversário!") == "Feliz aniversário!"
+
+
+def test_long_email_keeps_the_informative_sentences_within_budget():
+    text = "Olá equipe. " + FILLER * 12 + "Por favor, revisem e confirmem o contrato até amanhã às 10h. " + FILLER * 12
+    compacted = compact_prompt(text, budget=64)
+    assert estimate_tokens(compacted) <= 64
+    assert compacted.startswith("Olá equipe.")
+    assert "Por favor, revisem e confirmem o contrato até amanhã às 10h." in compacted
+    # the decision is unchanged on the much shorter prompt
+    assert classify_email(compacted) == classify_email(text) == "Produtivo"
+
+
+def test_budget_zero_disables_compaction(monkeypatch):
+    monkeypatch.setenv("LLM_PROMPT_TOKENS", "0")
+    assert compact_prompt(REPLY) == REPLY
+    assert _classification_request(REPLY, "facebook/bart-large-mnli")["inputs"]["text"].startswith("Oi Ana,")
+
+
+def test_llm_routes_and_classification_payload_use_compacted_text(monkeypatch):
+    monkeypatch.setitem(os.environ, "APP_CONFIG", "testing")
+    app = create_app()
+    app.config["ENABLE_LLM"] = True
+    app.config["ALLOW_UI_LLM_TOGGLE"] = True
+    import importlib
+    routes_mod = importlib.import_module("app.routes")
+
+    sent = []
+    monkeypatch.setattr(routes_mod, "generate_response", lambda c, t, deadline=None: sent.append(t) or "ok")
+    assert app.test_client().post("/classify-llm", json={"text": REPLY}).status_code == 200
+    assert sent == ["Oi Ana,\n\nPor favor, envie o relatório de vendas até sexta às 15h."]
+
+
+def test_classification_compacts_once_per_call(monkeypatch):
+    monkeypatch.setenv("HF_API_TOKEN", "test-token")
+    monkeypatch.setenv("HF_MODEL", "google/flan-t5-large")
+    monkeypatch.setenv("AI_DBG", "0")
+    monkeypatch.setattr(client_mod, "_llm_cache", None)
+    monkeypatch.setattr(client_mod, "_llm_cache_configured", True)
+    monkeypatch.setattr(health, "_tracker", None)
+    compacted, payloads = [], []
+    monkeypatch.setattr(client_mod, "compact_prompt", lambda text: compacted.append(text) or compact_prompt(text))
+    # the first candidate answers something unusable, so a second one is tried
+    answers = iter(["hmm", "Produtivo"])
+    monkeypatch.setattr(AIClient, "_hf_classify_call", lambda self, payload, *args: payloads.append(payload) or next(answers))
+    assert AIClient().classify_email(REPLY) == "Produtivo"
+    assert compacted == [REPLY] and len(payloads) == 2
+    assert all("escreveu" not in p["inputs"] and "iPhone" not in p["inputs"] for p in payloads)
+
+
+def test_request_lines_are_never_dropped_as_footers():
+    unsubscribe = "Olá,\nPor favor quero me descadastrar da lista de cobrança, parem de me enviar boletos.\nObrigado"
+    assert strip_boilerplate(unsubscribe) == unsubscribe
+    assert compact_prompt("Bom dia\nPreciso cancelar a inscrição no curso até sexta.") == (
+        "Bom dia\nPreciso cancelar a inscrição no curso até sexta.")
+    newsletter = "Novidades da semana: o relatório saiu.\nPara se descadastrar, clique aqui.\nEmpresa X Ltda"
+    assert strip_boilerplate(newsletter) == "Novidades da semana: o relatório saiu.\nEmpresa X Ltda"
@@ -0,0 +1,54 @@
+import app.nlp.classifier as classifier
+from app.utils.cache import SQLiteCache, TTLCache, make_cache
+
+
+def test_ttl_cache_evicts_lru_and_expired(monkeypatch):
+    cache = TTLCache(maxsize=2, ttl=10.0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    clock = [1000.0]
+    monkeypatch.setattr("app.utils.cache.time.monotonic", lambda: clock[0])
+    cache.set("d", 4)
+    clock[0] += 11
+    assert cache.get("d") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    SQLiteCache(path).set("k", {"decision": "Produtivo"})
+    other = SQLiteCache(path)
+    assert other.get("k") == {"decision": "Produtivo"}
+    assert other.get("missing") is None
+    assert other.stats()["hits"] == 1 and other.stats()["misses"] == 1
+
+
+def test_result_cache_hits_and_invalidates_on_rule_change(monkeypatch, tmp_path):
+    monkeypatch.setattr(classifier, "_result_cache", make_cache(16, 60, str(tmp_path / "results.sqlite")))
+    monkeypatch.setattr(classifier, "_result_cache_configured", True)
+    text = "Por favor, envie o relatório até amanhã."
+    first = classifier.classify_text_result(text)
+    calls = []
+    monkeypatch.setattr(classifier, "_score_text", lambda doc: calls.append(doc) or (0, 0, {}))
+    assert classifier.classify_text_result(text) == first
+    assert calls == []
+    assert classifier.result_cache_stats()["hits"] >= 1
+
+    # changing a rule set changes the version in the key -> recomputed
+    monkeypatch.setattr(classifier, "ACTION_VERBS", classifier.ACTION_VERBS | {"batata"})
+    classifier.classify_text_result(text)
+    assert len(calls) == 1
+
+
+def test_html_result_cache_is_not_shared_with_callers(monkeypatch):
+    monkeypatch.setattr(classifier, "_result_cache", TTLCache(16, 60))
+    monkeypatch.setattr(classifier, "_result_cache_configured", True)
+    text = "Por favor, envie o relatório até amanhã."
+    decision, html, details = classifier.classify_text_html(text)
+    expected = dict(details)
+    details.clear()
+    details["spam"] = 99
+    assert classifier.classify_text_html(text) == (decision, html, expected)
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+import app.nlp.classifier as classifier
+import app.nlp.rules as rules_mod
+from app.nlp.document import AnalyzedDocument
+from app.nlp.rules import RulePackError, load_compiled
+
+SAMPLES = [
+    "Por favor, envie o relatório até amanhã às 15h.",
+    "Feliz aniversário! Tudo de bom.",
+    "Ler mais\nVoto positivo\nComentar\nLer mais",
+    "Hi, can you update the status of the ticket?",
+    "urgente",
+]
+
+
+@pytest.fixture(autouse=True)
+def _builtin_rules_after_test(monkeypatch):
+    # restore whatever rule store was active before the test
+    monkeypatch.setattr(classifier, "_rule_store", classifier._rule_store)
+    monkeypatch.setattr(classifier, "_rule_store_configured", classifier._rule_store_configured)
+
+
+def _write(path, data):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    # make sure the change is visible to the stat-based reload check
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def test_exported_builtin_pack_behaves_like_builtin_rules(tmp_path):
+    expected = [classifier.classify_text_result(t) for t in SAMPLES]
+    builtin = classifier._get_rules().fingerprint
+    pack = tmp_path / "rules.json"
+    _write(pack, classifier.builtin_rule_pack().to_dict())
+    compiled = classifier.configure_rules(str(pack))
+    assert compiled.fingerprint == builtin
+    assert [classifier.classify_text_result(t) for t in SAMPLES] == expected
+
+
+def test_pack_weights_change_scores(tmp_path):
+    pack = tmp_path / "rules.json"
+    _write(pack, {"productive_keywords": {"urgente": 5}, "weights": {"short_message": 0}})
+    classifier.configure_rules(str(pack))
+    prod, imp, details = classifier._score_text("urgente")
+    assert (prod, imp) == (5, 0)
+    assert details == {"work_context": 5}
+    assert classifier.classify_batch(["urgente"])[0].prod_score == 5
+
+
+def test_pack_is_hot_reloaded_and_bad_pack_keeps_previous_rules(tmp_path):
+    pack = tmp_path / "rules.json"
+    _write(pack, {"productive_keywords": ["batata"]})
+    classifier.configure_rules(str(pack), check_interval=0)
+    before = classifier._get_rules()
+    doc = AnalyzedDocument("batata frita")
+    pinned = classifier._rules_for(doc)
+
+    _write(pack, {"productive_keywords": {"batata": 3}})
+    after = classifier._get_rules()
+    assert after is not before
+    assert classifier._score_text("batata frita")[2]["work_context"] == 3
+    # a document already being classified keeps the pack it started with
+    assert classifier._rules_for(doc) is pinned
+
+    _write(pack, {"productive_keywords": {"batata": -1}})
+    assert classifier._get_rules() is after
+    assert classifier._rule_store.errors == 1
+
+
+def test_invalid_pack_is_rejected(tmp_path):
+    pack = tmp_path / "rules.json"
+    _write(pack, {"productive_keywords": "urgente"})
+    with pytest.raises(RulePackError):
+        classifier.configure_rules(str(pack))
+    _write(pack, {"date_patterns": ["("]})
+    with pytest.raises(RulePackError):
+        classifier.configure_rules(str(pack))
+
+
+def test_precompiled_rules_are_reused(tmp_path, monkeypatch):
+    pack = tmp_path / "rules.json"
+    _write(pack, {"unproductive_keywords": {"kkk": 2}})
+    first = load_compiled(str(pack), classifier.builtin_rule_pack())
+    assert os.path.exists(str(pack) + ".compiled")
+
+    def no_compile(*args, **kwargs):
+        raise AssertionError("pack should come from the precompiled cache")
+
+    monkeypatch.setattr(rules_mod, "KeywordMatcher", no_compile)
+    again = load_compiled(str(pack), classifier.builtin_rule_pack())
+    assert again.fingerprint == first.fingerprint
+    assert again.matcher.unproductive_words["kkk"] == 2
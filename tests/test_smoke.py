@@ -31,3 +31,29 @@ def test_classify_file_upload_txt(client):
     r = client.post('/classify', content_type='multipart/form-data', data=data)
     # Accept either a rendered HTML result or a JSON error if file handling differs
     assert r.status_code in (200, 400)
+
+
+def test_ready_reports_warm_state(client, monkeypatch):
+    import importlib
+    import app.nlp.classifier as classifier
+    routes_mod = importlib.import_module('app.routes')
+    monkeypatch.setattr(classifier, '_warm', False)
+    started = []
+    monkeypatch.setattr(routes_mod, '_start_background_warm_up', lambda: started.append(1))
+    r = client.get('/_ready')
+    assert r.status_code == 503
+    assert started == [1]
+
+    classifier.warm_up()
+    r = client.get('/_ready')
+    assert r.status_code == 200
+    assert json.loads(r.data)['status'] == 'ready'
+
+
+def test_create_app_warms_up_when_configured(monkeypatch):
+    import app.nlp.classifier as classifier
+    from app.main import create_app
+    monkeypatch.setattr(classifier, '_warm', False)
+    monkeypatch.setattr('app.config.BaseConfig.WARMUP_ON_START', True)
+    create_app()
+    assert classifier.is_warm()